@@ -0,0 +1,160 @@
+# broadcast.py - Массовая рассылка уведомлений через Telegram
+
+"""
+Получатели читаются из Users страницами по ключу (по роли - через
+idx_users_role), настройки страницы - одним запросом
+(get_notification_settings_bulk). Дальше пачкой пишутся строки Notifications:
+- в рабочие часы сообщение сразу ставится в очередь outbox (отправит drain);
+- вне рабочих часов уведомление остается неотправленным и придет сводкой;
+- с выключенными общими уведомлениями - только запись, без сообщения.
+
+После каждой страницы прогресс сохраняется в BroadcastProgress. Рассылку,
+не дошедшую до конца (дедлайн, таймаут функции, сбой записи страницы),
+продолжает таймер jobs.broadcast_resume_handler с последнего сохраненного
+получателя; id строк детерминированы, поэтому повтор страницы ничего не
+дублирует.
+"""
+
+import logging
+import time
+import uuid
+from datetime import datetime
+
+import database as db
+import outbox
+from config import BROADCAST_PAGE_SIZE
+from handlers.utils import escape_markdown, in_work_hours
+
+logger = logging.getLogger(__name__)
+
+# Сколько времени webhook-вызов может потратить на рассылку
+BROADCAST_TIME_BUDGET_SECONDS = 50
+
+# Рассылка без обновлений дольше этого считается прерванной (ее не ведет
+# никакой вызов) и подхватывается таймером
+BROADCAST_STALE_SECONDS = 120
+
+STATS_KEYS = ('recipients', 'queued', 'deferred', 'muted')
+
+
+def broadcast(title, text, role=None, deadline=None):
+    """
+    Поставить уведомление в очередь для всех пользователей или пользователей роли
+
+    Args:
+        title (str): Заголовок уведомления
+        text (str): Текст уведомления (как ввел отправитель)
+        role (str, optional): Роль получателей; None - все пользователи
+        deadline (float, optional): time.monotonic(), после которого новые
+            страницы не читаются
+
+    Returns:
+        dict: recipients, queued, deferred (до рабочих часов), muted;
+        done - False, если остаток получателей дошлет таймер
+    """
+    # Вне webhook-запроса ключа нет - заводим свой, чтобы было что продолжать
+    key = db.operation_key('broadcast', role or '*') or f"broadcast:{uuid.uuid4()}"
+
+    progress = db.get_broadcast_progress(key)
+    if progress is None:
+        progress = {
+            'key': key, 'title': title, 'text': text, 'role': role,
+            'after': "", 'stats': dict.fromkeys(STATS_KEYS, 0), 'done': False
+        }
+        db.save_broadcast_progress(progress)
+    return _run(progress, deadline)
+
+
+def resume_broadcasts(deadline):
+    """
+    Продолжить прерванные рассылки с сохраненного места
+
+    Returns:
+        int: сколько рассылок обработано
+    """
+    resumed = 0
+    for progress in db.get_unfinished_broadcasts(BROADCAST_STALE_SECONDS):
+        if time.monotonic() >= deadline:
+            break
+        logger.info(f"📢 Продолжаем рассылку {progress['key']} после {progress['after'] or 'начала'}")
+        _run(progress, deadline)
+        resumed += 1
+    return resumed
+
+
+def _run(progress, deadline):
+    """Обработать страницы получателей с progress['after'], сохраняя прогресс"""
+    if deadline is None:
+        deadline = time.monotonic() + BROADCAST_TIME_BUDGET_SECONDS
+
+    title, text, role = progress['title'], progress['text'], progress['role']
+    key, stats = progress['key'], progress['stats']
+    body = f"📢 *{escape_markdown(title)}*\n\n{escape_markdown(text)}"
+
+    while not progress['done'] and time.monotonic() < deadline:
+        recipients = db.get_users_page(role, progress['after'], BROADCAST_PAGE_SIZE)
+        if not recipients:
+            progress['done'] = True
+            db.save_broadcast_progress(progress)
+            break
+
+        # Сбой записи: контрольную точку не двигаем, страницу повторит таймер
+        settings = db.get_notification_settings_bulk(recipients)
+        if settings is None or not _queue_page(key, title, body, text, recipients, settings, stats):
+            logger.warning(f"⚠️ Рассылка {key}: страница после {progress['after'] or 'начала'} не записана")
+            break
+
+        stats['recipients'] += len(recipients)
+        progress['after'] = recipients[-1]
+        progress['done'] = len(recipients) < BROADCAST_PAGE_SIZE
+        db.save_broadcast_progress(progress)
+
+    logger.info(
+        f"📢 Рассылка ({role or 'всем'}): получателей {stats['recipients']}, "
+        f"в очереди {stats['queued']}, до рабочих часов {stats['deferred']}, "
+        f"без уведомления {stats['muted']}"
+        f"{'' if progress['done'] else ' - продолжит таймер'}"
+    )
+    return dict(stats, done=progress['done'])
+
+
+def _queue_page(key, title, body, text, recipients, settings, stats):
+    """Записать уведомления страницы и поставить сообщения в очередь.
+
+    Returns:
+        bool: успешность записи (stats меняется только при успехе)
+    """
+    now = datetime.now()
+    groups = {'queued': [], 'deferred': [], 'muted': []}
+    for user_id in recipients:
+        user_settings = settings[user_id]
+        if not user_settings['general_notifications']:
+            group = 'muted'
+        elif in_work_hours(now, user_settings['work_hours_start'], user_settings['work_hours_end']):
+            group = 'queued'
+        else:
+            group = 'deferred'
+        groups[group].append({
+            'id': db.derived_id(key, user_id),
+            'user_id': user_id,
+            'title': title,
+            'message': text,
+            # Отложенные уходят сводкой вместе с прочими общими уведомлениями
+            'type': 'general' if group == 'deferred' else 'broadcast'
+        })
+
+    # id сообщений детерминированы, как и id уведомлений: повтор не дублирует
+    messages = [
+        outbox.message(n['user_id'], body, notification_id=n['id'],
+                       message_id=db.derived_id(key, n['user_id'], 'outbox'))
+        for n in groups['queued']
+    ]
+    written = (
+        db.create_notifications_bulk(groups['queued'] + groups['deferred'])
+        and db.create_notifications_bulk(groups['muted'], sent=True)
+    )
+    if not (written and outbox.enqueue_many(messages)):
+        return False
+    for group, rows in groups.items():
+        stats[group] += len(rows)
+    return True
@@ -54,7 +54,11 @@ TIME_SLOTS = {
     "18:00-21:00": "18:00-21:00"
 }
 
-# Типы задач
+# Через сколько дней прошедшие записи расписания уходят в ScheduleArchive
+SCHEDULE_ARCHIVE_AFTER_DAYS = int(os.environ.get('SCHEDULE_ARCHIVE_AFTER_DAYS', '7'))
+
+# Базовые категории задач и их эмодзи. Полный справочник типов -
+# таблица TaskTypes (task_catalog), эти значения - запасные по умолчанию
 TASK_TYPES = {
     "Обеды": "🍽️",
     "Уборка": "🧹",
@@ -72,5 +76,57 @@ ROLE_EMOJI = {
 TASK_STATUS = {
     "Ожидающее": "⏳",
     "В работе": "🔄",
-    "Выполнено": "✅"
-}
\ No newline at end of file
+    "Выполнено": "✅",
+    "Отменено": "❌"
+}
+
+# Допустимые переходы статусов задач (остальные отклоняются в update_task_status)
+TASK_TRANSITIONS = {
+    "Ожидающее": ("В работе", "Отменено"),
+    "В работе": ("Выполнено", "Отменено"),
+}
+
+# Конечные статусы: задача больше не считается активной
+TASK_FINAL_STATUSES = ("Выполнено", "Отменено")
+
+# Напоминания о заданиях: насколько вперед смотрит таймер (не меньше
+# максимального reminder_minutes_before у пользователей)
+REMINDER_LOOKAHEAD_MINUTES = int(os.environ.get('REMINDER_LOOKAHEAD_MINUTES', '180'))
+
+# Настройки уведомлений по умолчанию (если строки в NotificationSettings нет)
+DEFAULT_REMINDER_MINUTES_BEFORE = 30
+DEFAULT_WORK_HOURS = ('09:00', '18:00')
+
+# Общий лимит сообщений в секунду к Bot API (с запасом до 30/с)
+TELEGRAM_SEND_RATE = int(os.environ.get('TELEGRAM_SEND_RATE', '25'))
+
+# Лимиты Bot API в TelegramAPI: общий - TELEGRAM_SEND_RATE, в один чат -
+# TELEGRAM_PER_CHAT_RATE сообщений в секунду со всплеском до TELEGRAM_PER_CHAT_BURST
+TELEGRAM_PER_CHAT_RATE = 1
+TELEGRAM_PER_CHAT_BURST = 3
+BROADCAST_WORKERS = int(os.environ.get('BROADCAST_WORKERS', '8'))
+BROADCAST_PAGE_SIZE = 500
+
+# Очередь исходящих сообщений: ydb (таблица Outbox) или memory (локальный запуск)
+OUTBOX_BACKEND = os.environ.get('OUTBOX_BACKEND', 'ydb')
+OUTBOX_MAX_ATTEMPTS = 5
+
+# Сводки уведомлений: события одного пользователя копятся столько минут
+# (от первого неотправленного) и уходят одним сообщением в рабочие часы
+NOTIFICATION_DIGEST_WINDOW_MINUTES = int(os.environ.get('NOTIFICATION_DIGEST_WINDOW_MINUTES', '5'))
+
+# Прочитанные уведомления старше стольких дней удаляет таймер очистки
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '30'))
+
+# Изменения расписания пользователя копятся, пока он не перестанет меняться
+# столько минут, и уходят одним уведомлением на день
+SCHEDULE_CHANGE_QUIET_MINUTES = int(os.environ.get('SCHEDULE_CHANGE_QUIET_MINUTES', '3'))
+
+# Длительность задания по умолчанию: конец слота (due_at), если он не задан явно
+DEFAULT_TASK_DURATION_MINUTES = int(os.environ.get('DEFAULT_TASK_DURATION_MINUTES', '60'))
+
+# Насколько назад смотрит поиск просрочек (старые уже обработаны прошлыми запусками)
+OVERDUE_LOOKBACK_HOURS = int(os.environ.get('OVERDUE_LOOKBACK_HOURS', '48'))
+
+# Роли, которым уходит сводка по просроченным заданиям
+ESCALATION_ROLES = ("ДС", "ЗДС")
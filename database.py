@@ -1,12 +1,19 @@
 # database.py - Функции работы с базой данных YDB
 
+import threading
+import time
 import uuid
+from contextvars import ContextVar
 import ydb
 import ydb.iam
 import json
 import logging
-from datetime import datetime
-from config import YDB_ENDPOINT, YDB_DATABASE, ADMINS
+from datetime import datetime, date, timedelta
+from config import (
+    YDB_ENDPOINT, YDB_DATABASE, ADMINS, SCHEDULE_ARCHIVE_AFTER_DAYS,
+    TASK_TRANSITIONS, TASK_FINAL_STATUSES, DEFAULT_TASK_DURATION_MINUTES,
+    DEFAULT_REMINDER_MINUTES_BEFORE, DEFAULT_WORK_HOURS, NOTIFICATION_RETENTION_DAYS
+)
 
 logger = logging.getLogger(__name__)
 
@@ -97,6 +104,229 @@ def safe_decode(value):
         return str_value
 
 
+def ydb_date(value):
+    """Привести значение колонки Date из YDB к datetime.date.
+
+    YDB отдает Date как число дней с 1970-01-01.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, int):
+        return date(1970, 1, 1) + timedelta(days=value)
+    try:
+        return datetime.strptime(safe_decode(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+# Версия расписания в пределах контейнера: увеличивается при каждом
+# изменении, по ней хендлеры сбрасывают закешированные страницы.
+_schedule_version = 0
+
+
+def get_schedule_version():
+    """Текущая версия расписания (для инвалидации кешей)."""
+    return _schedule_version
+
+
+def _bump_schedule_version():
+    global _schedule_version
+    _schedule_version += 1
+
+
+# Предагрегированные счетчики расписания: (тип, дата) и (пользователь,
+# тип, месяц). Фрагмент выполняется в той же транзакции, что и запись
+# в Schedule, и ожидает параметр $counter_rows.
+_SCHEDULE_COUNTERS_DECLARE = """
+    DECLARE $counter_rows AS List<Struct<
+        user_id: Utf8, type: Utf8, date: Date, month: Utf8, delta: Int64>>;
+"""
+_SCHEDULE_COUNTERS_YQL = """
+    $daily_delta = (
+        SELECT type, date, SUM(delta) AS delta
+        FROM AS_TABLE($counter_rows)
+        GROUP BY type, date
+    );
+    UPSERT INTO ScheduleDailyStats
+    SELECT d.type AS type, d.date AS date,
+           COALESCE(s.count, 0) + d.delta AS count
+    FROM $daily_delta AS d
+    LEFT JOIN ScheduleDailyStats AS s ON s.type = d.type AND s.date = d.date;
+
+    $monthly_delta = (
+        SELECT user_id, type, month, SUM(delta) AS delta
+        FROM AS_TABLE($counter_rows)
+        GROUP BY user_id, type, month
+    );
+    UPSERT INTO ScheduleUserMonthStats
+    SELECT m.user_id AS user_id, m.type AS type, m.month AS month,
+           COALESCE(s.count, 0) + m.delta AS count
+    FROM $monthly_delta AS m
+    LEFT JOIN ScheduleUserMonthStats AS s
+        ON s.user_id = m.user_id AND s.type = m.type AND s.month = m.month;
+"""
+
+
+def _schedule_counter_rows(entries, delta):
+    """Строки для $counter_rows из записей расписания (delta: +1 / -1)."""
+    return [
+        {
+            'user_id': str(entry['user_id']),
+            'type': entry['type'],
+            'date': entry['date'],
+            'month': entry['date'].strftime('%Y-%m'),
+            'delta': delta
+        }
+        for entry in entries
+    ]
+
+
+# Журнал изменений расписания для уведомлений (ScheduleChanges): чистая
+# дельта по слоту (пользователь, дата, тип, время) - добавление и удаление
+# одного слота до отправки взаимно гасятся. Выполняется в той же транзакции,
+# что и запись в Schedule, и ожидает параметр $change_rows.
+_SCHEDULE_CHANGES_DECLARE = """
+    DECLARE $change_rows AS List<Struct<
+        user_id: Utf8, date: Date, type: Utf8, start_time: Utf8, end_time: Utf8, delta: Int32>>;
+"""
+_SCHEDULE_CHANGES_YQL = """
+    UPSERT INTO ScheduleChanges
+    SELECT d.user_id AS user_id, d.date AS date, d.type AS type,
+           d.start_time AS start_time, d.end_time AS end_time,
+           CAST(COALESCE(c.delta, 0) + d.delta AS Int32) AS delta,
+           CurrentUtcTimestamp() AS updated_at
+    FROM (
+        SELECT user_id, date, type, start_time, end_time, SUM(delta) AS delta
+        FROM AS_TABLE($change_rows)
+        GROUP BY user_id, date, type, start_time, end_time
+    ) AS d
+    LEFT JOIN ScheduleChanges AS c
+        ON c.user_id = d.user_id AND c.date = d.date AND c.type = d.type
+       AND c.start_time = d.start_time AND c.end_time = d.end_time;
+"""
+
+
+def _schedule_change_rows(entries, delta):
+    """Строки для $change_rows из записей расписания (delta: +1 / -1)."""
+    return [
+        {
+            'user_id': str(entry['user_id']),
+            'date': entry['date'],
+            'type': entry['type'],
+            'start_time': entry['start_time'],
+            'end_time': entry['end_time'],
+            'delta': delta
+        }
+        for entry in entries
+    ]
+
+
+# Счетчик активных заданий исполнителей (Users.active_tasks_count).
+# Выполняется в той же транзакции, что и запись в Tasks, и ожидает
+# параметр $assignee_rows.
+_ASSIGNEE_COUNTERS_DECLARE = """
+    DECLARE $assignee_rows AS List<Struct<user_id: Utf8, delta: Int32>>;
+"""
+_ASSIGNEE_COUNTERS_YQL = """
+    UPDATE Users ON
+    SELECT u.telegram_id AS telegram_id,
+           CAST(COALESCE(u.active_tasks_count, 0) + d.delta AS Int32) AS active_tasks_count
+    FROM (
+        SELECT user_id, SUM(delta) AS delta
+        FROM AS_TABLE($assignee_rows)
+        GROUP BY user_id
+    ) AS d
+    JOIN Users AS u ON u.telegram_id = d.user_id;
+"""
+
+
+def default_due_at(when_value, minutes=DEFAULT_TASK_DURATION_MINUTES):
+    """Конец слота задания: when_ + длительность (None, если when_ не разобрать)."""
+    try:
+        start = datetime.strptime(str(when_value)[:16], '%Y-%m-%d %H:%M')
+    except ValueError:
+        return None
+    return (start + timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _assignee_counter_rows(user_ids, delta=1):
+    """Строки для $assignee_rows: по одной на каждое созданное задание."""
+    return [{'user_id': str(user_id), 'delta': delta} for user_id in user_ids]
+
+
+# Ключ идемпотентности текущего update'а Telegram (u<update_id> / cb<query_id>).
+# Выставляется в index.handler; повторная доставка того же update'а дает
+# те же ключи операций, и запись превращается в no-op.
+_request_key = ContextVar('request_key', default=None)
+_IDEMPOTENCY_NAMESPACE = uuid.UUID('6f1c7d52-3f0e-4a51-9c57-0a8b8e2d4b17')
+
+_IDEMPOTENCY_CHECK_QUERY = """
+    DECLARE $idem_key AS Utf8;
+    SELECT result FROM IdempotencyKeys WHERE key = $idem_key;
+"""
+_IDEMPOTENCY_DECLARE = """
+    DECLARE $idem_key AS Utf8;
+    DECLARE $idem_result AS Utf8;
+"""
+_IDEMPOTENCY_STORE_YQL = """
+    UPSERT INTO IdempotencyKeys (key, result, created_at)
+    VALUES ($idem_key, $idem_result, CurrentUtcTimestamp());
+"""
+
+
+def set_request_key(key):
+    """Выставить ключ идемпотентности для текущего update'а (None - сбросить)."""
+    _request_key.set(key)
+
+
+def operation_key(operation, *parts):
+    """Ключ операции внутри текущего update'а (None вне webhook-запроса)."""
+    request_key = _request_key.get()
+    if not request_key:
+        return None
+    return ":".join([request_key, operation] + [str(part) for part in parts])
+
+
+def derived_id(key, *parts):
+    """Детерминированный id из ключа операции (uuid4, если ключа нет)."""
+    if not key:
+        return str(uuid.uuid4())
+    return str(uuid.uuid5(_IDEMPOTENCY_NAMESPACE, ":".join([key] + [str(p) for p in parts])))
+
+
+def _execute_idempotent(session, key, query_text, params, result):
+    """Выполнить запись, если ключ еще не встречался; ключ пишется той же транзакцией.
+    
+    Returns:
+        tuple: (result, created) - при повторе возвращается сохраненный
+        результат первого выполнения и created=False
+    """
+    if not key:
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            session.prepare(query_text), params, commit_tx=True
+        )
+        return result, True
+    
+    tx = session.transaction(ydb.SerializableReadWrite()).begin()
+    found = tx.execute(session.prepare(_IDEMPOTENCY_CHECK_QUERY), {'$idem_key': key})
+    if found[0].rows:
+        tx.rollback()
+        return safe_decode(found[0].rows[0].result), False
+    
+    params = dict(params)
+    params.update({'$idem_key': key, '$idem_result': str(result)})
+    tx.execute(
+        session.prepare(_IDEMPOTENCY_DECLARE + query_text + _IDEMPOTENCY_STORE_YQL),
+        params,
+        commit_tx=True
+    )
+    return result, True
+
+
 def is_admin(user_id):
     """Проверить, является ли пользователь администратором."""
     return user_id in ADMINS
@@ -198,19 +428,85 @@ def get_all_users():
         return []
 
 
-def get_my_tasks(user_id):
-    """Получить задачи пользователя."""
+# Статусы, которые видны работнику в "Моих заданиях"
+VISIBLE_TASK_STATUSES = ["Ожидающее", "В работе", "Выполнено"]
+
+# Количество заданий по статусам: диапазон по префиксу idx_tasks_status_when
+_TASKS_BY_STATUS_QUERY = """
+    DECLARE $statuses AS List<Utf8>;
+    SELECT status, COUNT(*) as count
+    FROM Tasks VIEW idx_tasks_status_when
+    WHERE status IN $statuses
+    GROUP BY status
+"""
+
+
+def _keyset_page(sort_column, descending, after=None, before=None):
+    """
+    Части запроса для keyset-пагинации по (sort_column, id).
+
+    after — id задания, после которого начинается страница (листаем вперед),
+    before — id задания, перед которым она заканчивается (листаем назад).
+    Возвращает (DECLARE курсора, условие WHERE, ORDER BY, параметры).
+    При чтении назад порядок обратный — строки нужно развернуть.
+    """
+    backward = before is not None
+    cursor_id = before if backward else after
+    desc = descending != backward
+    direction = "DESC" if desc else "ASC"
+    order = f"{sort_column} {direction}, id {direction}"
+    if cursor_id is None:
+        return "", "", order, {}
+    op = "<" if desc else ">"
+    prelude = f"""
+        DECLARE $cursor_id AS Utf8;
+        $cursor_key = (SELECT {sort_column} FROM Tasks WHERE id = $cursor_id);
+    """
+    condition = (
+        f" AND ({sort_column} {op} $cursor_key"
+        f" OR ({sort_column} = $cursor_key AND id {op} $cursor_id))"
+    )
+    return prelude, condition, order, {'$cursor_id': str(cursor_id)}
+
+
+def get_my_tasks(user_id, limit=10, after=None, before=None):
+    """
+    Получить задачи пользователя (страница, новые сверху).
+
+    Каждый статус читается отдельным диапазоном idx_tasks_assigned_status_when
+    от курсора, страницы сливаются по (when_, id).
+    """
     def execute(session):
         try:
-            query = """
-                SELECT id, type, when_, status, description, rating, time_spent
-                FROM Tasks 
-                WHERE assigned_to = "{}" AND status != "Отменено"
-                ORDER BY when_ DESC
-                LIMIT 10
-            """.format(str(user_id))
-            
-            result = session.transaction().execute(query, commit_tx=True)
+            prelude, cursor, order, params = _keyset_page('when_', True, after, before)
+            reads = "".join(f"""
+                $status_{i} = (
+                    SELECT id, type, when_, status, description, rating, time_spent
+                    FROM Tasks VIEW idx_tasks_assigned_status_when
+                    WHERE assigned_to = $user_id AND status = "{status}"{cursor}
+                    ORDER BY {order}
+                    LIMIT $limit
+                );"""
+                for i, status in enumerate(VISIBLE_TASK_STATUSES)
+            )
+            union = " UNION ALL ".join(
+                f"SELECT * FROM $status_{i}" for i in range(len(VISIBLE_TASK_STATUSES))
+            )
+            query_text = f"""
+                DECLARE $user_id AS Utf8;
+                DECLARE $limit AS Uint64;
+                {prelude}
+                {reads}
+                $page = ({union});
+                SELECT * FROM $page
+                ORDER BY {order}
+                LIMIT $limit;
+            """
+            params.update({'$user_id': str(user_id), '$limit': limit})
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query, params, commit_tx=True
+            )
             
             tasks = []
             for row in result[0].rows:
@@ -223,6 +519,8 @@ def get_my_tasks(user_id):
                     'rating': row.rating,
                     'time_spent': row.time_spent
                 })
+            if before is not None:
+                tasks.reverse()
             return tasks
         except Exception as e:
             print(f"Ошибка получения заданий: {e}")
@@ -383,80 +681,452 @@ def get_all_schedule_items():
         return []
     
  
-def create_schedule_task(user_id, task_type, date, time_slot, shelves=None):
-    """Создать задачу в расписании."""
+def get_schedule_window(schedule_type, date_from, date_to):
+    """Получить активные записи одного типа за интервал дат (включительно).
+
+    Читает только видимое окно через индекс idx_schedule_type_date.
+    Окна, захватывающие уже архивированные даты, дочитываются из
+    ScheduleArchive.
+    """
+    archive_cutoff = datetime.now().date() - timedelta(days=SCHEDULE_ARCHIVE_AFTER_DAYS)
+    source = "Schedule VIEW idx_schedule_type_date"
+    if date_from < archive_cutoff:
+        source = """(
+                    SELECT id, user_id, date, type, start_time, end_time, status
+                    FROM Schedule VIEW idx_schedule_type_date
+                    WHERE type = $type AND date BETWEEN $date_from AND $date_to
+                    UNION ALL
+                    SELECT id, user_id, date, type, start_time, end_time, status
+                    FROM ScheduleArchive VIEW idx_schedule_archive_type_date
+                    WHERE type = $type AND date BETWEEN $date_from AND $date_to
+                )"""
+
     def execute(session):
         try:
-            task_id = str(uuid.uuid4())
-            
-            # Формируем описание
-            description = f"{task_type}"
-            if shelves:
-                description += f" - {shelves}"
-            
-            # Парсим время
-            if time_slot == "В течение дня":
-                start_time = "00:00"
-                end_time = "23:59"
-            else:
-                start_time, end_time = time_slot.split('-')
-            
-            # Вставляем в Tasks
-            task_query = """
-                UPSERT INTO Tasks
-                (id, type, when_, status, description, assigned_to, created_by, created_at)
-                VALUES ("{}", "{}", "{}", "{}", "{}", "{}", "{}", Timestamp("{}"))
-            """.format(
-                task_id, task_type, f"{date} {start_time}:00", "Ожидающее",
-                description, str(user_id), str(user_id), get_ydb_timestamp()
+            query_text = f"""
+                DECLARE $type AS Utf8;
+                DECLARE $date_from AS Date;
+                DECLARE $date_to AS Date;
+                SELECT s.id AS id, s.user_id AS user_id, s.date AS date,
+                       s.start_time AS start_time, s.end_time AS end_time,
+                       u.username AS username
+                FROM {source} AS s
+                LEFT JOIN Users AS u ON s.user_id = u.telegram_id
+                WHERE s.type = $type
+                  AND s.date BETWEEN $date_from AND $date_to
+                  AND s.status = "Активно"
+                ORDER BY date, start_time;
+            """
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query,
+                {
+                    '$type': schedule_type,
+                    '$date_from': date_from,
+                    '$date_to': date_to
+                },
+                commit_tx=True
             )
-            
-            session.transaction().execute(task_query, commit_tx=True)
-            
-            # Вставляем в Schedule с правильной конверсией даты
-            schedule_id = str(uuid.uuid4())
-            
-            # Проверяем формат даты
-            if isinstance(date, str):
-                if len(date) == 10 and date.count('-') == 2:
-                    # Уже в формате YYYY-MM-DD
-                    date_str = date
-                else:
-                    # Пытаемся распарсить
-                    from datetime import datetime
-                    try:
-                        date_obj = datetime.strptime(date, '%Y-%m-%d')
-                        date_str = date_obj.strftime('%Y-%m-%d')
-                    except:
-                        date_str = date
-            else:
-                date_str = str(date)
-            
-            schedule_query = """
-                UPSERT INTO Schedule
-                (id, user_id, date, type, start_time, end_time, status, created_by, created_at)
-                VALUES ("{}", "{}", Date("{}"), "{}", "{}", "{}", "{}", "{}", Timestamp("{}"))
-            """.format(
-                schedule_id, str(user_id), date_str, task_type, start_time, end_time,
-                "Активно", str(user_id), get_ydb_timestamp()
+
+            schedule = []
+            for row in result[0].rows:
+                schedule.append({
+                    'id': safe_decode(row.id),
+                    'user_id': safe_decode(row.user_id),
+                    'date': ydb_date(row.date),
+                    'start_time': safe_decode(row.start_time),
+                    'end_time': safe_decode(row.end_time),
+                    'username': safe_decode(row.username)
+                })
+            return schedule
+        except Exception as e:
+            print(f"Ошибка получения окна расписания: {e}")
+            return []
+
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка получения окна расписания: {e}")
+        return []
+
+
+def get_user_upcoming_schedule(user_id, limit=20):
+    """Получить ближайшие активные записи пользователя всех типов.
+
+    Диапазонное чтение idx_schedule_user_date с сегодняшнего дня,
+    без сканирования таблицы.
+    """
+    def execute(session):
+        try:
+            query_text = """
+                DECLARE $user_id AS Utf8;
+                DECLARE $date_from AS Date;
+                DECLARE $limit AS Uint64;
+                SELECT id, date, type, start_time, end_time
+                FROM Schedule VIEW idx_schedule_user_date
+                WHERE user_id = $user_id
+                  AND date >= $date_from
+                  AND status = "Активно"
+                ORDER BY date, start_time
+                LIMIT $limit;
+            """
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query,
+                {
+                    '$user_id': str(user_id),
+                    '$date_from': datetime.now().date(),
+                    '$limit': limit
+                },
+                commit_tx=True
             )
-            
-            session.transaction().execute(schedule_query, commit_tx=True)
-            
-            return True, task_id
+
+            schedule = []
+            for row in result[0].rows:
+                schedule.append({
+                    'id': safe_decode(row.id),
+                    'date': ydb_date(row.date),
+                    'type': safe_decode(row.type),
+                    'start_time': safe_decode(row.start_time),
+                    'end_time': safe_decode(row.end_time)
+                })
+            return schedule
         except Exception as e:
-            print(f"Ошибка создания задачи: {e}")
-            import traceback
-            traceback.print_exc()
-            return False, str(e)
-    
+            print(f"Ошибка получения расписания пользователя: {e}")
+            return []
+
     try:
         return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка получения расписания пользователя: {e}")
+        return []
+
+
+# Тип заданий, у которых детали расписания - это стеллажи (Tasks.shelves)
+RECOUNT_TASK_TYPE = "Пересчеты"
+
+
+def _schedule_task_details(task_type, details):
+    """Описание и стеллажи задания расписания.
+
+    Детали пересчета пишутся в shelves, детали остальных типов остаются
+    в описании.
+    """
+    if task_type == RECOUNT_TASK_TYPE:
+        return task_type, details or None
+    return (f"{task_type} - {details}" if details else task_type), None
+
+
+def _normalize_time(value):
+    """'9:00' -> '09:00': when_ и due_at сравниваются как строки"""
+    hours, minutes = value.strip().split(':')
+    return f"{int(hours):02d}:{minutes}"
+
+
+def create_schedule_task(user_id, task_type, date, time_slot, details=None):
+    """Создать задачу в расписании (задание, запись расписания и счетчики - одной транзакцией)."""
+    description, shelves = _schedule_task_details(task_type, details)
+    
+    try:
+        # Парсим время
+        if time_slot == "В течение дня":
+            start_time = "00:00"
+            end_time = "23:59"
+        else:
+            start_time, end_time = (_normalize_time(part) for part in time_slot.split('-'))
+        schedule_date = date if hasattr(date, 'strftime') else datetime.strptime(str(date), '%Y-%m-%d').date()
+    except ValueError as e:
+        print(f"Ошибка создания задачи: {e}")
+        return False, str(e)
+    date_str = schedule_date.strftime('%Y-%m-%d')
+    
+    key = operation_key('schedule', user_id, date_str, time_slot, task_type)
+    task_id = derived_id(key, 'task')
+    schedule_id = derived_id(key, 'schedule')
+    
+    query_text = _SCHEDULE_COUNTERS_DECLARE + _ASSIGNEE_COUNTERS_DECLARE + _SCHEDULE_CHANGES_DECLARE + """
+        DECLARE $task_id AS Utf8;
+        DECLARE $schedule_id AS Utf8;
+        DECLARE $user_id AS Utf8;
+        DECLARE $type AS Utf8;
+        DECLARE $date AS Date;
+        DECLARE $start_time AS Utf8;
+        DECLARE $end_time AS Utf8;
+        DECLARE $when AS Utf8;
+        DECLARE $due_at AS Utf8;
+        DECLARE $description AS Utf8;
+        DECLARE $shelves AS Optional<Utf8>;
+        
+        UPSERT INTO Tasks
+        (id, type, when_, due_at, status, description, assigned_to, created_by, created_at, shelves)
+        VALUES ($task_id, $type, $when, $due_at, "Ожидающее", $description,
+                $user_id, $user_id, CurrentUtcTimestamp(), $shelves);
+        
+        UPSERT INTO Schedule
+        (id, user_id, date, type, start_time, end_time, status, created_by, created_at)
+        VALUES ($schedule_id, $user_id, $date, $type, $start_time, $end_time,
+                "Активно", $user_id, CurrentUtcTimestamp());
+    """ + _SCHEDULE_COUNTERS_YQL + _ASSIGNEE_COUNTERS_YQL + _SCHEDULE_CHANGES_YQL
+    
+    params = {
+        '$task_id': task_id,
+        '$schedule_id': schedule_id,
+        '$user_id': str(user_id),
+        '$type': task_type,
+        '$date': schedule_date,
+        '$start_time': start_time,
+        '$end_time': end_time,
+        '$when': f"{date_str} {start_time}:00",
+        '$due_at': f"{date_str} {end_time}:00",
+        '$description': description,
+        '$shelves': shelves,
+        '$counter_rows': _schedule_counter_rows(
+            [{'user_id': user_id, 'type': task_type, 'date': schedule_date}], 1
+        ),
+        '$assignee_rows': _assignee_counter_rows([user_id]),
+        '$change_rows': _schedule_change_rows([{
+            'user_id': user_id, 'date': schedule_date, 'type': task_type,
+            'start_time': start_time, 'end_time': end_time
+        }], 1)
+    }
+    
+    def execute(session):
+        return _execute_idempotent(session, key, query_text, params, task_id)
+    
+    try:
+        # Повтор тоже сбрасывает кэш: первая попытка могла записать
+        # расписание в другом экземпляре функции
+        result_id, _ = pool.retry_operation_sync(execute)
+        _bump_schedule_version()
+        return True, result_id
     except Exception as e:
         print(f"Ошибка создания задачи: {e}")
+        import traceback
+        traceback.print_exc()
         return False, str(e)
 
 
+def resolve_users(usernames=(), telegram_ids=()):
+    """Найти пользователей по списку username и/или telegram_id одним запросом.
+
+    username сравнивается без учета регистра (@Ivan найдет ivan).
+
+    Returns:
+        dict: {username в нижнем регистре и telegram_id: (telegram_id, username)}
+    """
+    def execute(session):
+        try:
+            query_text = """
+                DECLARE $usernames AS List<Utf8>;
+                DECLARE $ids AS List<Utf8>;
+                SELECT telegram_id, username
+                FROM Users
+                WHERE Unicode::ToLower(CAST(username AS Utf8)) IN $usernames
+                   OR telegram_id IN $ids;
+            """
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query,
+                {
+                    '$usernames': list({name.lower() for name in usernames}),
+                    '$ids': [str(i) for i in telegram_ids]
+                },
+                commit_tx=True
+            )
+
+            users = {}
+            for row in result[0].rows:
+                telegram_id = safe_decode(row.telegram_id)
+                username = safe_decode(row.username)
+                users[username.lower()] = (telegram_id, username)
+                users[telegram_id] = (telegram_id, username)
+            return users
+        except Exception as e:
+            print(f"Ошибка поиска пользователей: {e}")
+            return {}
+
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка поиска пользователей: {e}")
+        return {}
+
+
+def get_users_schedule_range(user_ids, date_from, date_to, page_size=1000):
+    """Получить активные записи нескольких пользователей за интервал дат.
+
+    Читает idx_schedule_user_date страницами (YDB ограничивает размер
+    результата), продолжая с последнего ключа.
+    """
+    def execute(session):
+        try:
+            query_text = """
+                DECLARE $user_ids AS List<Utf8>;
+                DECLARE $date_from AS Date;
+                DECLARE $date_to AS Date;
+                DECLARE $last_user AS Utf8;
+                DECLARE $last_date AS Date;
+                DECLARE $last_id AS Utf8;
+                DECLARE $limit AS Uint64;
+                SELECT id, user_id, date, type, start_time, end_time
+                FROM Schedule VIEW idx_schedule_user_date
+                WHERE user_id IN $user_ids
+                  AND date BETWEEN $date_from AND $date_to
+                  AND status = "Активно"
+                  AND (user_id, date, id) > ($last_user, $last_date, $last_id)
+                ORDER BY user_id, date, id
+                LIMIT $limit;
+            """
+            prepared_query = session.prepare(query_text)
+
+            schedule = []
+            last_key = ("", date(1970, 1, 1), "")
+            while True:
+                result = session.transaction(ydb.OnlineReadOnly()).execute(
+                    prepared_query,
+                    {
+                        '$user_ids': [str(u) for u in user_ids],
+                        '$date_from': date_from,
+                        '$date_to': date_to,
+                        '$last_user': last_key[0],
+                        '$last_date': last_key[1],
+                        '$last_id': last_key[2],
+                        '$limit': page_size
+                    },
+                    commit_tx=True
+                )
+                rows = result[0].rows
+                for row in rows:
+                    schedule.append({
+                        'id': safe_decode(row.id),
+                        'user_id': safe_decode(row.user_id),
+                        'date': ydb_date(row.date),
+                        'type': safe_decode(row.type),
+                        'start_time': safe_decode(row.start_time),
+                        'end_time': safe_decode(row.end_time)
+                    })
+                if len(rows) < page_size:
+                    return schedule
+                last = schedule[-1]
+                last_key = (last['user_id'], last['date'], last['id'])
+        except Exception as e:
+            print(f"Ошибка получения расписания пользователей: {e}")
+            return []
+
+    if not user_ids:
+        return []
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка получения расписания пользователей: {e}")
+        return []
+
+
+def bulk_create_schedule(entries, created_by, batch_size=500):
+    """Массово создать записи расписания (и связанные задания).
+
+    Каждая пачка пишется одним UPSERT из списка-параметра в одной
+    транзакции. Идентификаторы генерируются до выполнения запроса,
+    поэтому повтор пачки при ретрае не создает дублей.
+
+    Args:
+        entries (list): dict с ключами user_id, date (datetime.date), type,
+            start_time, end_time, details
+        created_by: telegram_id администратора
+
+    Returns:
+        int: количество записанных строк
+    """
+    query_text = _SCHEDULE_COUNTERS_DECLARE + _ASSIGNEE_COUNTERS_DECLARE + _SCHEDULE_CHANGES_DECLARE + """
+        DECLARE $rows AS List<Struct<
+            id: Utf8, task_id: Utf8, user_id: Utf8, date: Date, type: Utf8,
+            start_time: Utf8, end_time: Utf8, when_: Utf8, due_at: Utf8,
+            description: Utf8, shelves: Optional<Utf8>>>;
+        DECLARE $created_by AS Utf8;
+
+        UPSERT INTO Schedule
+        SELECT id, user_id, date, type, start_time, end_time,
+               "Активно" AS status, $created_by AS created_by,
+               CurrentUtcTimestamp() AS created_at
+        FROM AS_TABLE($rows);
+
+        UPSERT INTO Tasks
+        SELECT task_id AS id, type, when_, due_at, "Ожидающее" AS status, description,
+               user_id AS assigned_to, $created_by AS created_by,
+               CurrentUtcTimestamp() AS created_at, shelves
+        FROM AS_TABLE($rows);
+    """ + _SCHEDULE_COUNTERS_YQL + _ASSIGNEE_COUNTERS_YQL + _SCHEDULE_CHANGES_YQL
+
+    written = 0
+    for start in range(0, len(entries), batch_size):
+        key = operation_key('schedule_bulk', start)
+        rows = []
+        for i, entry in enumerate(entries[start:start + batch_size]):
+            description, shelves = _schedule_task_details(entry['type'], entry.get('details'))
+            rows.append({
+                'id': derived_id(key, i, 'schedule'),
+                'task_id': derived_id(key, i, 'task'),
+                'user_id': str(entry['user_id']),
+                'date': entry['date'],
+                'type': entry['type'],
+                'start_time': entry['start_time'],
+                'end_time': entry['end_time'],
+                'when_': f"{entry['date'].strftime('%Y-%m-%d')} {entry['start_time']}:00",
+                'due_at': f"{entry['date'].strftime('%Y-%m-%d')} {entry['end_time']}:00",
+                'description': description,
+                'shelves': shelves
+            })
+
+        counter_rows = _schedule_counter_rows(entries[start:start + batch_size], 1)
+
+        def execute(session):
+            return _execute_idempotent(
+                session, key, query_text,
+                {
+                    '$rows': rows,
+                    '$created_by': str(created_by),
+                    '$counter_rows': counter_rows,
+                    '$assignee_rows': _assignee_counter_rows(row['user_id'] for row in rows),
+                    '$change_rows': _schedule_change_rows(rows, 1)
+                },
+                len(rows)
+            )
+
+        try:
+            # Повтор уже записанной пачки (created=False) - тоже успех:
+            # строки в базе, сбоем считается только исключение
+            pool.retry_operation_sync(execute)
+            written += len(rows)
+        except Exception as e:
+            print(f"Ошибка массовой записи расписания: {e}")
+            break
+
+    if written:
+        _bump_schedule_version()
+    return written
+
+
+def iter_schedule_table():
+    """Потоково прочитать всю таблицу Schedule (ReadTable, без лимита строк).
+
+    Yields:
+        dict: запись расписания
+    """
+    columns = ('id', 'user_id', 'date', 'type', 'start_time', 'end_time', 'status')
+    with pool.checkout() as session:
+        for result_set in session.read_table(f"{YDB_DATABASE}/Schedule", columns=columns):
+            for row in result_set.rows:
+                yield {
+                    'id': safe_decode(row.id),
+                    'user_id': safe_decode(row.user_id),
+                    'date': ydb_date(row.date),
+                    'type': safe_decode(row.type),
+                    'start_time': safe_decode(row.start_time),
+                    'end_time': safe_decode(row.end_time),
+                    'status': safe_decode(row.status)
+                }
+
+
 def change_user_role(username, new_role):
     """Изменить роль пользователя."""
     def execute(session):
@@ -546,13 +1216,10 @@ def get_system_stats():
             """
             users_result = session.transaction().execute(users_query, commit_tx=True)
             
-            tasks_query = """
-                SELECT status, COUNT(*) as count
-                FROM Tasks 
-                WHERE status != "Отменено"
-                GROUP BY status
-            """
-            tasks_result = session.transaction().execute(tasks_query, commit_tx=True)
+            tasks_query = session.prepare(_TASKS_BY_STATUS_QUERY)
+            tasks_result = session.transaction(ydb.OnlineReadOnly()).execute(
+                tasks_query, {'$statuses': VISIBLE_TASK_STATUSES}, commit_tx=True
+            )
             
             return {
                 'users': {safe_decode(row['role']): row.count for row in users_result[0].rows},
@@ -570,30 +1237,47 @@ def get_system_stats():
         return None
 
 
-def get_pending_tasks(user_id=None):
+def get_pending_tasks(user_id=None, limit=20, after=None, before=None):
     """Получить ожидающие задачи (все или конкретного пользователя)."""
     def execute(session):
         try:
+            prelude, cursor, order, params = _keyset_page('when_', False, after, before)
             if user_id:
-                query = """
-                    SELECT t.id, t.type, t.when_, t.description, t.assigned_to,
-                           u.username, t.created_at
-                    FROM Tasks t
-                    JOIN Users u ON t.assigned_to = u.telegram_id
-                    WHERE t.assigned_to = "{}" AND t.status = "Ожидающее"
-                    ORDER BY t.when_ ASC
-                """.format(str(user_id))
+                source = """
+                    FROM Tasks VIEW idx_tasks_assigned_status_when
+                    WHERE assigned_to = $user_id AND status = "Ожидающее"
+                """
+                declare = "DECLARE $user_id AS Utf8;"
+                params['$user_id'] = str(user_id)
             else:
-                query = """
-                    SELECT t.id, t.type, t.when_, t.description, t.assigned_to,
-                           u.username, t.created_at
-                    FROM Tasks t
-                    JOIN Users u ON t.assigned_to = u.telegram_id
-                    WHERE t.status = "Ожидающее"
-                    ORDER BY t.when_ ASC
+                source = """
+                    FROM Tasks VIEW idx_tasks_status_when
+                    WHERE status = "Ожидающее"
                 """
+                declare = ""
+            query_text = f"""
+                {declare}
+                DECLARE $limit AS Uint64;
+                {prelude}
+                $page = (
+                    SELECT id, type, when_, description, assigned_to
+                    {source}{cursor}
+                    ORDER BY {order}
+                    LIMIT $limit
+                );
+                SELECT t.id AS id, t.type AS type, t.when_ AS when_,
+                       t.description AS description, t.assigned_to AS assigned_to,
+                       u.username AS username
+                FROM $page AS t
+                LEFT JOIN Users AS u ON t.assigned_to = u.telegram_id
+                ORDER BY {order};
+            """
+            params['$limit'] = limit
             
-            result = session.transaction().execute(query, commit_tx=True)
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query, params, commit_tx=True
+            )
             
             tasks = []
             for row in result[0].rows:
@@ -603,9 +1287,10 @@ def get_pending_tasks(user_id=None):
                     'when_': safe_decode(row['when_']),
                     'description': safe_decode(row['description']),
                     'assigned_to': safe_decode(row['assigned_to']),
-                    'username': safe_decode(row['username']),
-                    'created_at': safe_decode(row['created_at'])
+                    'username': safe_decode(row['username'])
                 })
+            if before is not None:
+                tasks.reverse()
             return tasks
         except Exception as e:
             print(f"Ошибка получения ожидающих заданий: {e}")
@@ -618,32 +1303,49 @@ def get_pending_tasks(user_id=None):
         return []
 
 
-def get_completed_tasks(user_id=None, limit=20):
+def get_completed_tasks(user_id=None, limit=20, after=None, before=None):
     """Получить выполненные задачи."""
     def execute(session):
         try:
+            prelude, cursor, order, params = _keyset_page('completed_at', True, after, before)
             if user_id:
-                query = """
-                    SELECT t.id, t.type, t.when_, t.description, t.rating, 
-                           t.time_spent, t.completed_at, u.username
-                    FROM Tasks t
-                    JOIN Users u ON t.assigned_to = u.telegram_id
-                    WHERE t.assigned_to = "{}" AND t.status = "Выполнено"
-                    ORDER BY t.completed_at DESC
-                    LIMIT {}
-                """.format(str(user_id), limit)
+                source = """
+                    FROM Tasks VIEW idx_tasks_assigned_status_completed
+                    WHERE assigned_to = $user_id AND status = "Выполнено"
+                """
+                declare = "DECLARE $user_id AS Utf8;"
+                params['$user_id'] = str(user_id)
             else:
-                query = """
-                    SELECT t.id, t.type, t.when_, t.description, t.rating, 
-                           t.time_spent, t.completed_at, u.username
-                    FROM Tasks t
-                    JOIN Users u ON t.assigned_to = u.telegram_id
-                    WHERE t.status = "Выполнено"
-                    ORDER BY t.completed_at DESC
-                    LIMIT {}
-                """.format(limit)
+                source = """
+                    FROM Tasks VIEW idx_tasks_status_completed
+                    WHERE status = "Выполнено"
+                """
+                declare = ""
+            query_text = f"""
+                {declare}
+                DECLARE $limit AS Uint64;
+                {prelude}
+                $page = (
+                    SELECT id, type, when_, description, rating, time_spent,
+                           completed_at, assigned_to
+                    {source}{cursor}
+                    ORDER BY {order}
+                    LIMIT $limit
+                );
+                SELECT t.id AS id, t.type AS type, t.when_ AS when_,
+                       t.description AS description, t.rating AS rating,
+                       t.time_spent AS time_spent, t.completed_at AS completed_at,
+                       u.username AS username
+                FROM $page AS t
+                LEFT JOIN Users AS u ON t.assigned_to = u.telegram_id
+                ORDER BY {order};
+            """
+            params['$limit'] = limit
             
-            result = session.transaction().execute(query, commit_tx=True)
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query, params, commit_tx=True
+            )
             
             tasks = []
             for row in result[0].rows:
@@ -657,6 +1359,8 @@ def get_completed_tasks(user_id=None, limit=20):
                     'completed_at': safe_decode(row['completed_at']),
                     'username': safe_decode(row['username'])
                 })
+            if before is not None:
+                tasks.reverse()
             return tasks
         except Exception as e:
             print(f"Ошибка получения выполненных заданий: {e}")
@@ -669,45 +1373,45 @@ def get_completed_tasks(user_id=None, limit=20):
         return []
 
 
-def create_task(task_type, assigned_to, description, when_time, created_by, shelves=None):
-    """Создать новое задание."""
+def create_task(task_type, assigned_to, description, when_time, created_by, shelves=None, due_at=None):
+    """Создать новое задание (вместе со счетчиком активных задач исполнителя).
+    
+    Внутри webhook-запроса повтор того же update'а возвращает id уже
+    созданного задания, не создавая дубль и не увеличивая счетчики.
+    """
+    key = operation_key('task', assigned_to, task_type, when_time)
+    task_id = derived_id(key)
+    
+    query_text = _ASSIGNEE_COUNTERS_DECLARE + """
+        DECLARE $id AS Utf8;
+        DECLARE $type AS Utf8;
+        DECLARE $when AS Utf8;
+        DECLARE $description AS Utf8;
+        DECLARE $assigned_to AS Utf8;
+        DECLARE $created_by AS Utf8;
+        DECLARE $shelves AS Optional<Utf8>;
+        DECLARE $due_at AS Optional<Utf8>;
+        
+        UPSERT INTO Tasks
+        (id, type, when_, due_at, status, description, assigned_to, created_by, created_at, shelves)
+        VALUES ($id, $type, $when, $due_at, "Ожидающее", $description,
+                $assigned_to, $created_by, CurrentUtcTimestamp(), $shelves);
+    """ + _ASSIGNEE_COUNTERS_YQL
+    params = {
+        '$id': task_id,
+        '$type': task_type,
+        '$when': str(when_time),
+        '$description': description,
+        '$assigned_to': str(assigned_to),
+        '$created_by': str(created_by),
+        '$shelves': shelves,
+        '$due_at': due_at or default_due_at(when_time),
+        '$assignee_rows': _assignee_counter_rows([assigned_to])
+    }
+    
     def execute(session):
-        try:
-            import uuid
-            from datetime import datetime
-            
-            task_id = str(uuid.uuid4())
-            
-            # Формируем полное описание
-            full_description = description
-            if shelves:
-                full_description += f" - Стеллажи: {shelves}"
-            
-            insert_query = """
-                UPSERT INTO Tasks 
-                (id, type, when_, status, description, assigned_to, created_by, created_at)
-                VALUES ("{}", "{}", "{}", "{}", "{}", "{}", "{}", Timestamp("{}"))
-            """.format(
-                task_id, task_type, when_time, "Ожидающее",
-                full_description, str(assigned_to), str(created_by), 
-                get_ydb_timestamp()
-            )
-            
-            session.transaction().execute(insert_query, commit_tx=True)
-            
-            # Обновляем счетчик задач у пользователя
-            update_user_query = """
-                UPDATE Users 
-                SET tasks_count = tasks_count + 1
-                WHERE telegram_id = "{}"
-            """.format(str(assigned_to))
-            
-            session.transaction().execute(update_user_query, commit_tx=True)
-            
-            return task_id
-        except Exception as e:
-            print(f"Ошибка создания задания: {e}")
-            return None
+        result_id, _ = _execute_idempotent(session, key, query_text, params, task_id)
+        return result_id
     
     try:
         return pool.retry_operation_sync(execute)
@@ -716,21 +1420,326 @@ def create_task(task_type, assigned_to, description, when_time, created_by, shel
         return None
 
 
-def get_all_tasks_stats():
-    """Получить общую статистику по заданиям."""
+def create_tasks_bulk(template, assignments, created_by, batch_size=500):
+    """Массово создать задания по шаблону для многих исполнителей.
+    
+    Пачка заданий и счетчики исполнителей пишутся одним запросом
+    в одной транзакции вместе с ключом идемпотентности, поэтому ни ретрай,
+    ни повторная доставка update'а не создают дублей.
+    
+    Args:
+        template (dict): type, description, when_, due_at (необязательно) -
+            общие поля заданий
+        assignments (list): dict с ключами assigned_to и shelves (необязательно)
+        created_by: telegram_id автора
+    
+    Returns:
+        list: созданные задания (dict: id, assigned_to, shelves, description)
+    """
+    query_text = _ASSIGNEE_COUNTERS_DECLARE + """
+        DECLARE $rows AS List<Struct<
+            id: Utf8, assigned_to: Utf8, shelves: Optional<Utf8>>>;
+        DECLARE $type AS Utf8;
+        DECLARE $when AS Utf8;
+        DECLARE $due_at AS Optional<Utf8>;
+        DECLARE $description AS Utf8;
+        DECLARE $created_by AS Utf8;
+        
+        UPSERT INTO Tasks
+        SELECT id, $type AS type, $when AS when_, $due_at AS due_at, "Ожидающее" AS status,
+               $description AS description, assigned_to, shelves,
+               $created_by AS created_by, CurrentUtcTimestamp() AS created_at
+        FROM AS_TABLE($rows);
+    """ + _ASSIGNEE_COUNTERS_YQL
+    
+    created = []
+    for start in range(0, len(assignments), batch_size):
+        key = operation_key('tasks_bulk', start)
+        tasks = []
+        for i, assignment in enumerate(assignments[start:start + batch_size]):
+            tasks.append({
+                'id': derived_id(key, i),
+                'assigned_to': str(assignment['assigned_to']),
+                'shelves': assignment.get('shelves') or None,
+                'description': template.get('description', '')
+            })
+        
+        def execute(session):
+            _, created_now = _execute_idempotent(
+                session, key, query_text,
+                {
+                    '$rows': [
+                        {'id': t['id'], 'assigned_to': t['assigned_to'], 'shelves': t['shelves']}
+                        for t in tasks
+                    ],
+                    '$type': template['type'],
+                    '$when': str(template['when_']),
+                    '$due_at': template.get('due_at') or default_due_at(template['when_']),
+                    '$description': template.get('description', ''),
+                    '$created_by': str(created_by),
+                    '$assignee_rows': _assignee_counter_rows(t['assigned_to'] for t in tasks)
+                },
+                len(tasks)
+            )
+            return created_now
+        
+        try:
+            # Пачка из уже обработанного update'а не возвращается повторно
+            if pool.retry_operation_sync(execute):
+                created.extend(tasks)
+        except Exception as e:
+            print(f"Ошибка массового создания заданий: {e}")
+            break
+    
+    return created
+
+
+def get_recount_tasks(when_from, when_to, task_type="Пересчеты"):
+    """Задания пересчета за интервал времени (для прогресса по стеллажам).
+    
+    Args:
+        when_from, when_to (str): границы when_ в формате 'YYYY-MM-DD HH:MM:SS'
+    
+    Returns:
+        list: dict с ключами id, assigned_to, username, status, shelves
+    """
     def execute(session):
         try:
-            # Статистика по типам и статусам
-            stats_query = """
-                SELECT type, status, COUNT(*) as count,
-                       AVG(CAST(rating AS Double)) as avg_rating,
-                       AVG(CAST(time_spent AS Double)) as avg_time
-                FROM Tasks 
-                WHERE rating IS NOT NULL AND rating > 0
-                GROUP BY type, status
+            query_text = """
+                DECLARE $type AS Utf8;
+                DECLARE $from AS Utf8;
+                DECLARE $to AS Utf8;
+                SELECT t.id AS id, t.assigned_to AS assigned_to, t.status AS status,
+                       t.shelves AS shelves, t.when_ AS when_, u.username AS username
+                FROM Tasks VIEW idx_tasks_type_when AS t
+                LEFT JOIN Users AS u ON t.assigned_to = u.telegram_id
+                WHERE t.type = $type AND t.when_ >= $from AND t.when_ < $to
+                    AND t.shelves IS NOT NULL
+                ORDER BY when_;
             """
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query,
+                {'$type': task_type, '$from': when_from, '$to': when_to},
+                commit_tx=True
+            )
             
-            result = session.transaction().execute(stats_query, commit_tx=True)
+            return [
+                {
+                    'id': safe_decode(row['id']),
+                    'assigned_to': safe_decode(row['assigned_to']),
+                    'username': safe_decode(row['username']),
+                    'status': safe_decode(row['status']),
+                    'shelves': safe_decode(row['shelves'])
+                }
+                for row in result[0].rows
+            ]
+        except Exception as e:
+            print(f"Ошибка получения заданий пересчета: {e}")
+            return []
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка получения заданий пересчета: {e}")
+        return []
+
+
+def get_overdue_candidates(now_value, since_value, after=None, page_size=500):
+    """Страница незавершенных заданий, у которых прошел конец слота.
+    
+    Читает idx_tasks_status_due диапазоном (status, due_at) за окно
+    [since_value, now_value) - более старые просрочки уже отмечены
+    предыдущими запусками. Продолжение от последнего ключа (status, due_at, id).
+    
+    Returns:
+        list: dict с ключами id, status, type, when_, due_at, assigned_to
+    """
+    def execute(session):
+        query_text = """
+            DECLARE $now AS Utf8;
+            DECLARE $since AS Utf8;
+            DECLARE $after_status AS Utf8;
+            DECLARE $after_due AS Utf8;
+            DECLARE $after_id AS Utf8;
+            DECLARE $limit AS Uint64;
+            SELECT id, status, type, when_, due_at, assigned_to
+            FROM Tasks VIEW idx_tasks_status_due
+            WHERE status IN ("Ожидающее", "В работе")
+              AND due_at >= $since AND due_at < $now
+              AND (status, due_at, id) > ($after_status, $after_due, $after_id)
+              AND (is_overdue IS NULL OR is_overdue = false)
+            ORDER BY status, due_at, id
+            LIMIT $limit;
+        """
+        prepared_query = session.prepare(query_text)
+        after_status, after_due, after_id = after or ("", "", "")
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query,
+            {
+                '$now': now_value,
+                '$since': since_value,
+                '$after_status': after_status,
+                '$after_due': after_due,
+                '$after_id': after_id,
+                '$limit': page_size
+            },
+            commit_tx=True
+        )
+        return [
+            {
+                'id': safe_decode(row.id),
+                'status': safe_decode(row.status),
+                'type': safe_decode(row.type),
+                'when_': safe_decode(row.when_),
+                'due_at': safe_decode(row.due_at),
+                'assigned_to': safe_decode(row.assigned_to)
+            }
+            for row in result[0].rows
+        ]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка поиска просроченных заданий: {e}")
+        return []
+
+
+def mark_tasks_overdue(task_ids):
+    """Отметить задания просроченными и увеличить Users.delays_count.
+    
+    Повторная проверка статуса и признака выполняется в той же транзакции,
+    поэтому параллельный запуск не посчитает просрочку дважды.
+    
+    Returns:
+        list: id заданий, отмеченных этим вызовом
+    """
+    if not task_ids:
+        return []
+    
+    def execute(session):
+        query_text = """
+            DECLARE $ids AS List<Utf8>;
+            
+            $fresh = (
+                SELECT id, assigned_to FROM Tasks
+                WHERE id IN $ids
+                  AND status IN ("Ожидающее", "В работе")
+                  AND (is_overdue IS NULL OR is_overdue = false)
+            );
+            
+            SELECT id FROM $fresh;
+            
+            UPDATE Tasks ON
+            SELECT id, true AS is_overdue FROM $fresh;
+            
+            UPDATE Users ON
+            SELECT u.telegram_id AS telegram_id,
+                   COALESCE(u.delays_count, 0) + CAST(d.delays AS Int32) AS delays_count
+            FROM (
+                SELECT assigned_to, COUNT(*) AS delays FROM $fresh GROUP BY assigned_to
+            ) AS d
+            JOIN Users AS u ON u.telegram_id = d.assigned_to;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, {'$ids': list(task_ids)}, commit_tx=True
+        )
+        return [safe_decode(row.id) for row in result[0].rows]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка отметки просроченных заданий: {e}")
+        return []
+
+
+def get_users_by_roles(roles):
+    """Пользователи с указанными ролями (telegram_id, username, role)."""
+    def execute(session):
+        query_text = """
+            DECLARE $roles AS List<Utf8>;
+            SELECT telegram_id, username, role FROM Users WHERE role IN $roles;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {'$roles': list(roles)}, commit_tx=True
+        )
+        return [
+            {
+                'telegram_id': safe_decode(row.telegram_id),
+                'username': safe_decode(row.username),
+                'role': safe_decode(row.role)
+            }
+            for row in result[0].rows
+        ]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка получения пользователей по ролям: {e}")
+        return []
+
+
+def get_users_page(role=None, after="", page_size=500):
+    """Страница telegram_id пользователей по возрастанию ключа (для рассылок).
+    
+    С ролью читает idx_users_role диапазоном по (role, telegram_id),
+    без роли - первичный ключ Users. Продолжение от последнего telegram_id.
+    
+    Returns:
+        list: telegram_id (строки); None при ошибке
+    """
+    def execute(session):
+        if role:
+            query_text = """
+                DECLARE $role AS Utf8;
+                DECLARE $after AS Utf8;
+                DECLARE $limit AS Uint64;
+                SELECT telegram_id FROM Users VIEW idx_users_role
+                WHERE role = $role AND telegram_id > $after
+                ORDER BY role, telegram_id
+                LIMIT $limit;
+            """
+            params = {'$role': role, '$after': after, '$limit': page_size}
+        else:
+            query_text = """
+                DECLARE $after AS Utf8;
+                DECLARE $limit AS Uint64;
+                SELECT telegram_id FROM Users
+                WHERE telegram_id > $after
+                ORDER BY telegram_id
+                LIMIT $limit;
+            """
+            params = {'$after': after, '$limit': page_size}
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, params, commit_tx=True
+        )
+        return [safe_decode(row.telegram_id) for row in result[0].rows]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка получения страницы пользователей: {e}")
+        return None
+
+
+def get_all_tasks_stats():
+    """Получить общую статистику по заданиям."""
+    def execute(session):
+        try:
+            # Статистика по типам и статусам
+            stats_query = """
+                SELECT type, status, COUNT(*) as count,
+                       AVG(CAST(rating AS Double)) as avg_rating,
+                       AVG(CAST(time_spent AS Double)) as avg_time
+                FROM Tasks
+                WHERE rating IS NOT NULL AND rating > 0
+                GROUP BY type, status
+            """
+            
+            result = session.transaction(ydb.OnlineReadOnly()).execute(stats_query, commit_tx=True)
             
             stats = {}
             for row in result[0].rows:
@@ -791,68 +1800,207 @@ def get_users_for_task_assignment():
         return []
 
 
-def update_task_status(task_id, new_status, rating=None, time_spent=None):
-    """Обновить статус задания."""
+_TASK_TRANSITION_QUERY = """
+    DECLARE $task_id AS Utf8;
+    DECLARE $old_status AS Utf8;
+    DECLARE $new_status AS Utf8;
+    DECLARE $user_id AS Utf8;
+    DECLARE $finished AS Int32;
+    
+    UPDATE Tasks SET status = $new_status
+    WHERE id = $task_id AND status = $old_status;
+    
+    UPDATE Users
+    SET active_tasks_count = COALESCE(active_tasks_count, 0) - $finished
+    WHERE telegram_id = $user_id;
+"""
+
+# Завершение: счетчик выполненных и средний рейтинг пересчитываются инкрементально
+_TASK_COMPLETE_QUERY = """
+    DECLARE $task_id AS Utf8;
+    DECLARE $old_status AS Utf8;
+    DECLARE $user_id AS Utf8;
+    DECLARE $rating AS Optional<Int32>;
+    DECLARE $time_spent AS Optional<Int32>;
+    DECLARE $photo_file_id AS Optional<Utf8>;
+    DECLARE $photo_unique_id AS Optional<Utf8>;
+    
+    UPDATE Tasks
+    SET status = "Выполнено",
+        completed_at = CurrentUtcTimestamp(),
+        rating = $rating,
+        time_spent = $time_spent,
+        photo_file_id = COALESCE($photo_file_id, photo_file_id),
+        photo_unique_id = COALESCE($photo_unique_id, photo_unique_id)
+    WHERE id = $task_id AND status = $old_status;
+    
+    UPDATE Users
+    SET tasks_count = COALESCE(tasks_count, 0) + 1,
+        active_tasks_count = COALESCE(active_tasks_count, 0) - 1,
+        rated_count = COALESCE(rated_count, 0) + IF($rating IS NULL, 0, 1),
+        average_rating = IF(
+            $rating IS NULL,
+            average_rating,
+            (COALESCE(average_rating, 0.0) * CAST(COALESCE(rated_count, 0) AS Double)
+             + CAST($rating AS Double)) / CAST(COALESCE(rated_count, 0) + 1 AS Double)
+        )
+    WHERE telegram_id = $user_id;
+"""
+
+
+def update_task_status(task_id, new_status, rating=None, time_spent=None,
+                       photo_file_id=None, photo_unique_id=None):
+    """
+    Перевести задание в новый статус.
+    
+    Текущий статус читается и меняется в одной сериализуемой транзакции,
+    переход проверяется по TASK_TRANSITIONS. Там же обновляются счетчики
+    исполнителя в Users. Фото-подтверждение (только file_id из Telegram)
+    записывается вместе с завершением; фото, уже приложенное к другому
+    заданию, отклоняется по file_unique_id.
+    
+    Returns:
+        tuple: (успех, сообщение)
+    """
     def execute(session):
         try:
-            # Базовый запрос обновления
-            update_fields = [f'status = "{new_status}"']
+            tx = session.transaction(ydb.SerializableReadWrite()).begin()
+            
+            select_query = session.prepare("""
+                DECLARE $task_id AS Utf8;
+                DECLARE $photo_unique_id AS Utf8;
+                SELECT status, assigned_to FROM Tasks WHERE id = $task_id;
+                SELECT id FROM Tasks VIEW idx_tasks_photo_unique
+                WHERE photo_unique_id = $photo_unique_id
+                LIMIT 1;
+            """)
+            result = tx.execute(select_query, {
+                '$task_id': str(task_id),
+                '$photo_unique_id': photo_unique_id or ""
+            })
             
-            if new_status == "Выполнено":
-                update_fields.append(f'completed_at = Timestamp("{get_ydb_timestamp()}")')
-                
-                if rating:
-                    update_fields.append(f'rating = {rating}')
-                
-                if time_spent:
-                    update_fields.append(f'time_spent = {time_spent}')
+            if not result[0].rows:
+                tx.rollback()
+                return False, "❌ Задание не найдено"
             
-            update_query = """
-                UPDATE Tasks 
-                SET {}
-                WHERE id = "{}"
-            """.format(", ".join(update_fields), task_id)
+            row = result[0].rows[0]
+            old_status = safe_decode(row['status'])
+            user_id = safe_decode(row['assigned_to'])
             
-            session.transaction().execute(update_query, commit_tx=True)
+            if photo_unique_id and result[1].rows:
+                tx.rollback()
+                if safe_decode(result[1].rows[0]['id']) == str(task_id):
+                    # Повторная доставка того же фото - задание уже завершено им
+                    return True, "✅ Фото уже принято"
+                return False, "❌ Это фото уже приложено к другому заданию"
             
-            return True
+            if new_status not in TASK_TRANSITIONS.get(old_status, ()):
+                tx.rollback()
+                return False, f"❌ Нельзя перевести задание из «{old_status}» в «{new_status}»"
+            
+            if new_status == "Выполнено":
+                query = session.prepare(_TASK_COMPLETE_QUERY)
+                params = {
+                    '$rating': int(rating) if rating else None,
+                    '$time_spent': int(time_spent) if time_spent else None,
+                    '$photo_file_id': photo_file_id,
+                    '$photo_unique_id': photo_unique_id
+                }
+            else:
+                query = session.prepare(_TASK_TRANSITION_QUERY)
+                params = {
+                    '$new_status': new_status,
+                    '$finished': 1 if new_status in TASK_FINAL_STATUSES else 0
+                }
+            params.update({
+                '$task_id': str(task_id),
+                '$old_status': old_status,
+                '$user_id': user_id
+            })
+            
+            tx.execute(query, params, commit_tx=True)
+            return True, f"✅ Статус задания: {new_status}"
         except Exception as e:
             print(f"Ошибка обновления статуса задания: {e}")
-            return False
+            return False, "❌ Ошибка обновления статуса задания"
     
     try:
         return pool.retry_operation_sync(execute)
     except Exception as e:
         print(f"Ошибка обновления статуса задания: {e}")
-        return False
+        return False, "❌ Ошибка обновления статуса задания"
+
+
+def get_task_types():
+    """Все типы заданий из TaskTypes (для справочника task_catalog).
+    
+    Returns:
+        list | None: dict с ключами name, category, emoji, default_duration,
+        requires_photo; None при ошибке чтения
+    """
+    def execute(session):
+        query = """
+            SELECT name, category, emoji, default_duration, requires_photo
+            FROM TaskTypes
+        """
+        result = session.transaction(ydb.OnlineReadOnly()).execute(query, commit_tx=True)
+        return [
+            {
+                'name': safe_decode(row.name),
+                'category': safe_decode(row.category),
+                'emoji': safe_decode(row.emoji) or None,
+                'default_duration': int(row.default_duration) if row.default_duration else None,
+                'requires_photo': bool(row.requires_photo)
+            }
+            for row in result[0].rows
+        ]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка чтения типов заданий: {e}")
+        return None
 
 
 def get_task_by_id(task_id):
     """Получить задание по ID."""
     def execute(session):
         try:
-            query = """
-                SELECT t.id, t.type, t.when_, t.status, t.description, 
-                       t.assigned_to, t.rating, t.time_spent, t.created_by,
-                       u.username, uc.username as creator_username
-                FROM Tasks t
-                JOIN Users u ON t.assigned_to = u.telegram_id
-                LEFT JOIN Users uc ON t.created_by = uc.telegram_id
-                WHERE t.id = "{}"
-            """.format(task_id)
-            
-            result = session.transaction().execute(query, commit_tx=True)
+            query_text = """
+                DECLARE $task_id AS Utf8;
+                SELECT t.id AS id, t.type AS type, t.when_ AS when_, t.status AS status,
+                       t.description AS description, t.assigned_to AS assigned_to,
+                       t.rating AS rating, t.time_spent AS time_spent,
+                       t.created_by AS created_by, t.shelves AS shelves,
+                       t.photo_file_id AS photo_file_id, t.is_overdue AS is_overdue,
+                       u.username AS username, uc.username AS creator_username
+                FROM Tasks AS t
+                LEFT JOIN Users AS u ON t.assigned_to = u.telegram_id
+                LEFT JOIN Users AS uc ON t.created_by = uc.telegram_id
+                WHERE t.id = $task_id;
+            """
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query, {'$task_id': str(task_id)}, commit_tx=True
+            )
             
             if result[0].rows:
                 row = result[0].rows[0]
                 return {
-                    'telegram_id': safe_decode(row[0]),  # telegram_id
-                    'username': safe_decode(row[1]),     # username
-                    'role': safe_decode(row[2]),         # role
-                    'tasks_count': int(row[3]) if row[3] else 0,        # tasks_count
-                    'average_rating': float(row[4]) if row[4] else 0.0, # average_rating
-                    'quality_score': float(row[5]) if row[5] else 0.0,  # quality_score
-                    'notifications_enabled': bool(row[6]) if row[6] is not None else True # notifications_enabled
+                    'id': safe_decode(row['id']),
+                    'type': safe_decode(row['type']),
+                    'when_': safe_decode(row['when_']),
+                    'status': safe_decode(row['status']),
+                    'description': safe_decode(row['description']),
+                    'assigned_to': safe_decode(row['assigned_to']),
+                    'rating': int(row.rating) if row.rating else 0,
+                    'time_spent': int(row.time_spent) if row.time_spent else 0,
+                    'created_by': safe_decode(row['created_by']),
+                    'shelves': safe_decode(row['shelves']),
+                    'photo_file_id': safe_decode(row['photo_file_id']),
+                    'is_overdue': bool(row.is_overdue),
+                    'username': safe_decode(row['username']),
+                    'creator_username': safe_decode(row['creator_username'])
                 }
             return None
         except Exception as e:
@@ -908,50 +2056,58 @@ def get_schedule_by_type_admin(schedule_type):
     
  
 def get_schedule_stats_admin():
-    """Получить детальную статистику расписания для админа."""
+    """Получить детальную статистику расписания для админа.
+
+    Читает предагрегированные счетчики ScheduleDailyStats и
+    ScheduleUserMonthStats вместо агрегации всей таблицы Schedule.
+    Статистика по пользователям считается с начала текущего месяца.
+    """
     def execute(session):
         try:
-            # Общая статистика
-            stats_query = """
-                SELECT 
-                    type,
-                    COUNT(*) as total_count,
-                    COUNT(CASE WHEN date >= CurrentUtcDate() THEN 1 END) as upcoming_count,
-                    COUNT(CASE WHEN date < CurrentUtcDate() THEN 1 END) as past_count
-                FROM Schedule 
-                WHERE status = "Активно"
-                GROUP BY type
+            query_text = """
+                DECLARE $today AS Date;
+                DECLARE $month AS Utf8;
+
+                SELECT type,
+                       SUM(count) AS total_count,
+                       SUM(IF(date >= $today, count, 0)) AS upcoming_count,
+                       SUM(IF(date < $today, count, 0)) AS past_count
+                FROM ScheduleDailyStats
+                GROUP BY type;
+
+                $top_users = (
+                    SELECT user_id, type, SUM(count) AS count
+                    FROM ScheduleUserMonthStats
+                    WHERE month >= $month
+                    GROUP BY user_id, type
+                    HAVING SUM(count) > 0
+                    ORDER BY count DESC
+                    LIMIT 20
+                );
+                SELECT u.username AS username, t.type AS type, t.count AS count
+                FROM $top_users AS t
+                LEFT JOIN Users AS u ON t.user_id = u.telegram_id
+                ORDER BY count DESC;
             """
-            
-            result = session.transaction().execute(stats_query, commit_tx=True)
+            today = datetime.now().date()
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query,
+                {'$today': today, '$month': today.strftime('%Y-%m')},
+                commit_tx=True
+            )
             
             stats = {}
             for row in result[0].rows:
                 schedule_type = safe_decode(row['type'])
                 stats[schedule_type] = {
-                    'total': row.total_count,
-                    'upcoming': row.upcoming_count,
-                    'past': row.past_count
+                    'total': row.total_count or 0,
+                    'upcoming': row.upcoming_count or 0,
+                    'past': row.past_count or 0
                 }
             
-            # Статистика по пользователям
-            user_stats_query = """
-                SELECT 
-                    u.username,
-                    s.type,
-                    COUNT(*) as count
-                FROM Schedule s
-                JOIN Users u ON s.user_id = u.telegram_id
-                WHERE s.status = "Активно" AND s.date >= CurrentUtcDate()
-                GROUP BY u.username, s.type
-                ORDER BY count DESC
-                LIMIT 20
-            """
-            
-            user_result = session.transaction().execute(user_stats_query, commit_tx=True)
-            
             user_stats = []
-            for row in user_result[0].rows:
+            for row in result[1].rows:
                 user_stats.append({
                     'username': safe_decode(row['username']),
                     'type': safe_decode(row['type']),
@@ -970,293 +2126,1227 @@ def get_schedule_stats_admin():
     try:
         return pool.retry_operation_sync(execute)
     except Exception as e:
-        print(f"Ошибка получения статистики админ: {e}")
-        return {}
+        print(f"Ошибка получения статистики админ: {e}")
+        return {}
+
+
+def rebuild_schedule_counters():
+    """Пересчитать счетчики расписания с нуля (первичное заполнение)."""
+    def execute(session):
+        query_text = """
+            $active = (
+                SELECT user_id, type, date FROM Schedule WHERE status = "Активно"
+                UNION ALL
+                SELECT user_id, type, date FROM ScheduleArchive WHERE status = "Активно"
+            );
+
+            DELETE FROM ScheduleDailyStats;
+            DELETE FROM ScheduleUserMonthStats;
+
+            UPSERT INTO ScheduleDailyStats
+            SELECT type, date, CAST(COUNT(*) AS Int64) AS count
+            FROM $active
+            GROUP BY type, date;
+
+            UPSERT INTO ScheduleUserMonthStats
+            SELECT user_id, type, month, CAST(COUNT(*) AS Int64) AS count
+            FROM (
+                SELECT user_id, type, Substring(CAST(date AS String), 0, 7) AS month
+                FROM $active
+            )
+            GROUP BY user_id, type, month;
+        """
+        session.transaction(ydb.SerializableReadWrite()).execute(query_text, commit_tx=True)
+        return True
+
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка пересчета счетчиков расписания: {e}")
+        return False
+
+
+def rebuild_user_task_counters():
+    """Пересчитать счетчики заданий в Users по таблице Tasks (первичное заполнение)."""
+    def execute(session):
+        query_text = """
+            $stats = (
+                SELECT assigned_to,
+                       COUNT_IF(status = "Выполнено") AS completed,
+                       COUNT_IF(status IN ("Ожидающее", "В работе")) AS active,
+                       COUNT_IF(status = "Выполнено" AND rating > 0) AS rated,
+                       AVG(IF(status = "Выполнено" AND rating > 0, CAST(rating AS Double))) AS avg_rating
+                FROM Tasks
+                GROUP BY assigned_to
+            );
+
+            UPDATE Users ON
+            SELECT u.telegram_id AS telegram_id,
+                   CAST(COALESCE(s.completed, 0) AS Int32) AS tasks_count,
+                   CAST(COALESCE(s.active, 0) AS Int32) AS active_tasks_count,
+                   CAST(COALESCE(s.rated, 0) AS Int32) AS rated_count,
+                   s.avg_rating AS average_rating
+            FROM Users AS u
+            LEFT JOIN $stats AS s ON u.telegram_id = s.assigned_to;
+        """
+        session.transaction(ydb.SerializableReadWrite()).execute(query_text, commit_tx=True)
+        return True
+
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка пересчета счетчиков заданий: {e}")
+        return False
+
+
+# Заглушки для функций редактирования расписания  
+def delete_schedule_item(schedule_id, admin_id):
+    """Удалить запись из расписания."""
+    def execute(session):
+        try:
+            print(f"DEBUG: Попытка удалить запись с ID: {schedule_id}")
+            
+            # Простой запрос без алиасов
+            select_query = """
+                SELECT Schedule.id, Schedule.user_id, Schedule.date, Schedule.type, Schedule.start_time, Schedule.end_time, Users.username
+                FROM Schedule 
+                JOIN Users ON Schedule.user_id = Users.telegram_id
+                WHERE Schedule.id = "{}" AND Schedule.status = "Активно"
+            """.format(schedule_id)
+            
+            # Чтение и пометка удаления в одной транзакции, чтобы счетчики
+            # не уменьшились дважды при параллельном удалении
+            tx = session.transaction(ydb.SerializableReadWrite()).begin()
+            result = tx.execute(select_query)
+            
+            print(f"DEBUG: Найдено записей: {len(result[0].rows)}")
+            
+            if not result[0].rows:
+                tx.rollback()
+                print(f"DEBUG: Запись с ID {schedule_id} не найдена")
+                return False, "❌ Запись не найдена или уже удалена"
+            
+            row = result[0].rows[0]
+            print(f"DEBUG: Данные записи: {[repr(field) for field in row]}")
+            
+            # Получаем данные
+            schedule_id_from_db = safe_decode(row[0])
+            user_id = safe_decode(row[1])
+            date_raw = row[2]
+            task_type = safe_decode(row[3])
+            start_time = safe_decode(row[4])
+            end_time = safe_decode(row[5])
+            username = safe_decode(row[6])
+            
+            # Форматируем дату
+            formatted_date = ydb_date(date_raw).strftime('%Y-%m-%d')
+            
+            item_info = {
+                'id': schedule_id_from_db,
+                'user_id': user_id,
+                'date': formatted_date,
+                'type': task_type,
+                'start_time': start_time,
+                'end_time': end_time,
+                'username': username
+            }
+            
+            print(f"DEBUG: Обработанная информация о записи: {item_info}")
+            
+            # Удаляем запись из расписания (помечаем как удаленную)
+            delete_schedule_query = _SCHEDULE_COUNTERS_DECLARE + _SCHEDULE_CHANGES_DECLARE + """
+                UPDATE Schedule 
+                SET status = "Удалено"
+                WHERE id = "{}";
+            """.format(schedule_id) + _SCHEDULE_COUNTERS_YQL + _SCHEDULE_CHANGES_YQL
+            
+            counter_rows = _schedule_counter_rows([{
+                'user_id': user_id,
+                'type': task_type,
+                'date': ydb_date(date_raw)
+            }], -1)
+            
+            change_rows = _schedule_change_rows([{
+                'user_id': user_id,
+                'date': ydb_date(date_raw),
+                'type': task_type,
+                'start_time': start_time,
+                'end_time': end_time
+            }], -1)
+            
+            tx.execute(
+                session.prepare(delete_schedule_query),
+                {'$counter_rows': counter_rows, '$change_rows': change_rows},
+                commit_tx=True
+            )
+            print(f"DEBUG: Запись помечена как удаленная")
+            
+            # ФИЗИЧЕСКИ УДАЛЯЕМ связанные задания
+            delete_tasks_query = """
+                DELETE FROM Tasks 
+                WHERE assigned_to = "{}" AND type = "{}" 
+                AND when_ LIKE "{}%"
+            """.format(user_id, task_type, formatted_date)
+            
+            session.transaction().execute(delete_tasks_query, commit_tx=True)
+            print(f"DEBUG: Связанные задания ФИЗИЧЕСКИ УДАЛЕНЫ")
+            _bump_schedule_version()
+            
+            return True, item_info
+            
+        except Exception as e:
+            print(f"Ошибка удаления записи расписания: {e}")
+            import traceback
+            traceback.print_exc()
+            return False, f"Ошибка удаления: {str(e)}"
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка выполнения удаления: {e}")
+        return False, f"Ошибка выполнения: {str(e)}"
+
+
+def edit_schedule_item(schedule_id, new_date=None, new_start_time=None, new_end_time=None, admin_id=None):
+    """Редактировать запись расписания."""
+    return False, "❌ Функция в разработке"
+
+
+
+# Переключаемые флаги NotificationSettings (только эти колонки подставляются в запрос)
+NOTIFICATION_FLAGS = (
+    'general_notifications', 'task_reminders', 'schedule_updates', 'rating_notifications'
+)
+
+# Кеш настроек уведомлений в пределах контейнера. Изменения через этот модуль
+# обновляют кеш сразу; правки из других контейнеров видны не позже TTL.
+SETTINGS_CACHE_TTL_SECONDS = 300
+_settings_cache = {}
+_settings_lock = threading.Lock()
+
+
+def _settings_from_row(user_id, row):
+    """Настройки с умолчаниями для отсутствующей строки или NULL-колонок."""
+    def flag(name):
+        value = getattr(row, name) if row is not None else None
+        return bool(value) if value is not None else True
+    
+    minutes = row.reminder_minutes_before if row is not None else None
+    return {
+        'user_id': str(user_id),
+        'general_notifications': flag('general_notifications'),
+        'task_reminders': flag('task_reminders'),
+        'schedule_updates': flag('schedule_updates'),
+        'rating_notifications': flag('rating_notifications'),
+        'reminder_minutes_before': minutes if minutes is not None else DEFAULT_REMINDER_MINUTES_BEFORE,
+        'work_hours_start': (safe_decode(row.work_hours_start) if row is not None else None) or DEFAULT_WORK_HOURS[0],
+        'work_hours_end': (safe_decode(row.work_hours_end) if row is not None else None) or DEFAULT_WORK_HOURS[1]
+    }
+
+
+def _cache_settings(settings):
+    with _settings_lock:
+        _settings_cache[settings['user_id']] = (time.monotonic() + SETTINGS_CACHE_TTL_SECONDS, settings)
+
+
+def _cached_settings(user_id):
+    with _settings_lock:
+        entry = _settings_cache.get(str(user_id))
+    if entry and entry[0] > time.monotonic():
+        return dict(entry[1])
+    return None
+
+
+def invalidate_notification_settings(user_id=None):
+    """Сбросить кеш настроек пользователя (или всех)."""
+    with _settings_lock:
+        if user_id is None:
+            _settings_cache.clear()
+        else:
+            _settings_cache.pop(str(user_id), None)
+
+
+def get_notification_settings(user_id):
+    """Получить настройки уведомлений пользователя (из кеша контейнера).
+    
+    Строка в NotificationSettings не создается: для отсутствующей
+    возвращаются значения по умолчанию.
+    """
+    cached = _cached_settings(user_id)
+    if cached is not None:
+        return cached
+    
+    def execute(session):
+        query_text = """
+            DECLARE $user_id AS Utf8;
+            SELECT general_notifications, task_reminders, schedule_updates,
+                   rating_notifications, reminder_minutes_before,
+                   work_hours_start, work_hours_end
+            FROM NotificationSettings
+            WHERE user_id = $user_id;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {'$user_id': str(user_id)}, commit_tx=True
+        )
+        rows = result[0].rows
+        return _settings_from_row(user_id, rows[0] if rows else None)
+    
+    try:
+        settings = pool.retry_operation_sync(execute)
+        _cache_settings(settings)
+        return dict(settings)
+    except Exception as e:
+        print(f"Ошибка получения настроек уведомлений: {e}")
+        return None
+
+
+def get_notification_settings_bulk(user_ids, chunk_size=1000):
+    """Настройки уведомлений многих пользователей - для рассылок.
+    
+    Кешированные берутся из памяти, остальные одним запросом на каждые
+    chunk_size id (WHERE user_id IN $ids); отсутствующим строкам подставляются
+    умолчания без записи в БД.
+    
+    Returns:
+        dict: user_id (str) -> настройки как у get_notification_settings;
+        None при ошибке чтения
+    """
+    settings = {}
+    missing = []
+    for user_id in dict.fromkeys(str(u) for u in user_ids):
+        cached = _cached_settings(user_id)
+        if cached is not None:
+            settings[user_id] = cached
+        else:
+            missing.append(user_id)
+    
+    def execute(session, ids):
+        query_text = """
+            DECLARE $ids AS List<Utf8>;
+            SELECT user_id, general_notifications, task_reminders, schedule_updates,
+                   rating_notifications, reminder_minutes_before,
+                   work_hours_start, work_hours_end
+            FROM NotificationSettings
+            WHERE user_id IN $ids;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {'$ids': ids}, commit_tx=True
+        )
+        return {safe_decode(row.user_id): row for row in result[0].rows}
+    
+    for start in range(0, len(missing), chunk_size):
+        ids = missing[start:start + chunk_size]
+        try:
+            rows = pool.retry_operation_sync(lambda session: execute(session, ids))
+        except Exception as e:
+            print(f"Ошибка массового получения настроек уведомлений: {e}")
+            return None
+        for user_id in ids:
+            user_settings = _settings_from_row(user_id, rows.get(user_id))
+            _cache_settings(user_settings)
+            settings[user_id] = dict(user_settings)
+    
+    return settings
+
+
+def set_notification_flag(user_id, flag, value):
+    """Выставить один флаг настроек (UPSERT одной колонки).
+    
+    Значение задается явно, а не инвертируется, поэтому повторная доставка
+    того же нажатия ничего не меняет. Кеш обновляется сразу.
+    
+    Returns:
+        bool: успешность записи
+    """
+    if flag not in NOTIFICATION_FLAGS:
+        raise ValueError(f"Неизвестная настройка уведомлений: {flag}")
+    
+    def execute(session):
+        query_text = f"""
+            DECLARE $user_id AS Utf8;
+            DECLARE $value AS Bool;
+            UPSERT INTO NotificationSettings (user_id, {flag})
+            VALUES ($user_id, $value);
+        """
+        prepared_query = session.prepare(query_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, {'$user_id': str(user_id), '$value': bool(value)}, commit_tx=True
+        )
+        return True
+    
+    try:
+        pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка обновления настройки уведомлений: {e}")
+        invalidate_notification_settings(user_id)
+        return False
+    
+    cached = _cached_settings(user_id)
+    if cached is not None:
+        cached[flag] = bool(value)
+        _cache_settings(cached)
+    return True
+
+
+def get_user_notifications(user_id, limit=20):
+    """Получить уведомления пользователя (последние limit, через idx_notifications_user_created)."""
+    def execute(session):
+        try:
+            query_text = """
+                DECLARE $user_id AS Utf8;
+                DECLARE $limit AS Uint64;
+                
+                SELECT id, title, message, type, is_read, created_at
+                FROM Notifications VIEW idx_notifications_user_created
+                WHERE user_id = $user_id
+                ORDER BY user_id DESC, created_at DESC
+                LIMIT $limit;
+            """
+            prepared_query = session.prepare(query_text)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                prepared_query,
+                {'$user_id': str(user_id), '$limit': limit},
+                commit_tx=True
+            )
+            
+            notifications = []
+            for row in result[0].rows:
+                notifications.append({
+                    'id': safe_decode(row[0]),
+                    'title': safe_decode(row[1]),
+                    'message': safe_decode(row[2]),
+                    'type': safe_decode(row[3]),
+                    'is_read': bool(row[4]) if row[4] is not None else False,
+                    'created_at': safe_decode(row[5])
+                })
+            
+            return notifications
+            
+        except Exception as e:
+            print(f"Ошибка получения уведомлений: {e}")
+            return []
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка получения уведомлений: {e}")
+        return []
+
+
+def update_notification_settings(user_id, settings):
+    """Обновить настройки уведомлений пользователя (переданные флаги)."""
+    flags = {name: bool(settings[name]) for name in NOTIFICATION_FLAGS if name in settings}
+    if not flags:
+        return True
+    
+    def execute(session):
+        columns = ", ".join(flags)
+        declares = "".join(f"DECLARE ${name} AS Bool;\n" for name in flags)
+        values = ", ".join(f"${name}" for name in flags)
+        query_text = f"""
+            DECLARE $user_id AS Utf8;
+            {declares}
+            UPSERT INTO NotificationSettings (user_id, {columns})
+            VALUES ($user_id, {values});
+        """
+        params = {f"${name}": value for name, value in flags.items()}
+        params['$user_id'] = str(user_id)
+        prepared_query = session.prepare(query_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, params, commit_tx=True
+        )
+        return True
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка обновления настроек уведомлений: {e}")
+        return False
+    finally:
+        invalidate_notification_settings(user_id)
+
+
+def get_reminder_candidates(when_from, when_to, after=None, page_size=500):
+    """Страница ожидающих заданий с when_ в интервале - для напоминаний.
+    
+    Читает idx_tasks_status_when диапазоном (status, when_) с продолжением
+    от последнего ключа (when_, id). В том же запросе подтягиваются настройки
+    исполнителя и признак уже отправленного напоминания (reminder:<task_id>).
+    
+    Args:
+        when_from, when_to (str): границы when_ в формате 'YYYY-MM-DD HH:MM:SS'
+        after (tuple): (when_, id) последней строки предыдущей страницы
+    
+    Returns:
+        list: dict с полями задания, настроек и already_sent
+    """
+    def execute(session):
+        query_text = """
+            DECLARE $to AS Utf8;
+            DECLARE $after_when AS Utf8;
+            DECLARE $after_id AS Utf8;
+            DECLARE $limit AS Uint64;
+            
+            $tasks = (
+                SELECT id, when_, type, assigned_to,
+                       "reminder:" || id AS reminder_id
+                FROM Tasks VIEW idx_tasks_status_when
+                WHERE status = "Ожидающее" AND when_ < $to
+                  AND (when_, id) > ($after_when, $after_id)
+                ORDER BY when_, id
+                LIMIT $limit
+            );
+            
+            SELECT t.id AS id, t.when_ AS when_, t.type AS type,
+                   t.assigned_to AS assigned_to,
+                   s.task_reminders AS task_reminders,
+                   s.reminder_minutes_before AS minutes_before,
+                   s.work_hours_start AS work_hours_start,
+                   s.work_hours_end AS work_hours_end,
+                   n.id AS sent_id
+            FROM $tasks AS t
+            LEFT JOIN NotificationSettings AS s ON s.user_id = t.assigned_to
+            LEFT JOIN Notifications AS n ON n.id = t.reminder_id
+            ORDER BY when_, id;
+        """
+        prepared_query = session.prepare(query_text)
+        after_when, after_id = after or (when_from, "")
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query,
+            {
+                '$to': when_to,
+                '$after_when': after_when,
+                '$after_id': after_id,
+                '$limit': page_size
+            },
+            commit_tx=True
+        )
+        
+        return [
+            {
+                'id': safe_decode(row.id),
+                'when_': safe_decode(row.when_),
+                'type': safe_decode(row.type),
+                'assigned_to': safe_decode(row.assigned_to),
+                'task_reminders': row.task_reminders if row.task_reminders is not None else True,
+                'minutes_before': row.minutes_before if row.minutes_before is not None else None,
+                'work_hours_start': safe_decode(row.work_hours_start) or None,
+                'work_hours_end': safe_decode(row.work_hours_end) or None,
+                'already_sent': row.sent_id is not None
+            }
+            for row in result[0].rows
+        ]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка выборки заданий для напоминаний: {e}")
+        return []
+
+
+# Запись уведомлений со счетчиком непрочитанных. Уже записанные (повтор с тем
+# же id) пропускаются. Ожидает параметры $notification_rows и $sent.
+_NOTIFICATIONS_INSERT_DECLARE = """
+    DECLARE $notification_rows AS List<Struct<
+        id: Utf8, user_id: Utf8, title: Utf8, message: Utf8, type: Utf8>>;
+    DECLARE $sent AS Bool;
+"""
+_NOTIFICATIONS_INSERT_YQL = """
+    $new_notifications = (
+        SELECT r.* FROM AS_TABLE($notification_rows) AS r
+        LEFT ONLY JOIN Notifications AS n ON n.id = r.id
+    );
+    
+    UPSERT INTO Notifications
+    SELECT id, user_id, title, message, type,
+           false AS is_read,
+           CurrentUtcTimestamp() AS created_at,
+           IF($sent, CurrentUtcTimestamp()) AS sent_at
+    FROM $new_notifications;
+    
+    UPDATE Users ON
+    SELECT u.telegram_id AS telegram_id,
+           COALESCE(u.unread_notifications, 0) + CAST(c.added AS Int32) AS unread_notifications
+    FROM (SELECT user_id, COUNT(*) AS added FROM $new_notifications GROUP BY user_id) AS c
+    JOIN Users AS u ON u.telegram_id = c.user_id;
+"""
+
+
+def _notification_rows(notifications):
+    """Строки для $notification_rows."""
+    return [
+        {
+            'id': n['id'],
+            'user_id': str(n['user_id']),
+            'title': n['title'],
+            'message': n['message'],
+            'type': n.get('type', 'general')
+        }
+        for n in notifications
+    ]
+
+
+def create_notifications_bulk(notifications, sent=False):
+    """Записать пачку уведомлений одним UPSERT.
+    
+    Уже записанные (повтор с тем же id) не перезаписываются; для новых в той же
+    транзакции увеличивается Users.unread_notifications получателей.
+    
+    Args:
+        notifications (list): dict с ключами id, user_id, title, message, type
+        sent (bool): уведомления уже доставлены (проставляется sent_at)
+    
+    Returns:
+        bool: успешность записи
+    """
+    if not notifications:
+        return True
+    
+    def execute(session):
+        prepared_query = session.prepare(_NOTIFICATIONS_INSERT_DECLARE + _NOTIFICATIONS_INSERT_YQL)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query,
+            {
+                '$notification_rows': _notification_rows(notifications),
+                '$sent': sent
+            },
+            commit_tx=True
+        )
+        return True
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка массовой записи уведомлений: {e}")
+        return False
+
+
+def get_pending_digest_notifications(types, window_minutes, now_hm, limit=5000):
+    """Неотправленные уведомления получателей, которым пора отправить сводку.
+    
+    Читает idx_notifications_pending (sent_at IS NULL). Получатели, чье
+    старое уведомление ждет меньше окна сводки или у кого сейчас (now_hm,
+    'HH:MM') нерабочее время, отсеиваются в запросе до LIMIT: их накопившиеся
+    уведомления не вытесняют тех, кому сводку можно отправить.
+    
+    Returns:
+        list: dict с полями уведомления и настроек, по получателям
+    """
+    def execute(session):
+        query_text = """
+            DECLARE $types AS List<Utf8>;
+            DECLARE $window AS Int32;
+            DECLARE $now_hm AS Utf8;
+            DECLARE $default_start AS Utf8;
+            DECLARE $default_end AS Utf8;
+            DECLARE $limit AS Uint64;
+            
+            $pending = (
+                SELECT id, user_id, type, title, message, created_at
+                FROM Notifications VIEW idx_notifications_pending
+                WHERE sent_at IS NULL AND type IN $types
+            );
+            
+            $recipients = (
+                SELECT f.user_id AS user_id,
+                       COALESCE(s.work_hours_start, $default_start) AS work_start,
+                       COALESCE(s.work_hours_end, $default_end) AS work_end
+                FROM (
+                    SELECT user_id, MIN(created_at) AS first_at FROM $pending GROUP BY user_id
+                ) AS f
+                LEFT JOIN NotificationSettings AS s ON s.user_id = f.user_id
+                WHERE f.first_at <= CurrentUtcTimestamp() - DateTime::IntervalFromMinutes($window)
+            );
+            
+            $ready = (
+                SELECT user_id FROM $recipients
+                WHERE IF(work_start <= work_end,
+                         work_start <= $now_hm AND $now_hm < work_end,
+                         $now_hm >= work_start OR $now_hm < work_end)
+            );
+            
+            SELECT n.id AS id, n.user_id AS user_id, n.type AS type,
+                   n.title AS title, n.message AS message,
+                   s.general_notifications AS general_notifications,
+                   s.task_reminders AS task_reminders,
+                   s.schedule_updates AS schedule_updates,
+                   s.rating_notifications AS rating_notifications
+            FROM $pending AS n
+            JOIN $ready AS r ON r.user_id = n.user_id
+            LEFT JOIN NotificationSettings AS s ON s.user_id = n.user_id
+            ORDER BY n.user_id, n.created_at
+            LIMIT $limit;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query,
+            {
+                '$types': list(types),
+                '$window': window_minutes,
+                '$now_hm': now_hm,
+                '$default_start': DEFAULT_WORK_HOURS[0],
+                '$default_end': DEFAULT_WORK_HOURS[1],
+                '$limit': limit
+            },
+            commit_tx=True
+        )
+        
+        def flag(value):
+            return value if value is not None else True
+        
+        return [
+            {
+                'id': safe_decode(row.id),
+                'user_id': safe_decode(row.user_id),
+                'type': safe_decode(row.type),
+                'title': safe_decode(row.title),
+                'message': safe_decode(row.message),
+                'general_notifications': flag(row.general_notifications),
+                'task_reminders': flag(row.task_reminders),
+                'schedule_updates': flag(row.schedule_updates),
+                'rating_notifications': flag(row.rating_notifications)
+            }
+            for row in result[0].rows
+        ]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка выборки уведомлений для сводок: {e}")
+        return []
+
+
+def mark_notifications_sent(notification_ids):
+    """Проставить sent_at доставленным уведомлениям одним запросом."""
+    if not notification_ids:
+        return True
+    
+    def execute(session):
+        query_text = """
+            DECLARE $ids AS List<Utf8>;
+            UPDATE Notifications SET sent_at = CurrentUtcTimestamp()
+            WHERE id IN $ids;
+        """
+        prepared_query = session.prepare(query_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, {'$ids': list(notification_ids)}, commit_tx=True
+        )
+        return True
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка отметки отправленных уведомлений: {e}")
+        return False
+
+
+def get_broadcast_progress(key):
+    """Контрольная точка рассылки по ключу (None, если рассылки еще не было).
+    
+    Returns:
+        dict: key, title, text, role, after, stats, done
+    """
+    def execute(session):
+        query_text = """
+            DECLARE $key AS Utf8;
+            SELECT key, title, text, role, after_id, stats, done
+            FROM BroadcastProgress WHERE key = $key;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {'$key': key}, commit_tx=True
+        )
+        rows = result[0].rows
+        return _broadcast_progress(rows[0]) if rows else None
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка чтения прогресса рассылки: {e}")
+        return None
+
+
+def get_unfinished_broadcasts(stale_seconds, limit=10):
+    """Рассылки, прерванные до конца списка получателей (самые старые первыми).
+    
+    Берутся только не обновлявшиеся stale_seconds: рассылку, которую еще
+    ведет webhook-вызов, не подхватываем.
+    """
+    def execute(session):
+        query_text = """
+            DECLARE $stale AS Int32;
+            DECLARE $limit AS Uint64;
+            SELECT key, title, text, role, after_id, stats, done, created_at
+            FROM BroadcastProgress
+            WHERE done = false
+              AND updated_at < CurrentUtcTimestamp() - DateTime::IntervalFromSeconds($stale)
+            ORDER BY created_at
+            LIMIT $limit;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {'$stale': stale_seconds, '$limit': limit}, commit_tx=True
+        )
+        return [_broadcast_progress(row) for row in result[0].rows]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка выборки незавершенных рассылок: {e}")
+        return []
+
+
+def _broadcast_progress(row):
+    return {
+        'key': safe_decode(row.key),
+        'title': safe_decode(row.title),
+        'text': safe_decode(row.text),
+        'role': safe_decode(row.role) if row.role else None,
+        'after': safe_decode(row.after_id) or "",
+        'stats': json.loads(safe_decode(row.stats) or '{}'),
+        'done': bool(row.done)
+    }
+
+
+def save_broadcast_progress(progress):
+    """Записать контрольную точку рассылки (после каждой обработанной страницы).
+    
+    Args:
+        progress (dict): key, title, text, role, after (последний обработанный
+            telegram_id), stats, done
+    
+    Returns:
+        bool: успешность записи
+    """
+    def execute(session):
+        query_text = """
+            DECLARE $key AS Utf8;
+            DECLARE $title AS Utf8;
+            DECLARE $text AS Utf8;
+            DECLARE $role AS Utf8?;
+            DECLARE $after AS Utf8;
+            DECLARE $stats AS Utf8;
+            DECLARE $done AS Bool;
+            
+            UPSERT INTO BroadcastProgress
+            SELECT $key AS key, $title AS title, $text AS text, $role AS role,
+                   $after AS after_id, $stats AS stats, $done AS done,
+                   COALESCE(b.created_at, CurrentUtcTimestamp()) AS created_at,
+                   CurrentUtcTimestamp() AS updated_at
+            FROM (SELECT $key AS key) AS k
+            LEFT JOIN BroadcastProgress AS b ON b.key = k.key;
+        """
+        prepared_query = session.prepare(query_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query,
+            {
+                '$key': progress['key'],
+                '$title': progress['title'],
+                '$text': progress['text'],
+                '$role': progress['role'],
+                '$after': progress['after'],
+                '$stats': json.dumps(progress['stats']),
+                '$done': progress['done']
+            },
+            commit_tx=True
+        )
+        return True
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка записи прогресса рассылки: {e}")
+        return False
+
+
+def enqueue_outbox(messages):
+    """Поставить сообщения в очередь Outbox одним UPSERT.
+    
+    Args:
+        messages (list): dict с ключами id, chat_id, payload (JSON-строка),
+            notification_id (необязательно)
+    
+    Returns:
+        bool: успешность записи
+    """
+    if not messages:
+        return True
+    
+    def execute(session):
+        query_text = """
+            DECLARE $rows AS List<Struct<
+                id: Utf8, chat_id: Utf8, payload: Utf8, notification_id: Optional<Utf8>>>;
+            
+            -- Уже поставленные (повтор с тем же id) не сбрасываются в pending
+            UPSERT INTO Outbox
+            SELECT r.id AS id, r.chat_id AS chat_id, r.payload AS payload,
+                   r.notification_id AS notification_id,
+                   "pending" AS status,
+                   0 AS attempts,
+                   CurrentUtcTimestamp() AS next_attempt_at,
+                   CurrentUtcTimestamp() AS created_at
+            FROM AS_TABLE($rows) AS r
+            LEFT ONLY JOIN Outbox AS o ON o.id = r.id;
+        """
+        prepared_query = session.prepare(query_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query,
+            {
+                '$rows': [
+                    {
+                        'id': m['id'],
+                        'chat_id': str(m['chat_id']),
+                        'payload': m['payload'],
+                        'notification_id': m.get('notification_id')
+                    }
+                    for m in messages
+                ]
+            },
+            commit_tx=True
+        )
+        return True
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка постановки сообщений в очередь: {e}")
+        return False
+
+
+def claim_outbox_batch(limit=100, lease_seconds=60):
+    """Забрать пачку готовых к отправке сообщений.
+    
+    Выборка и продление next_attempt_at на lease_seconds - одна транзакция,
+    поэтому параллельный запуск не возьмет те же сообщения; не подтвержденные
+    (упавший запуск) снова станут доступны по истечении аренды.
+    
+    Returns:
+        list: dict с ключами id, chat_id, payload, notification_id, attempts
+    """
+    def execute(session):
+        query_text = """
+            DECLARE $limit AS Uint64;
+            DECLARE $lease AS Int32;
+            
+            $batch = (
+                SELECT id, chat_id, payload, notification_id, attempts
+                FROM Outbox VIEW idx_outbox_status_next
+                WHERE status = "pending" AND next_attempt_at <= CurrentUtcTimestamp()
+                ORDER BY next_attempt_at
+                LIMIT $limit
+            );
+            
+            SELECT * FROM $batch;
+            
+            UPDATE Outbox ON
+            SELECT id, CurrentUtcTimestamp() + DateTime::IntervalFromSeconds($lease) AS next_attempt_at
+            FROM $batch;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, {'$limit': limit, '$lease': lease_seconds}, commit_tx=True
+        )
+        return [
+            {
+                'id': safe_decode(row.id),
+                'chat_id': safe_decode(row.chat_id),
+                'payload': safe_decode(row.payload),
+                'notification_id': safe_decode(row.notification_id) if row.notification_id else None,
+                'attempts': row.attempts or 0
+            }
+            for row in result[0].rows
+        ]
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"Ошибка выборки очереди сообщений: {e}")
+        return []
 
 
-# Заглушки для функций редактирования расписания  
-def delete_schedule_item(schedule_id, admin_id):
-    """Удалить запись из расписания."""
+def complete_outbox_batch(sent, retries, failed):
+    """Записать итог отправки пачки одной транзакцией.
+    
+    Args:
+        sent (list): отправленные сообщения (dict с id и notification_id)
+        retries (list): dict с ключами id, attempts, delay (секунды), error
+        failed (list): dict с ключами id, attempts, error, notification_id -
+            больше не отправляются; уведомление тоже закрывается (sent_at),
+            чтобы не висеть в idx_notifications_pending
+    
+    Returns:
+        bool: успешность записи
+    """
+    if not (sent or retries or failed):
+        return True
+    
     def execute(session):
-        try:
-            print(f"DEBUG: Попытка удалить запись с ID: {schedule_id}")
-            
-            # Простой запрос без алиасов
-            select_query = """
-                SELECT Schedule.id, Schedule.user_id, Schedule.date, Schedule.type, Schedule.start_time, Schedule.end_time, Users.username
-                FROM Schedule 
-                JOIN Users ON Schedule.user_id = Users.telegram_id
-                WHERE Schedule.id = "{}" AND Schedule.status = "Активно"
-            """.format(schedule_id)
-            
-            result = session.transaction().execute(select_query, commit_tx=True)
-            
-            print(f"DEBUG: Найдено записей: {len(result[0].rows)}")
-            
-            if not result[0].rows:
-                print(f"DEBUG: Запись с ID {schedule_id} не найдена")
-                return False, "❌ Запись не найдена или уже удалена"
-            
-            row = result[0].rows[0]
-            print(f"DEBUG: Данные записи: {[repr(field) for field in row]}")
-            
-            # Получаем данные
-            schedule_id_from_db = safe_decode(row[0])
-            user_id = safe_decode(row[1])
-            date_raw = row[2]
-            task_type = safe_decode(row[3])
-            start_time = safe_decode(row[4])
-            end_time = safe_decode(row[5])
-            username = safe_decode(row[6])
-            
-            # Форматируем дату
-            if isinstance(date_raw, int) and 1 <= date_raw <= 100000:
-                from datetime import datetime, timedelta
-                epoch = datetime(1900, 1, 1)
-                actual_date = epoch + timedelta(days=date_raw - 1)
-                formatted_date = actual_date.strftime('%Y-%m-%d')
-            else:
-                formatted_date = safe_decode(date_raw)
-            
-            item_info = {
-                'id': schedule_id_from_db,
-                'user_id': user_id,
-                'date': formatted_date,
-                'type': task_type,
-                'start_time': start_time,
-                'end_time': end_time,
-                'username': username
-            }
-            
-            print(f"DEBUG: Обработанная информация о записи: {item_info}")
-            
-            # Удаляем запись из расписания (помечаем как удаленную)
-            delete_schedule_query = """
-                UPDATE Schedule 
-                SET status = "Удалено"
-                WHERE id = "{}"
-            """.format(schedule_id)
-            
-            session.transaction().execute(delete_schedule_query, commit_tx=True)
-            print(f"DEBUG: Запись помечена как удаленная")
-            
-            # ФИЗИЧЕСКИ УДАЛЯЕМ связанные задания
-            delete_tasks_query = """
-                DELETE FROM Tasks 
-                WHERE assigned_to = "{}" AND type = "{}" 
-                AND when_ LIKE "{}%"
-            """.format(user_id, task_type, formatted_date)
-            
-            session.transaction().execute(delete_tasks_query, commit_tx=True)
-            print(f"DEBUG: Связанные задания ФИЗИЧЕСКИ УДАЛЕНЫ")
-            
-            return True, item_info
-            
-        except Exception as e:
-            print(f"Ошибка удаления записи расписания: {e}")
-            import traceback
-            traceback.print_exc()
-            return False, f"Ошибка удаления: {str(e)}"
+        query_text = """
+            DECLARE $sent_ids AS List<Utf8>;
+            DECLARE $notification_ids AS List<Utf8>;
+            DECLARE $retries AS List<Struct<id: Utf8, attempts: Int32, delay: Int32, error: Utf8>>;
+            DECLARE $failed AS List<Struct<id: Utf8, attempts: Int32, error: Utf8>>;
+            
+            UPDATE Outbox SET status = "sent", sent_at = CurrentUtcTimestamp()
+            WHERE id IN $sent_ids;
+            
+            UPDATE Notifications SET sent_at = CurrentUtcTimestamp()
+            WHERE id IN $notification_ids;
+            
+            UPDATE Outbox ON
+            SELECT id, attempts,
+                   CurrentUtcTimestamp() + DateTime::IntervalFromSeconds(delay) AS next_attempt_at,
+                   error AS last_error
+            FROM AS_TABLE($retries);
+            
+            UPDATE Outbox ON
+            SELECT id, attempts, "failed" AS status, error AS last_error
+            FROM AS_TABLE($failed);
+        """
+        prepared_query = session.prepare(query_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query,
+            {
+                '$sent_ids': [m['id'] for m in sent],
+                '$notification_ids': [
+                    m['notification_id'] for m in sent + failed if m.get('notification_id')
+                ],
+                '$retries': [
+                    {'id': r['id'], 'attempts': r['attempts'], 'delay': int(r['delay']), 'error': r['error'][:500]}
+                    for r in retries
+                ],
+                '$failed': [
+                    {'id': f['id'], 'attempts': f['attempts'], 'error': f['error'][:500]}
+                    for f in failed
+                ]
+            },
+            commit_tx=True
+        )
+        return True
     
     try:
         return pool.retry_operation_sync(execute)
     except Exception as e:
-        print(f"Ошибка выполнения удаления: {e}")
-        return False, f"Ошибка выполнения: {str(e)}"
-
-
-def edit_schedule_item(schedule_id, new_date=None, new_start_time=None, new_end_time=None, admin_id=None):
-    """Редактировать запись расписания."""
-    return False, "❌ Функция в разработке"
-
+        print(f"Ошибка записи итогов очереди сообщений: {e}")
+        return False
 
 
-def get_notification_settings(user_id):
-    """Получить настройки уведомлений пользователя."""
+def create_notification(user_id, title, message, notification_type="general"):
+    """Создать уведомление для пользователя (и увеличить счетчик непрочитанных)."""
+    notification_id = str(uuid.uuid4())
+    created = create_notifications_bulk([{
+        'id': notification_id,
+        'user_id': user_id,
+        'title': title,
+        'message': message,
+        'type': notification_type
+    }])
+    return notification_id if created else None
+
+
+def get_settled_schedule_changes(quiet_minutes, limit=5000):
+    """Накопленные изменения расписания пользователей, которые перестали меняться.
+    
+    Пользователь попадает в выборку, если его последнее изменение старше
+    quiet_minutes: правки одной сессии (импорт, серия удалений) сливаются.
+    
+    Returns:
+        list: dict с ключами user_id, date, type, start_time, end_time, delta
+    """
     def execute(session):
-        try:
-            query = """
-                SELECT user_id, general_notifications, task_reminders, 
-                       schedule_updates, rating_notifications
-                FROM NotificationSettings 
-                WHERE user_id = "{}"
-            """.format(str(user_id))
-            
-            result = session.transaction().execute(query, commit_tx=True)
-            
-            if result[0].rows:
-                row = result[0].rows[0]
-                return {
-                    'user_id': safe_decode(row[0]),
-                    'general_notifications': bool(row[1]) if row[1] is not None else True,
-                    'task_reminders': bool(row[2]) if row[2] is not None else True,
-                    'schedule_updates': bool(row[3]) if row[3] is not None else True,
-                    'rating_notifications': bool(row[4]) if row[4] is not None else True
-                }
-            else:
-                # Создаем настройки по умолчанию
-                create_query = """
-                    UPSERT INTO NotificationSettings 
-                    (user_id, general_notifications, task_reminders, 
-                     schedule_updates, rating_notifications)
-                    VALUES ("{}", {}, {}, {}, {})
-                """.format(str(user_id), True, True, True, True)
-                
-                session.transaction().execute(create_query, commit_tx=True)
-                
-                return {
-                    'user_id': str(user_id),
-                    'general_notifications': True,
-                    'task_reminders': True,
-                    'schedule_updates': True,
-                    'rating_notifications': True
-                }
-        except Exception as e:
-            print(f"Ошибка получения настроек уведомлений: {e}")
-            return None
+        query_text = """
+            DECLARE $quiet AS Int32;
+            DECLARE $limit AS Uint64;
+            
+            $settled = (
+                SELECT user_id FROM ScheduleChanges
+                GROUP BY user_id
+                HAVING MAX(updated_at) <= CurrentUtcTimestamp() - DateTime::IntervalFromMinutes($quiet)
+            );
+            
+            SELECT c.user_id AS user_id, c.date AS date, c.type AS type,
+                   c.start_time AS start_time, c.end_time AS end_time, c.delta AS delta
+            FROM ScheduleChanges AS c
+            JOIN $settled AS s ON s.user_id = c.user_id
+            ORDER BY user_id, date, start_time
+            LIMIT $limit;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {'$quiet': quiet_minutes, '$limit': limit}, commit_tx=True
+        )
+        return [
+            {
+                'user_id': safe_decode(row.user_id),
+                'date': ydb_date(row.date),
+                'type': safe_decode(row.type),
+                'start_time': safe_decode(row.start_time),
+                'end_time': safe_decode(row.end_time),
+                'delta': row.delta or 0
+            }
+            for row in result[0].rows
+        ]
     
     try:
         return pool.retry_operation_sync(execute)
     except Exception as e:
-        print(f"Ошибка получения настроек уведомлений: {e}")
-        return None
+        print(f"Ошибка выборки изменений расписания: {e}")
+        return []
 
 
-def get_user_notifications(user_id, limit=20):
-    """Получить уведомления пользователя."""
+def consume_schedule_changes(changes, notifications):
+    """Записать уведомления и списать обработанные изменения одной транзакцией.
+    
+    Из ScheduleChanges вычитается ровно обработанная дельта: изменение,
+    пришедшее между чтением и записью, останется для следующего запуска.
+    
+    Args:
+        changes (list): строки из get_settled_schedule_changes
+        notifications (list): уведомления (как для create_notifications_bulk)
+    
+    Returns:
+        bool: успешность записи
+    """
+    if not changes:
+        return True
+    
     def execute(session):
-        try:
-            query = """
-                SELECT id, title, message, type, is_read, created_at
-                FROM Notifications 
-                WHERE user_id = "{}"
-                ORDER BY created_at DESC
-                LIMIT {}
-            """.format(str(user_id), limit)
-            
-            result = session.transaction().execute(query, commit_tx=True)
-            
-            notifications = []
-            for row in result[0].rows:
-                notifications.append({
-                    'id': safe_decode(row[0]),
-                    'title': safe_decode(row[1]),
-                    'message': safe_decode(row[2]),
-                    'type': safe_decode(row[3]),
-                    'is_read': bool(row[4]) if row[4] is not None else False,
-                    'created_at': safe_decode(row[5])
-                })
-            
-            return notifications
-            
-        except Exception as e:
-            print(f"Ошибка получения уведомлений: {e}")
-            return []
+        query_text = _SCHEDULE_CHANGES_DECLARE + _NOTIFICATIONS_INSERT_DECLARE + """
+            $left = (
+                SELECT c.user_id AS user_id, c.date AS date, c.type AS type,
+                       c.start_time AS start_time, c.end_time AS end_time,
+                       c.delta - p.delta AS delta, c.updated_at AS updated_at
+                FROM AS_TABLE($change_rows) AS p
+                JOIN ScheduleChanges AS c
+                    ON c.user_id = p.user_id AND c.date = p.date AND c.type = p.type
+                   AND c.start_time = p.start_time AND c.end_time = p.end_time
+            );
+            
+            DELETE FROM ScheduleChanges ON
+            SELECT user_id, date, type, start_time, end_time FROM $left WHERE delta = 0;
+            
+            UPSERT INTO ScheduleChanges
+            SELECT * FROM $left WHERE delta != 0;
+        """ + _NOTIFICATIONS_INSERT_YQL
+        prepared_query = session.prepare(query_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query,
+            {
+                '$change_rows': [
+                    {
+                        'user_id': c['user_id'],
+                        'date': c['date'],
+                        'type': c['type'],
+                        'start_time': c['start_time'],
+                        'end_time': c['end_time'],
+                        'delta': c['delta']
+                    }
+                    for c in changes
+                ],
+                '$notification_rows': _notification_rows(notifications),
+                '$sent': False
+            },
+            commit_tx=True
+        )
+        return True
     
     try:
         return pool.retry_operation_sync(execute)
     except Exception as e:
-        print(f"Ошибка получения уведомлений: {e}")
-        return []
+        print(f"Ошибка записи уведомлений об изменениях расписания: {e}")
+        return False
 
 
-def update_notification_settings(user_id, settings):
-    """Обновить настройки уведомлений пользователя."""
+def get_unread_notifications_count(user_id):
+    """Число непрочитанных уведомлений - точечное чтение счетчика из Users."""
     def execute(session):
-        try:
-            query = """
-                UPSERT INTO NotificationSettings 
-                (user_id, general_notifications, task_reminders, 
-                 schedule_updates, rating_notifications)
-                VALUES ("{}", {}, {}, {}, {})
-            """.format(
-                str(user_id),
-                settings.get('general_notifications', True),
-                settings.get('task_reminders', True),
-                settings.get('schedule_updates', True),
-                settings.get('rating_notifications', True)
-            )
-            
-            session.transaction().execute(query, commit_tx=True)
-            return True
-            
-        except Exception as e:
-            print(f"Ошибка обновления настроек уведомлений: {e}")
-            return False
+        query_text = """
+            DECLARE $user_id AS Utf8;
+            SELECT unread_notifications FROM Users WHERE telegram_id = $user_id;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {'$user_id': str(user_id)}, commit_tx=True
+        )
+        if result[0].rows:
+            return max(result[0].rows[0].unread_notifications or 0, 0)
+        return 0
     
     try:
         return pool.retry_operation_sync(execute)
     except Exception as e:
-        print(f"Ошибка обновления настроек уведомлений: {e}")
-        return False
+        print(f"Ошибка чтения счетчика уведомлений: {e}")
+        return 0
 
 
-def create_notification(user_id, title, message, notification_type="general"):
-    """Создать уведомление для пользователя."""
+def mark_all_notifications_read(user_id):
+    """Отметить все непрочитанные уведомления пользователя прочитанными.
+    
+    Непрочитанные берутся диапазоном idx_notifications_user_created по user_id,
+    счетчик Users.unread_notifications обнуляется в той же транзакции.
+    
+    Returns:
+        int: сколько уведомлений отмечено этим вызовом
+    """
     def execute(session):
-        try:
-            import uuid
+        query_text = """
+            DECLARE $user_id AS Utf8;
             
-            notification_id = str(uuid.uuid4())
+            $unread = (
+                SELECT id FROM Notifications VIEW idx_notifications_user_created
+                WHERE user_id = $user_id
+                  AND (is_read IS NULL OR is_read = false)
+            );
             
-            query = """
-                UPSERT INTO Notifications 
-                (id, user_id, title, message, type, is_read, created_at)
-                VALUES ("{}", "{}", "{}", "{}", "{}", {}, Timestamp("{}"))
-            """.format(
-                notification_id,
-                str(user_id),
-                title.replace('"', '\"'),
-                message.replace('"', '\"'),
-                notification_type,
-                False,
-                get_ydb_timestamp()
-            )
+            SELECT COUNT(*) AS marked FROM $unread;
             
-            session.transaction().execute(query, commit_tx=True)
-            return notification_id
+            UPDATE Notifications ON
+            SELECT id, true AS is_read FROM $unread;
             
-        except Exception as e:
-            print(f"Ошибка создания уведомления: {e}")
-            return None
+            UPDATE Users SET unread_notifications = 0
+            WHERE telegram_id = $user_id;
+        """
+        prepared_query = session.prepare(query_text)
+        result = session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, {'$user_id': str(user_id)}, commit_tx=True
+        )
+        return result[0].rows[0].marked if result[0].rows else 0
     
     try:
         return pool.retry_operation_sync(execute)
     except Exception as e:
-        print(f"Ошибка создания уведомления: {e}")
-        return None
-
+        print(f"Ошибка отметки прочитанных уведомлений: {e}")
+        return 0
 
 
 def get_quality_report():
-    """Получить отчет по качеству работы."""
+    """Получить отчет по качеству работы (по счетчикам из Users)."""
     def execute(session):
         try:
-            # Отчет по качеству - средние рейтинги по пользователям
+            # Счетчики ведет update_task_status, задачи не пересчитываются
             query = """
-                SELECT u.username, u.role,
-                       COUNT(t.id) as total_tasks,
-                       AVG(CAST(t.rating AS Double)) as avg_rating,
-                       AVG(CAST(t.time_spent AS Double)) as avg_time,
-                       COUNT(CASE WHEN t.status = 'Выполнено' THEN 1 END) as completed_tasks
-                FROM Users u
-                LEFT JOIN Tasks t ON u.telegram_id = t.assigned_to
-                WHERE t.rating IS NOT NULL AND t.rating > 0 AND t.status != "Отменено"
-                GROUP BY u.username, u.role
-                ORDER BY avg_rating DESC, total_tasks DESC
+                SELECT username, role,
+                       COALESCE(tasks_count, 0) AS completed_tasks,
+                       COALESCE(tasks_count, 0) + COALESCE(active_tasks_count, 0) AS total_tasks,
+                       average_rating, COALESCE(delays_count, 0) AS delays
+                FROM Users
+                WHERE rated_count > 0
+                ORDER BY average_rating DESC, total_tasks DESC
             """
             
-            result = session.transaction().execute(query, commit_tx=True)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(query, commit_tx=True)
             
             quality_data = []
             for row in result[0].rows:
                 quality_data.append({
-                    'username': safe_decode(row[0]),
-                    'role': safe_decode(row[1]),
-                    'total_tasks': int(row[2]) if row[2] else 0,
-                    'avg_rating': float(row[3]) if row[3] else 0.0,
-                    'avg_time': float(row[4]) if row[4] else 0.0,
-                    'completed_tasks': int(row[5]) if row[5] else 0
+                    'username': safe_decode(row['username']),
+                    'role': safe_decode(row['role']),
+                    'total_tasks': int(row.total_tasks) if row.total_tasks else 0,
+                    'avg_rating': float(row.average_rating) if row.average_rating else 0.0,
+                    'completed_tasks': int(row.completed_tasks) if row.completed_tasks else 0,
+                    'delays': int(row.delays) if row.delays else 0
                 })
             
             return quality_data
@@ -1283,14 +3373,14 @@ def get_time_report():
                        AVG(CAST(time_spent AS Double)) as avg_time,
                        MIN(CAST(time_spent AS Double)) as min_time,
                        MAX(CAST(time_spent AS Double)) as max_time,
-                       COUNT(CASE WHEN time_spent > 60 THEN 1 END) as long_tasks
-                FROM Tasks 
+                       COUNT_IF(time_spent > 60) as long_tasks
+                FROM Tasks VIEW idx_tasks_status_completed
                 WHERE status = 'Выполнено' AND time_spent IS NOT NULL AND time_spent > 0
                 GROUP BY type
                 ORDER BY avg_time DESC
             """
             
-            result = session.transaction().execute(query, commit_tx=True)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(query, commit_tx=True)
             
             time_data = []
             for row in result[0].rows:
@@ -1321,17 +3411,20 @@ def get_tasks_report():
     def execute(session):
         try:
             # Отчет по типам задач - статистика выполнения
-            query = """
+            query = session.prepare("""
+                DECLARE $statuses AS List<Utf8>;
                 SELECT type, status,
                        COUNT(*) as count,
                        AVG(CAST(rating AS Double)) as avg_rating
-                FROM Tasks 
-                WHERE status != "Отменено"
+                FROM Tasks VIEW idx_tasks_status_completed
+                WHERE status IN $statuses
                 GROUP BY type, status
                 ORDER BY type, status
-            """
+            """)
             
-            result = session.transaction().execute(query, commit_tx=True)
+            result = session.transaction(ydb.OnlineReadOnly()).execute(
+                query, {'$statuses': VISIBLE_TASK_STATUSES}, commit_tx=True
+            )
             
             # Группируем данные по типам
             tasks_data = {}
@@ -1399,13 +3492,10 @@ def get_general_report():
             stats['total_users'] = total_users
             
             # Статистика задач
-            tasks_query = """
-                SELECT status, COUNT(*) as count
-                FROM Tasks 
-                WHERE status != "Отменено"
-                GROUP BY status
-            """
-            tasks_result = session.transaction().execute(tasks_query, commit_tx=True)
+            tasks_query = session.prepare(_TASKS_BY_STATUS_QUERY)
+            tasks_result = session.transaction(ydb.OnlineReadOnly()).execute(
+                tasks_query, {'$statuses': VISIBLE_TASK_STATUSES}, commit_tx=True
+            )
             
             stats['tasks'] = {}
             total_tasks = 0
@@ -1437,13 +3527,16 @@ def get_general_report():
             stats['total_schedule'] = total_schedule
             
             # Средний рейтинг системы
-            rating_query = """
+            rating_query = session.prepare("""
+                DECLARE $statuses AS List<Utf8>;
                 SELECT AVG(CAST(rating AS Double)) as avg_rating,
                        COUNT(*) as rated_tasks
-                FROM Tasks 
-                WHERE rating IS NOT NULL AND rating > 0 AND status != "Отменено"
-            """
-            rating_result = session.transaction().execute(rating_query, commit_tx=True)
+                FROM Tasks VIEW idx_tasks_status_completed
+                WHERE status IN $statuses AND rating IS NOT NULL AND rating > 0
+            """)
+            rating_result = session.transaction(ydb.OnlineReadOnly()).execute(
+                rating_query, {'$statuses': VISIBLE_TASK_STATUSES}, commit_tx=True
+            )
             
             if rating_result[0].rows:
                 row = rating_result[0].rows[0]
@@ -1661,6 +3754,143 @@ def delete_all_canceled_tasks():
         return 0
 
 
+def archive_schedule(batch_size=500, deadline=None):
+    """Перенести прошедшие и удаленные записи Schedule в ScheduleArchive.
+
+    Проходит таблицу один раз по первичному ключу; каждая пачка
+    копируется и удаляется в одной транзакции.
+
+    Args:
+        batch_size (int): размер пачки
+        deadline (float, optional): time.monotonic(), после которого
+            остановиться (остаток заберет следующий запуск)
+
+    Returns:
+        int: количество перенесенных записей
+    """
+    cutoff = datetime.now().date() - timedelta(days=SCHEDULE_ARCHIVE_AFTER_DAYS)
+
+    select_text = """
+        DECLARE $cutoff AS Date;
+        DECLARE $last_id AS Utf8;
+        DECLARE $limit AS Uint64;
+        SELECT id FROM Schedule
+        WHERE id > $last_id AND (date < $cutoff OR status = "Удалено")
+        ORDER BY id
+        LIMIT $limit;
+    """
+    move_text = """
+        DECLARE $ids AS List<Utf8>;
+        UPSERT INTO ScheduleArchive
+        SELECT s.id AS id, s.user_id AS user_id, s.date AS date, s.type AS type,
+               s.start_time AS start_time, s.end_time AS end_time, s.status AS status,
+               s.created_by AS created_by, s.created_at AS created_at,
+               CurrentUtcTimestamp() AS archived_at
+        FROM Schedule AS s
+        WHERE s.id IN $ids;
+        DELETE FROM Schedule WHERE id IN $ids;
+    """
+
+    def select_batch(session, last_id):
+        prepared_query = session.prepare(select_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query,
+            {'$cutoff': cutoff, '$last_id': last_id, '$limit': batch_size},
+            commit_tx=True
+        )
+        return [safe_decode(row.id) for row in result[0].rows]
+
+    def move_batch(session, ids):
+        prepared_query = session.prepare(move_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, {'$ids': ids}, commit_tx=True
+        )
+
+    moved = 0
+    last_id = ""
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            ids = pool.retry_operation_sync(select_batch, None, last_id)
+            if not ids:
+                break
+            pool.retry_operation_sync(move_batch, None, ids)
+            moved += len(ids)
+            last_id = ids[-1]
+            if len(ids) < batch_size:
+                break
+    except Exception as e:
+        print(f"Ошибка архивации расписания: {e}")
+
+    if moved:
+        _bump_schedule_version()
+    print(f"🗄️ В архив перенесено записей расписания: {moved}")
+    return moved
+
+
+def purge_read_notifications(batch_size=1000, deadline=None):
+    """Удалить прочитанные уведомления старше NOTIFICATION_RETENTION_DAYS.
+
+    Непрочитанные не трогаются: их учитывает Users.unread_notifications, а
+    неотправленные еще ждут сводки. Как archive_schedule, проходит таблицу
+    один раз по первичному ключу пачками.
+
+    Args:
+        batch_size (int): размер пачки
+        deadline (float, optional): time.monotonic(), после которого
+            остановиться (остаток заберет следующий запуск)
+
+    Returns:
+        int: количество удаленных уведомлений
+    """
+    select_text = """
+        DECLARE $retention_days AS Int32;
+        DECLARE $last_id AS Utf8;
+        DECLARE $limit AS Uint64;
+        SELECT id FROM Notifications
+        WHERE id > $last_id AND is_read = true
+          AND created_at < CurrentUtcTimestamp() - DateTime::IntervalFromDays($retention_days)
+        ORDER BY id
+        LIMIT $limit;
+    """
+    delete_text = """
+        DECLARE $ids AS List<Utf8>;
+        DELETE FROM Notifications WHERE id IN $ids;
+    """
+
+    def select_batch(session, last_id):
+        prepared_query = session.prepare(select_text)
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query,
+            {'$retention_days': NOTIFICATION_RETENTION_DAYS, '$last_id': last_id, '$limit': batch_size},
+            commit_tx=True
+        )
+        return [safe_decode(row.id) for row in result[0].rows]
+
+    def delete_batch(session, ids):
+        prepared_query = session.prepare(delete_text)
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            prepared_query, {'$ids': ids}, commit_tx=True
+        )
+
+    purged = 0
+    last_id = ""
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            ids = pool.retry_operation_sync(select_batch, None, last_id)
+            if not ids:
+                break
+            pool.retry_operation_sync(delete_batch, None, ids)
+            purged += len(ids)
+            last_id = ids[-1]
+            if len(ids) < batch_size:
+                break
+    except Exception as e:
+        print(f"Ошибка очистки уведомлений: {e}")
+
+    print(f"🧹 Удалено прочитанных уведомлений: {purged}")
+    return purged
+
+
 def cleanup():
     """Очистка ресурсов."""
     try:
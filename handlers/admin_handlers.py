@@ -141,12 +141,14 @@ def handle_admin_schedule_view_all(user_id, message_id, api: TelegramAPI):
 
 def handle_admin_schedule_add(user_id, message_id, api: TelegramAPI):
     """Добавление записи в расписание"""
+    from task_catalog import get_catalog
+    catalog = get_catalog()
     keyboard = [
-        [{'text': '🍽️ Обеды', 'callback_data': 'admin_schedule_add_Обеды'}],
-        [{'text': '🧹 Уборка', 'callback_data': 'admin_schedule_add_Уборка'}],
-        [{'text': '🔢 Пересчеты', 'callback_data': 'admin_schedule_add_Пересчеты'}],
-        [{'text': '◀️ Назад', 'callback_data': 'admin_schedule'}]
+        [{'text': f'{catalog.emoji(category)} {category}', 'callback_data': f'admin_schedule_add_{category}'}]
+        for category in catalog.categories
+        if len(f'admin_schedule_add_{category}'.encode('utf-8')) <= 64
     ]
+    keyboard.append([{'text': '◀️ Назад', 'callback_data': 'admin_schedule'}])
     return api.edit_message(
         user_id,
         message_id,
@@ -156,6 +158,29 @@ def handle_admin_schedule_add(user_id, message_id, api: TelegramAPI):
     )
 
 
+def handle_admin_schedule_import(user_id, message_id, api: TelegramAPI):
+    """Инструкция по импорту расписания из файла"""
+    message = (
+        "📥 *Импорт расписания*\n\n"
+        "Отправьте боту файл *.csv* или *.xlsx* с колонками:\n"
+        "`дата; время; тип; исполнитель; детали`\n\n"
+        "Пример строки:\n"
+        "`22.07.2025; 12:00-13:00; Обеды; @username;`\n\n"
+        "Строки с ошибками и пересечениями будут пропущены."
+    )
+    return api.edit_message(
+        user_id,
+        message_id,
+        message,
+        reply_markup={
+            'inline_keyboard': [[
+                {'text': '◀️ К упр. расписанием', 'callback_data': 'admin_schedule'}
+            ]]
+        },
+        parse_mode='Markdown'
+    )
+
+
 def handle_admin_callback(user_id, message_id, query_id, callback_data, api: TelegramAPI):
     """Роутер для админских callback'ов"""
     api.answer_callback_query(query_id)
@@ -177,6 +202,11 @@ def handle_admin_callback(user_id, message_id, query_id, callback_data, api: Tel
         return handle_admin_schedule_view_all(user_id, message_id, api)
     elif callback_data == 'admin_schedule_add':
         return handle_admin_schedule_add(user_id, message_id, api)
+    elif callback_data == 'admin_schedule_import':
+        return handle_admin_schedule_import(user_id, message_id, api)
+    elif callback_data == 'admin_schedule_export':
+        from .schedule_handlers import handle_schedule_export
+        return handle_schedule_export(user_id, api)
 
     # Процесс создания записи в расписании
     elif callback_data.startswith('admin_schedule_add_'):
@@ -244,3 +274,5 @@ def handle_admin_callback(user_id, message_id, query_id, callback_data, api: Tel
             message_text,
             parse_mode='Markdown'
         )
+
+    return handle_admin_menu_callback(user_id, message_id, api)
@@ -7,20 +7,12 @@ handlers/callback_router.py
 """
 
 import logging
+import re
 import database as bd
 
 logger = logging.getLogger(__name__)
 
 
-def get_task_type_emoji(task_type):
-    """Возвращает эмодзи для типа задачи"""
-    return {
-        "Обеды": "🍽️",
-        "Уборка": "🧹", 
-        "Пересчеты": "🔢"
-    }.get(task_type, "📋")
-
-
 def handle_callback_query(user_id, callback_data, message_id, query_id, api):
     """Главный обработчик callback queries - ОТЛАДОЧНАЯ ВЕРСИЯ"""
     
@@ -57,8 +49,7 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
         elif callback_data == 'profile':
             logger.info("👤 Обработка callback: profile")
             try:
-                from .main_handlers import get_or_create_user_sync
-                user = get_or_create_user_sync(user_id)
+                user = bd.get_or_create_user(user_id)
                 
                 if user:
                     admin_text = "\n👑 *Статус:* Администратор" if is_admin else ""
@@ -77,6 +68,9 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
 ⭐ *Средний рейтинг:* {avg_rating:.1f}
 💎 *Качество работы:* {quality_score:.1f}
 🆔 *ID:* {user_id}"""
+                    
+                    from .schedule_handlers import get_upcoming_schedule_block
+                    message += get_upcoming_schedule_block(user_id)
                 else:
                     message = (f"👤 *Профиль*\n\n"
                               f"❌ Ошибка получения данных\n"
@@ -109,7 +103,9 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
                     message_id,
                     ("🏠 *Главное меню*\n\n"
                      "Используйте кнопки внизу для навигации."),
-                    reply_markup=get_main_menu_keyboard(is_admin),
+                    reply_markup=get_main_menu_keyboard(
+                        is_admin, bd.get_unread_notifications_count(user_id)
+                    ),
                     parse_mode='Markdown'
                 )
                 logger.info(f"🏠 Результат edit_message: success={success}")
@@ -122,7 +118,7 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
         elif callback_data == 'tasks':
             logger.info("📄 Обработка callback: tasks")
             try:
-                from .main_handlers import get_tasks_menu
+                from .keyboards import get_tasks_menu
                 success, result = api.edit_message(
                     user_id,
                     message_id,
@@ -136,17 +132,30 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
                 logger.error(f"❌ Ошибка в tasks callback: {e}")
                 return False, str(e)
         
-        elif callback_data == 'my_tasks':
-            logger.info("📝 Обработка callback: my_tasks")
-            return handle_my_tasks_callback(user_id, message_id, api)
+        elif callback_data == 'my_tasks' or callback_data.startswith('my_tasks_'):
+            logger.info(f"📝 Обработка callback: {callback_data}")
+            return handle_my_tasks_callback(
+                user_id, message_id, api, *_parse_page(callback_data)
+            )
         
-        elif callback_data == 'pending_tasks':
-            logger.info("⏳ Обработка callback: pending_tasks")
-            return handle_pending_tasks_callback(user_id, message_id, api, is_admin)
+        elif callback_data == 'pending_tasks' or callback_data.startswith('pending_tasks_'):
+            logger.info(f"⏳ Обработка callback: {callback_data}")
+            return handle_pending_tasks_callback(
+                user_id, message_id, api, is_admin, *_parse_page(callback_data)
+            )
         
-        elif callback_data == 'completed_tasks':
-            logger.info("✅ Обработка callback: completed_tasks")
-            return handle_completed_tasks_callback(user_id, message_id, api, is_admin)
+        elif callback_data == 'completed_tasks' or callback_data.startswith('completed_tasks_'):
+            logger.info(f"✅ Обработка callback: {callback_data}")
+            return handle_completed_tasks_callback(
+                user_id, message_id, api, is_admin, *_parse_page(callback_data)
+            )
+        
+        elif callback_data.startswith('task_'):
+            logger.info(f"📋 Обработка callback карточки задания: {callback_data}")
+            from .task_handlers import handle_task_action
+            return handle_task_action(
+                user_id, message_id, query_id, callback_data, api
+            )
         
         # Расписание
         elif callback_data == 'schedule':
@@ -166,9 +175,12 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
                 logger.error(f"❌ Ошибка в schedule callback: {e}")
                 return False, str(e)
         
-        elif callback_data in ['schedule_meals', 'schedule_cleaning', 'schedule_counting']:
+        elif callback_data.startswith('schedule_'):
             logger.info(f"🗓️ Обработка callback расписания: {callback_data}")
-            return handle_schedule_type_callback(user_id, message_id, callback_data, api)
+            from .schedule_handlers import handle_schedule_callback
+            return handle_schedule_callback(
+                user_id, message_id, query_id, callback_data, api
+            )
         
         # Отчеты
         elif callback_data == 'reports':
@@ -206,6 +218,13 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
                 logger.error(f"❌ Ошибка в notifications callback: {e}")
                 return False, str(e)
         
+        elif callback_data.startswith('notifications_'):
+            logger.info(f"🔔 Обработка callback уведомлений: {callback_data}")
+            from .notification_handlers import handle_notification_callback
+            return handle_notification_callback(
+                user_id, message_id, query_id, callback_data, api
+            )
+        
         # Админские функции
         elif callback_data == 'admin' and is_admin:
             logger.info("👑 Обработка callback: admin")
@@ -224,6 +243,13 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
                 logger.error(f"❌ Ошибка в admin callback: {e}")
                 return False, str(e)
         
+        elif callback_data.startswith('admin_') and is_admin:
+            logger.info(f"👑 Обработка админского callback: {callback_data}")
+            from .admin_handlers import handle_admin_callback
+            return handle_admin_callback(
+                user_id, message_id, query_id, callback_data, api
+            )
+        
         elif callback_data.startswith('admin') and not is_admin:
             logger.warning(
                 f"🚫 Неавторизованная попытка доступа к админке от {user_id}"
@@ -271,25 +297,26 @@ def handle_callback_query(user_id, callback_data, message_id, query_id, api):
             return False, "Critical error in callback handler"
 
 
-def handle_my_tasks_callback(user_id, message_id, api):
+def _parse_page(callback_data):
+    """
+    Номер страницы и курсор из callback_data вида '<список>_<n|b><N>_<id задания>'
+
+    Для списка без страницы (и старых кнопок '<список>_p<N>') — первая страница.
+    """
+    match = re.search(r'_([nb])(\d+)_([^_]+)$', callback_data)
+    if not match:
+        return 0, None
+    direction, page, task_id = match.groups()
+    return int(page), (direction, task_id)
+
+
+def handle_my_tasks_callback(user_id, message_id, api, page=0, cursor=None):
     """Обработка просмотра моих задач"""
-    logger.info(f"📝 handle_my_tasks_callback для {user_id}")
+    logger.info(f"📝 handle_my_tasks_callback для {user_id}, страница {page}")
     
     try:
-        # Заглушка - просто возвращаем сообщение
-        success, result = api.edit_message(
-            user_id,
-            message_id,
-            ("📝 *Ваши задания*\n\n"
-             "❌ Функция в разработке\n\n"
-             "_Подключение к базе данных..._"),
-            reply_markup={
-                'inline_keyboard': [[
-                    {'text': '◀️ К заданиям', 'callback_data': 'tasks'}
-                ]]
-            },
-            parse_mode='Markdown'
-        )
+        from .task_handlers import handle_my_tasks
+        success, result = handle_my_tasks(user_id, message_id, api, page, cursor)
         logger.info(f"📝 Результат: success={success}")
         return success, result
     except Exception as e:
@@ -297,31 +324,15 @@ def handle_my_tasks_callback(user_id, message_id, api):
         return False, str(e)
 
 
-def handle_pending_tasks_callback(user_id, message_id, api, is_admin):
+def handle_pending_tasks_callback(user_id, message_id, api, is_admin, page=0, cursor=None):
     """Обработка просмотра ожидающих задач"""
     logger.info(
-        f"⏳ handle_pending_tasks_callback для {user_id}, админ: {is_admin}"
+        f"⏳ handle_pending_tasks_callback для {user_id}, админ: {is_admin}, страница {page}"
     )
     
     try:
-        if is_admin:
-            title = "⏳ *Все ожидающие задания*"
-        else:
-            title = "⏳ *Ваши ожидающие задания*"
-            
-        success, result = api.edit_message(
-            user_id,
-            message_id,
-            (f"{title}\n\n"
-             f"❌ Функция в разработке\n\n"
-             f"_Подключение к базе данных..._"),
-            reply_markup={
-                'inline_keyboard': [[
-                    {'text': '◀️ К заданиям', 'callback_data': 'tasks'}
-                ]]
-            },
-            parse_mode='Markdown'
-        )
+        from .task_handlers import handle_pending_tasks
+        success, result = handle_pending_tasks(user_id, message_id, api, page, cursor)
         logger.info(f"⏳ Результат: success={success}")
         return success, result
     except Exception as e:
@@ -329,67 +340,17 @@ def handle_pending_tasks_callback(user_id, message_id, api, is_admin):
         return False, str(e)
 
 
-def handle_completed_tasks_callback(user_id, message_id, api, is_admin):
+def handle_completed_tasks_callback(user_id, message_id, api, is_admin, page=0, cursor=None):
     """Обработка просмотра выполненных задач"""
     logger.info(
-        f"✅ handle_completed_tasks_callback для {user_id}, админ: {is_admin}"
+        f"✅ handle_completed_tasks_callback для {user_id}, админ: {is_admin}, страница {page}"
     )
     
     try:
-        if is_admin:
-            title = "✅ *Все выполненные задания*"
-        else:
-            title = "✅ *Ваши выполненные задания*"
-            
-        success, result = api.edit_message(
-            user_id,
-            message_id,
-            (f"{title}\n\n"
-             f"❌ Функция в разработке\n\n"
-             f"_Подключение к базе данных..._"),
-            reply_markup={
-                'inline_keyboard': [[
-                    {'text': '◀️ К заданиям', 'callback_data': 'tasks'}
-                ]]
-            },
-            parse_mode='Markdown'
-        )
+        from .task_handlers import handle_completed_tasks
+        success, result = handle_completed_tasks(user_id, message_id, api, page, cursor)
         logger.info(f"✅ Результат: success={success}")
         return success, result
     except Exception as e:
         logger.error(f"❌ Ошибка в handle_completed_tasks_callback: {e}")
         return False, str(e)
-
-
-def handle_schedule_type_callback(user_id, message_id, callback_data, api):
-    """Обработка выбора типа расписания"""
-    logger.info(f"🗓️ handle_schedule_type_callback: {callback_data}")
-    
-    type_mapping = {
-        'schedule_meals': 'Обеды',
-        'schedule_cleaning': 'Уборка', 
-        'schedule_counting': 'Пересчеты'
-    }
-    
-    schedule_type = type_mapping.get(callback_data, 'Неизвестно')
-    type_emoji = get_task_type_emoji(schedule_type)
-    
-    try:
-        success, result = api.edit_message(
-            user_id,
-            message_id,
-            (f"{type_emoji} *{schedule_type}*\n\n"
-             f"❌ Функция в разработке\n\n"
-             f"_Подключение к базе данных..._"),
-            reply_markup={
-                'inline_keyboard': [[
-                    {'text': '◀️ К расписанию', 'callback_data': 'schedule'}
-                ]]
-            },
-            parse_mode='Markdown'
-        )
-        logger.info(f"🗓️ Результат: success={success}")
-        return success, result
-    except Exception as e:
-        logger.error(f"❌ Ошибка в handle_schedule_type_callback: {e}")
-        return False, str(e)
\ No newline at end of file
@@ -9,12 +9,26 @@ handlers/keyboards.py
 """
 
 
-def get_main_menu_keyboard(is_admin=False):
+def notifications_button_text(unread=0):
+    """
+    Подпись кнопки уведомлений со счетчиком непрочитанных
+    
+    Args:
+        unread (int): Число непрочитанных уведомлений
+        
+    Returns:
+        str: "🔔 Уведомления" или "🔔 Уведомления (N)"
+    """
+    return f"🔔 Уведомления ({unread})" if unread else "🔔 Уведомления"
+
+
+def get_main_menu_keyboard(is_admin=False, unread=0):
     """
     Возвращает главное inline-меню бота
     
     Args:
         is_admin (bool): Является ли пользователь администратором
+        unread (int): Число непрочитанных уведомлений для подписи кнопки
         
     Returns:
         dict: Inline клавиатура для главного меню
@@ -24,7 +38,7 @@ def get_main_menu_keyboard(is_admin=False):
         [{'text': '📄 Задания', 'callback_data': 'tasks'}],
         [{'text': '🗓️ Расписание', 'callback_data': 'schedule'}],
         [{'text': '📊 Отчеты', 'callback_data': 'reports'}],
-        [{'text': '🔔 Уведомления', 'callback_data': 'notifications'}],
+        [{'text': notifications_button_text(unread), 'callback_data': 'notifications'}],
         [{'text': '👤 Профиль', 'callback_data': 'profile'}],
     ]
     
@@ -34,12 +48,13 @@ def get_main_menu_keyboard(is_admin=False):
     return {'inline_keyboard': keyboard}
 
 
-def get_reply_keyboard(is_admin=False):
+def get_reply_keyboard(is_admin=False, unread=0):
     """
     Возвращает reply-клавиатуру (кнопки внизу экрана)
     
     Args:
         is_admin (bool): Является ли пользователь администратором
+        unread (int): Число непрочитанных уведомлений для подписи кнопки
         
     Returns:
         dict: Reply клавиатура
@@ -48,14 +63,14 @@ def get_reply_keyboard(is_admin=False):
         keyboard = [
             ['🔍 Найти', '📄 Задания'],
             ['🗓️ Расписание', '📊 Отчеты'],
-            ['🔔 Уведомления', '👤 Профиль'],
+            [notifications_button_text(unread), '👤 Профиль'],
             ['👑 Администрация']
         ]
     else:
         keyboard = [
             ['🔍 Найти', '📄 Задания'],
             ['🗓️ Расписание', '📊 Отчеты'],
-            ['🔔 Уведомления', '👤 Профиль']
+            [notifications_button_text(unread), '👤 Профиль']
         ]
     
     return {
@@ -101,6 +116,70 @@ def get_tasks_menu(is_admin=False):
     return {'inline_keyboard': keyboard}
 
 
+def get_tasks_page_keyboard(prefix, page, has_next, task_buttons=None, first_id=None, last_id=None):
+    """
+    Возвращает клавиатуру постраничного списка заданий
+    
+    Args:
+        prefix (str): callback_data списка (my_tasks, pending_tasks, ...)
+        page (int): Номер текущей страницы (с нуля)
+        has_next (bool): Есть ли следующая страница
+        task_buttons (list, optional): Пары (номер, id задания) для открытия карточек
+        first_id (str, optional): id первого задания страницы — курсор для ◀️
+        last_id (str, optional): id последнего задания страницы — курсор для ▶️
+        
+    Returns:
+        dict: Inline клавиатура с навигацией по страницам
+    """
+    keyboard = []
+    buttons = [
+        {'text': str(number), 'callback_data': f'task_view_{task_id}'}
+        for number, task_id in (task_buttons or [])
+    ]
+    for i in range(0, len(buttons), 5):
+        keyboard.append(buttons[i:i + 5])
+    
+    nav_row = []
+    if page > 0 and first_id:
+        nav_row.append({'text': '◀️', 'callback_data': f'{prefix}_b{page - 1}_{first_id}'})
+    if has_next and last_id:
+        nav_row.append({'text': '▶️', 'callback_data': f'{prefix}_n{page + 1}_{last_id}'})
+    
+    if nav_row:
+        keyboard.append(nav_row)
+    keyboard.append([{'text': '◀️ К заданиям', 'callback_data': 'tasks'}])
+    return {'inline_keyboard': keyboard}
+
+
+def get_task_card_keyboard(task_id, status, is_assignee=False, is_admin=False, has_photo=False):
+    """
+    Возвращает клавиатуру карточки задания с доступными переходами статуса
+    
+    Args:
+        task_id (str): ID задания
+        status (str): Текущий статус
+        is_assignee (bool): Пользователь - исполнитель задания
+        is_admin (bool): Является ли пользователь администратором
+        has_photo (bool): К заданию приложено фото-подтверждение
+        
+    Returns:
+        dict: Inline клавиатура карточки задания
+    """
+    keyboard = []
+    if is_assignee or is_admin:
+        if status == 'Ожидающее':
+            keyboard.append([{'text': '▶️ Начать', 'callback_data': f'task_start_{task_id}'}])
+        elif status == 'В работе':
+            keyboard.append([{'text': '✅ Выполнено', 'callback_data': f'task_done_{task_id}'}])
+    if is_admin and status in ('Ожидающее', 'В работе'):
+        keyboard.append([{'text': '❌ Отменить', 'callback_data': f'task_cancel_{task_id}'}])
+    if has_photo and (is_assignee or is_admin):
+        keyboard.append([{'text': '📸 Фото', 'callback_data': f'task_photo_{task_id}'}])
+    
+    keyboard.append([{'text': '◀️ К заданиям', 'callback_data': 'tasks'}])
+    return {'inline_keyboard': keyboard}
+
+
 def get_schedule_menu():
     """
     Возвращает меню просмотра расписания
@@ -108,14 +187,17 @@ def get_schedule_menu():
     Returns:
         dict: Inline клавиатура меню расписания
     """
-    return {
-        'inline_keyboard': [
-            [{'text': '🍽️ Обеды', 'callback_data': 'schedule_meals'}],
-            [{'text': '🧹 Уборка', 'callback_data': 'schedule_cleaning'}],
-            [{'text': '🔢 Пересчеты', 'callback_data': 'schedule_counting'}],
-            [{'text': '◀️ Назад', 'callback_data': 'back_main'}],
-        ]
-    }
+    from task_catalog import get_catalog, category_code
+    
+    catalog = get_catalog()
+    keyboard = [[{'text': '📅 Мое расписание', 'callback_data': 'schedule_my'}]]
+    keyboard += [
+        [{'text': f'{catalog.emoji(category)} {category}',
+          'callback_data': f'schedule_type_{category_code(category)}'}]
+        for category in catalog.categories
+    ]
+    keyboard.append([{'text': '◀️ Назад', 'callback_data': 'back_main'}])
+    return {'inline_keyboard': keyboard}
 
 
 def get_admin_menu():
@@ -147,6 +229,8 @@ def get_admin_schedule_menu():
             [{'text': '👀 Просмотр всех записей', 'callback_data': 'admin_schedule_view_all'}],
             [{'text': '🟢 Добавить запись', 'callback_data': 'admin_schedule_add'}],
             [{'text': '🗑️ Удалить записи', 'callback_data': 'admin_schedule_delete'}],
+            [{'text': '📥 Импорт из файла', 'callback_data': 'admin_schedule_import'}],
+            [{'text': '📤 Экспорт в CSV', 'callback_data': 'admin_schedule_export'}],
             [{'text': '🍽️ Просмотр обедов', 'callback_data': 'admin_schedule_view_meals'}],
             [{'text': '🧹 Просмотр уборки', 'callback_data': 'admin_schedule_view_cleaning'}],
             [{'text': '🔢 Просмотр пересчетов', 'callback_data': 'admin_schedule_view_counting'}],
@@ -166,14 +250,14 @@ def get_notifications_menu(is_admin=False):
         dict: Inline клавиатура меню уведомлений
     """
     keyboard = [
-        [{'text': '📱 Мои уведомления', 'callback_data': 'my_notifications'}],
-        [{'text': '⚙️ Настройки', 'callback_data': 'notification_settings'}],
+        [{'text': '📱 Мои уведомления', 'callback_data': 'notifications_my'}],
+        [{'text': '⚙️ Настройки', 'callback_data': 'notifications_settings'}],
     ]
     
     if is_admin:
         keyboard.extend([
-            [{'text': '📢 Отправить всем', 'callback_data': 'send_notification_all'}],
-            [{'text': '🎯 Отправить по роли', 'callback_data': 'send_notification_role'}],
+            [{'text': '📢 Отправить всем', 'callback_data': 'notifications_send_all'}],
+            [{'text': '🎯 Отправить по роли', 'callback_data': 'notifications_send_role'}],
         ])
     
     keyboard.append([{'text': '◀️ Назад', 'callback_data': 'back_main'}])
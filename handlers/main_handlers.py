@@ -30,10 +30,13 @@ def handle_start_command(user_id, username, first_name, api: TelegramAPI):
     
     admin_text = '👑 У вас есть права администратора!' if is_admin else ''
     
+    from .schedule_handlers import get_upcoming_schedule_block
+    schedule_block = get_upcoming_schedule_block(user_id)
+    
     welcome_text = f"""🤖 *Добро пожаловать, {first_name}!*
 
 *Ваша роль:* {role}
-{admin_text}
+{admin_text}{schedule_block}
 
 Выберите раздел из меню ниже:"""
     
@@ -41,7 +44,7 @@ def handle_start_command(user_id, username, first_name, api: TelegramAPI):
     return api.send_message(
         user_id,
         welcome_text,
-        reply_markup=get_reply_keyboard(is_admin)
+        reply_markup=get_reply_keyboard(is_admin, db.get_unread_notifications_count(user_id))
     )
 
 
@@ -49,6 +52,7 @@ def handle_cancel_command(user_id, api: TelegramAPI):
     """Обработка команды /cancel"""
     
     user_states[user_id] = 'main'
+    db.set_user_state(user_id, 'main')
     is_admin = db.is_admin(user_id)
     
     # Очищаем состояния
@@ -58,7 +62,7 @@ def handle_cancel_command(user_id, api: TelegramAPI):
     return api.send_message(
         user_id,
         "❌ Операция отменена. Используйте кнопки меню ниже.",
-        reply_markup=get_reply_keyboard(is_admin)
+        reply_markup=get_reply_keyboard(is_admin, db.get_unread_notifications_count(user_id))
     )
 
 
@@ -108,7 +112,7 @@ def handle_search_text(user_id, text, api: TelegramAPI):
     return api.send_message(
         user_id,
         message,
-        reply_markup=get_main_menu_keyboard(is_admin)
+        reply_markup=get_main_menu_keyboard(is_admin, db.get_unread_notifications_count(user_id))
     )
 
 
@@ -136,6 +140,9 @@ def handle_profile_text(user_id, api: TelegramAPI):
 ⭐ *Средний рейтинг:* {avg_rating:.1f}
 💎 *Качество работы:* {quality_score:.1f}
 🆔 *ID:* {user_id}"""
+        
+        from .schedule_handlers import get_upcoming_schedule_block
+        message += get_upcoming_schedule_block(user_id)
     else:
         message = f"""👤 *Профиль*
 
@@ -150,6 +157,23 @@ def handle_profile_text(user_id, api: TelegramAPI):
     )
 
 
+def handle_document_message(user_id, username, document, api: TelegramAPI):
+    """Обработчик присланных файлов (импорт расписания для админов)"""
+    
+    if not db.is_admin(user_id):
+        return api.send_message(user_id, "❌ Загрузка файлов доступна только администраторам.")
+    
+    from .schedule_handlers import handle_schedule_import_document
+    return handle_schedule_import_document(user_id, document, api)
+
+
+def handle_photo_message(user_id, username, photos, api: TelegramAPI):
+    """Обработчик фото (подтверждение выполнения задания)"""
+    
+    from .task_handlers import handle_task_photo
+    return handle_task_photo(user_id, photos, api)
+
+
 def handle_text_message(user_id, username, text, api: TelegramAPI):
     """Главный обработчик текстовых сообщений"""
     
@@ -163,6 +187,20 @@ def handle_text_message(user_id, username, text, api: TelegramAPI):
     elif text == "/cancel":
         return handle_cancel_command(user_id, api)
     
+    elif text == "/export_schedule":
+        if not is_admin:
+            return api.send_message(user_id, "❌ У вас нет прав администратора.")
+        from .schedule_handlers import handle_schedule_export
+        return handle_schedule_export(user_id, api)
+    
+    elif text.startswith("/recount_progress"):
+        from .task_handlers import handle_recount_progress_command
+        return handle_recount_progress_command(user_id, api)
+    
+    elif text.startswith("/recount"):
+        from .task_handlers import handle_recount_command
+        return handle_recount_command(user_id, text, api)
+    
     # Обработка кнопок меню
     elif '🔍 Найти' in text or text == 'Найти':
         user_states[user_id] = 'search'
@@ -225,6 +263,12 @@ def handle_text_message(user_id, username, text, api: TelegramAPI):
         from .schedule_handlers import handle_schedule_details_input
         return handle_schedule_details_input(user_id, text, api)
     
+    # Состояния, сохраненные в YDB (выставляются из callback'ов)
+    db_state, db_data = db.get_user_state(user_id)
+    if db_state.startswith('notifications_send_'):
+        from .notification_handlers import handle_text_message_notification
+        return handle_text_message_notification(user_id, text, db_state, db_data, api)
+    
     # Для остальных сообщений - подсказка
     return api.send_message(
         user_id,
@@ -10,6 +10,7 @@ import logging
 from .utils import TelegramAPI, is_admin, get_role_emoji
 import database as db
 from .keyboards import get_notifications_menu
+from broadcast import broadcast
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +41,9 @@ def handle_notifications_menu_callback(user_id, message_id, api: TelegramAPI):
 def handle_my_notifications(user_id, message_id, api: TelegramAPI):
     """Обработка просмотра уведомлений пользователя"""
     notifications = db.get_user_notifications(user_id, 10)
+    # Экран открыт - все непрочитанные (и не попавшие в последние 10) прочитаны,
+    # счетчик в Users обнуляется тем же запросом
+    db.mark_all_notifications_read(user_id)
     
     if notifications:
         message = "📱 *Ваши уведомления* (последние 10)\n\n"
@@ -61,18 +65,28 @@ def handle_my_notifications(user_id, message_id, api: TelegramAPI):
     )
 
 
+# Кнопки настроек: ключ в callback_data -> (флаг NotificationSettings, подпись)
+SETTING_TOGGLES = {
+    'general': ('general_notifications', "Общие"),
+    'task': ('task_reminders', "О задачах"),
+    'schedule': ('schedule_updates', "О расписании"),
+    'rating': ('rating_notifications', "О рейтинге"),
+}
+
+
 def handle_notification_settings(user_id, message_id, api: TelegramAPI):
     """Обработка настроек уведомлений"""
     settings = db.get_notification_settings(user_id)
     
     if settings:
+        # В callback_data - целевое значение, а не "переключить": повторное
+        # нажатие (или повторная доставка) не возвращает настройку обратно
         keyboard = [
-            [{'text': f"{'✅' if settings.get('general_notifications', True) else '❌'} Общие", 'callback_data': 'notifications_toggle_general'}],
-            [{'text': f"{'✅' if settings.get('task_reminders', True) else '❌'} О задачах", 'callback_data': 'notifications_toggle_task'}],
-            [{'text': f"{'✅' if settings.get('schedule_updates', True) else '❌'} О расписании", 'callback_data': 'notifications_toggle_schedule'}],
-            [{'text': f"{'✅' if settings.get('rating_notifications', True) else '❌'} О рейтинге", 'callback_data': 'notifications_toggle_rating'}],
-            [{'text': '◀️ К уведомлениям', 'callback_data': 'notifications'}]
+            [{'text': f"{'✅' if settings.get(flag, True) else '❌'} {label}",
+              'callback_data': f"notifications_toggle_{key}_{0 if settings.get(flag, True) else 1}"}]
+            for key, (flag, label) in SETTING_TOGGLES.items()
         ]
+        keyboard.append([{'text': '◀️ К уведомлениям', 'callback_data': 'notifications'}])
         message = "⚙️ *Настройки уведомлений*\n\nНажмите на настройку для изменения:"
     else:
         keyboard = [[{'text': '◀️ К уведомлениям', 'callback_data': 'notifications'}]]
@@ -85,6 +99,40 @@ def handle_notification_settings(user_id, message_id, api: TelegramAPI):
     )
 
 
+def _send_broadcast(user_id, text, role, api: TelegramAPI):
+    """Рассылка и отчет отправителю о доставке"""
+    if not is_admin(user_id):
+        db.set_user_state(user_id, 'main', {})
+        return api.send_message(user_id, "❌ Нет прав")
+    
+    # Состояние сбрасываем до рассылки: повторная доставка того же
+    # сообщения не запустит рассылку второй раз
+    db.set_user_state(user_id, 'main', {})
+    
+    target = f"роли *{role}*" if role else "всем"
+    stats = broadcast("Уведомление", text, role=role)
+    
+    message = (f"✅ *Рассылка {target} поставлена в очередь*\n\n"
+               f"👥 Получателей: {stats['recipients']}\n"
+               f"📬 В очереди на отправку: {stats['queued']}\n"
+               f"🌙 Вне рабочих часов (придет сводкой): {stats['deferred']}\n"
+               f"🔕 Общие уведомления выключены: {stats['muted']}")
+    if not stats['done']:
+        message += "\n\n⏳ Оставшиеся получатели будут обработаны автоматически"
+    return api.send_message(user_id, message, parse_mode='Markdown')
+
+
+def handle_send_notification_all_text(user_id, text, api: TelegramAPI):
+    """Отправка введенного текста всем пользователям"""
+    return _send_broadcast(user_id, text, None, api)
+
+
+def handle_send_notification_role_text(user_id, text, state, api: TelegramAPI):
+    """Отправка введенного текста пользователям роли (роль - суффикс состояния)"""
+    role = state.rsplit('_', 1)[-1]
+    return _send_broadcast(user_id, text, role, api)
+
+
 def handle_text_message_notification(user_id, text, state, data, api: TelegramAPI):
     """Обработка ввода текста для отправки уведомлений"""
     if text.lower() == '/cancel':
@@ -93,16 +141,11 @@ def handle_text_message_notification(user_id, text, state, data, api: TelegramAP
 
     # Отправка всем
     if state == 'notifications_send_all':
-        # Здесь должна быть логика отправки всем
-        db.set_user_state(user_id, 'main', {})
-        return api.send_message(user_id, f"✅ Уведомление отправлено всем!\n\n_{text}_", parse_mode='Markdown')
+        return handle_send_notification_all_text(user_id, text, api)
         
     # Отправка по роли
     elif state.startswith('notifications_send_role_'):
-        role = state.replace('notifications_send_role_', '')
-        # Здесь должна быть логика отправки по роли
-        db.set_user_state(user_id, 'main', {})
-        return api.send_message(user_id, f"✅ Уведомление отправлено роли *{role}*!\n\n_{text}_", parse_mode='Markdown')
+        return handle_send_notification_role_text(user_id, text, state, api)
     
     return api.send_message(user_id, "Неизвестное действие.")
 
@@ -133,14 +176,16 @@ def handle_notification_callback(user_id, message_id, query_id, callback_data, a
         return api.edit_message(user_id, message_id, "🎯 Выберите роль для отправки:", reply_markup={'inline_keyboard': keyboard})
 
     elif callback_data.startswith('notifications_select_role_'):
+        if not is_admin(user_id): return api.edit_message(user_id, message_id, "❌ Нет прав")
         role = callback_data.replace('notifications_select_role_', '')
         db.set_user_state(user_id, f'notifications_send_role_{role}')
         return api.edit_message(user_id, message_id, f"🎯 Введите сообщение для роли *{role}*:", parse_mode='Markdown')
 
     elif callback_data.startswith('notifications_toggle_'):
-        setting_name = callback_data.replace('notifications_toggle_', '')
-        # Здесь должна быть логика переключения настроек
-        return handle_notification_settings(user_id, message_id, api) # Просто обновляем меню
+        key, _, value = callback_data.replace('notifications_toggle_', '').partition('_')
+        if key in SETTING_TOGGLES and value in ('0', '1'):
+            db.set_notification_flag(user_id, SETTING_TOGGLES[key][0], value == '1')
+        return handle_notification_settings(user_id, message_id, api)
 
     # Если мы здесь, значит это 'notifications' - главное меню раздела
     return handle_notifications_menu_callback(user_id, message_id, api)
@@ -50,7 +50,10 @@ def handle_quality_report(user_id, message_id, api: TelegramAPI):
             username = user['username'].replace('_', '\\_')
             message += f"{i+1}. {role_emoji} *@{username}*\n"
             message += f"   Рейтинг: {stars} ({user.get('avg_rating', 0):.1f}/5)\n"
-            message += f"   Задач: {user.get('completed_tasks', 0)}/{user.get('total_tasks', 0)}\n\n"
+            message += f"   Задач: {user.get('completed_tasks', 0)}/{user.get('total_tasks', 0)}\n"
+            if user.get('delays'):
+                message += f"   ⏰ Просрочек: {user['delays']}\n"
+            message += "\n"
         
         message += f"📊 *Всего проанализировано:* {len(quality_data)} сотрудников"
     else:
@@ -6,12 +6,17 @@ handlers/schedule_handlers.py
 Хендлеры для работы с расписанием
 """
 
+import csv
+import io
 import logging
 import re
+import time
+import zipfile
 from datetime import datetime, timedelta
 from .utils import TelegramAPI, get_task_type_emoji
 import database as db
 from .keyboards import get_schedule_menu
+from task_catalog import get_catalog, category_code
 
 logger = logging.getLogger(__name__)
 
@@ -37,28 +42,207 @@ def handle_schedule_menu_callback(user_id, message_id, api: TelegramAPI):
     )
 
 
-def handle_schedule_type(user_id, message_id, schedule_type, api: TelegramAPI):
-    """Обработка выбора типа расписания"""
-    schedule_items = db.get_schedule_by_type(schedule_type)
+# --- Календарь расписания ---
+
+# Прежние коды базовых типов: кнопки в уже отправленных сообщениях.
+# Остальные типы кодируются task_catalog.category_code
+SCHEDULE_TYPE_CODES = {
+    'meals': 'Обеды',
+    'cleaning': 'Уборка',
+    'counting': 'Пересчеты'
+}
+
+
+def _type_by_code(code):
+    """Тип расписания по коду из callback_data (None, если неизвестен)"""
+    return SCHEDULE_TYPE_CODES.get(code) or get_catalog().category_by_code(code)
+
+WEEKDAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+# Время жизни страниц календаря: ограничивает устаревание, если расписание
+# изменили в другом контейнере функции
+CALENDAR_CACHE_TTL = 60
+
+# (тип, понедельник недели) -> {'version', 'expires_at', 'buckets', 'pages'}
+_calendar_cache = {}
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _format_slot(item):
+    time_str = f"{item['start_time']}-{item['end_time']}"
+    return "Весь день" if time_str == "00:00-23:59" else time_str
+
+
+def _format_username(username):
+    return (username or 'Unknown').replace('_', '\\_')
+
+
+def _get_week(schedule_type, week_start):
+    """Записи недели, разложенные по дням; один запрос на неделю."""
+    now = time.monotonic()
+    version = db.get_schedule_version()
+    key = (schedule_type, week_start)
+    entry = _calendar_cache.get(key)
+    if entry and entry['version'] == version and entry['expires_at'] > now:
+        return entry
+
+    items = db.get_schedule_window(
+        schedule_type, week_start, week_start + timedelta(days=6)
+    )
+    buckets = {}
+    for item in items:
+        buckets.setdefault(item['date'], []).append(item)
+
+    if len(_calendar_cache) > 64:
+        _calendar_cache.clear()
+    entry = {
+        'version': version,
+        'expires_at': now + CALENDAR_CACHE_TTL,
+        'buckets': buckets,
+        'pages': {}
+    }
+    _calendar_cache[key] = entry
+    return entry
+
+
+def _render_week(code, schedule_type, week_start, buckets):
     type_emoji = get_task_type_emoji(schedule_type)
-    
-    if schedule_items:
-        message = f"{type_emoji} *{schedule_type}* ({len(schedule_items)})\n\n"
-        for i, item in enumerate(schedule_items[:10]):
-            time_str = f"{item['start_time']}-{item['end_time']}"
-            if time_str == "00:00-23:59": time_str = "Весь день"
-            message += f"📅 {item['date']} ({time_str}) - @{item['username']}\n"
-        if len(schedule_items) > 10:
-            message += f"\n... и еще {len(schedule_items) - 10} записей."
+    week_end = week_start + timedelta(days=6)
+    message = (f"{type_emoji} *{schedule_type}* — неделя "
+               f"{week_start.strftime('%d.%m')}–{week_end.strftime('%d.%m.%Y')}\n\n")
+
+    if buckets:
+        for offset in range(7):
+            day = week_start + timedelta(days=offset)
+            if day not in buckets:
+                continue
+            message += f"*{WEEKDAY_NAMES[offset]} {day.strftime('%d.%m')}*\n"
+            for item in buckets[day]:
+                message += f"   {_format_slot(item)} — @{_format_username(item['username'])}\n"
+            message += "\n"
     else:
-        message = f"{type_emoji} *{schedule_type}*\n\n❌ Нет записей."
-    
+        message += "❌ Нет записей на этой неделе."
+
+    today = datetime.now().date()
+    day_buttons = []
+    for offset in range(7):
+        day = week_start + timedelta(days=offset)
+        label = f"{WEEKDAY_NAMES[offset]} {day.day}"
+        if day == today:
+            label = f"• {label}"
+        day_buttons.append({
+            'text': label,
+            'callback_data': f"schedule_day_{code}_{day.strftime('%Y%m%d')}"
+        })
+
+    keyboard = [
+        day_buttons[:4],
+        day_buttons[4:],
+        [
+            {'text': '◀️', 'callback_data': f"schedule_week_{code}_{(week_start - timedelta(days=7)).strftime('%Y%m%d')}"},
+            {'text': '📅 Сегодня', 'callback_data': f"schedule_week_{code}_{_week_start(today).strftime('%Y%m%d')}"},
+            {'text': '▶️', 'callback_data': f"schedule_week_{code}_{(week_start + timedelta(days=7)).strftime('%Y%m%d')}"}
+        ],
+        [{'text': '◀️ К расписанию', 'callback_data': 'schedule'}]
+    ]
+    return message, {'inline_keyboard': keyboard}
+
+
+def _render_day(code, schedule_type, day, items):
+    type_emoji = get_task_type_emoji(schedule_type)
+    message = (f"{type_emoji} *{schedule_type}* — "
+               f"{WEEKDAY_NAMES[day.weekday()]} {day.strftime('%d.%m.%Y')}\n\n")
+
+    if items:
+        for item in items:
+            message += f"⏰ {_format_slot(item)} — @{_format_username(item['username'])}\n"
+    else:
+        message += "❌ Нет записей на этот день."
+
+    keyboard = [
+        [
+            {'text': '◀️', 'callback_data': f"schedule_day_{code}_{(day - timedelta(days=1)).strftime('%Y%m%d')}"},
+            {'text': '🗓️ Неделя', 'callback_data': f"schedule_week_{code}_{_week_start(day).strftime('%Y%m%d')}"},
+            {'text': '▶️', 'callback_data': f"schedule_day_{code}_{(day + timedelta(days=1)).strftime('%Y%m%d')}"}
+        ],
+        [{'text': '◀️ К расписанию', 'callback_data': 'schedule'}]
+    ]
+    return message, {'inline_keyboard': keyboard}
+
+
+def handle_schedule_week(user_id, message_id, code, week_start, api: TelegramAPI):
+    """Недельный вид календаря расписания"""
+    schedule_type = _type_by_code(code)
+    week = _get_week(schedule_type, week_start)
+    page = week['pages'].get('week')
+    if page is None:
+        page = _render_week(code, schedule_type, week_start, week['buckets'])
+        week['pages']['week'] = page
+
+    message, keyboard = page
+    return api.edit_message(user_id, message_id, message, reply_markup=keyboard, parse_mode='Markdown')
+
+
+def handle_schedule_day(user_id, message_id, code, day, api: TelegramAPI):
+    """Дневной вид календаря (берется из кеша недели)"""
+    schedule_type = _type_by_code(code)
+    week = _get_week(schedule_type, _week_start(day))
+    page = week['pages'].get(day)
+    if page is None:
+        page = _render_day(code, schedule_type, day, week['buckets'].get(day, []))
+        week['pages'][day] = page
+
+    message, keyboard = page
+    return api.edit_message(user_id, message_id, message, reply_markup=keyboard, parse_mode='Markdown')
+
+
+# --- Личное расписание ---
+
+def format_upcoming_schedule(items):
+    """Строки единой ленты ближайших смен пользователя (все типы)."""
+    lines = []
+    for item in items:
+        day = item['date']
+        lines.append(
+            f"📅 {day.strftime('%d.%m')} ({WEEKDAY_NAMES[day.weekday()]}) "
+            f"{get_task_type_emoji(item['type'])} {item['type']} {_format_slot(item)}"
+        )
+    return "\n".join(lines)
+
+
+def get_upcoming_schedule_block(user_id, limit=3):
+    """Короткий блок ближайших смен для /start и профиля."""
+    items = db.get_user_upcoming_schedule(user_id, limit=limit)
+    if not items:
+        return ""
+    return f"\n\n🗓️ *Ближайшие смены:*\n{format_upcoming_schedule(items)}"
+
+
+def handle_my_schedule(user_id, message_id, api: TelegramAPI):
+    """Личное расписание пользователя"""
+    items = db.get_user_upcoming_schedule(user_id, limit=20)
+
+    if items:
+        message = f"📅 *Мое расписание* ({len(items)})\n\n{format_upcoming_schedule(items)}"
+    else:
+        message = "📅 *Мое расписание*\n\n✅ Ближайших смен нет."
+
     return api.edit_message(
         user_id, message_id, message,
         reply_markup={'inline_keyboard': [[{'text': '◀️ К расписанию', 'callback_data': 'schedule'}]]},
         parse_mode='Markdown'
     )
 
+
+def handle_schedule_type(user_id, message_id, schedule_type, api: TelegramAPI):
+    """Обработка выбора типа расписания: текущая неделя"""
+    code = category_code(schedule_type)
+    week_start = _week_start(datetime.now().date())
+    return handle_schedule_week(user_id, message_id, code, week_start, api)
+
 # --- Утилиты для парсинга ---
 def parse_date_input(date_text):
     date_text = date_text.strip().lower()
@@ -127,7 +311,7 @@ def _create_schedule_from_data(user_id, data, api: TelegramAPI):
         task_type=schedule_data['type'],
         date=schedule_data['date'],
         time_slot=f"{schedule_data['start_time']}-{schedule_data['end_time']}",
-        shelves=schedule_data.get('details')
+        details=schedule_data.get('details')
     )
     db.set_user_state(user_id, 'main', {}) # Сбрасываем состояние
     
@@ -146,12 +330,253 @@ def handle_schedule_callback(user_id, message_id, query_id, callback_data, api:
     """Роутер для callback'ов расписания"""
     api.answer_callback_query(query_id)
     
-    if callback_data == 'schedule_meals':
-        return handle_schedule_type(user_id, message_id, 'Обеды', api)
-    elif callback_data == 'schedule_cleaning':
-        return handle_schedule_type(user_id, message_id, 'Уборка', api)
-    elif callback_data == 'schedule_counting':
-        return handle_schedule_type(user_id, message_id, 'Пересчеты', api)
+    if callback_data == 'schedule_my':
+        return handle_my_schedule(user_id, message_id, api)
+    elif callback_data.startswith('schedule_type_') or callback_data[len('schedule_'):] in SCHEDULE_TYPE_CODES:
+        schedule_type = _type_by_code(callback_data.rsplit('_', 1)[-1])
+        if schedule_type:
+            return handle_schedule_type(user_id, message_id, schedule_type, api)
+    elif callback_data.startswith(('schedule_week_', 'schedule_day_')):
+        view, code, day_str = callback_data.split('_')[1:]
+        day = datetime.strptime(day_str, '%Y%m%d').date()
+        if not _type_by_code(code):
+            return handle_schedule_menu_callback(user_id, message_id, api)
+        if view == 'week':
+            return handle_schedule_week(user_id, message_id, code, day, api)
+        return handle_schedule_day(user_id, message_id, code, day, api)
 
     # Если мы здесь, значит это 'schedule' - главное меню раздела
     return handle_schedule_menu_callback(user_id, message_id, api)
+
+
+# --- Импорт и экспорт расписания (CSV/XLSX) ---
+
+IMPORT_COLUMNS = {
+    'дата': 'date', 'date': 'date',
+    'время': 'time', 'time': 'time',
+    'тип': 'type', 'type': 'type',
+    'исполнитель': 'user', 'сотрудник': 'user', 'user': 'user', 'username': 'user',
+    'детали': 'details', 'стеллажи': 'details', 'details': 'details'
+}
+IMPORT_REQUIRED_COLUMNS = ('date', 'time', 'type', 'user')
+MAX_IMPORT_ROWS = 10000
+MAX_REPORTED_ERRORS = 15
+
+
+def _iter_csv_rows(buffer):
+    text = io.TextIOWrapper(buffer, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def _iter_xlsx_rows(buffer):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValueError("Импорт XLSX недоступен: не установлен openpyxl")
+    try:
+        workbook = load_workbook(buffer, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+        raise ValueError(f"файл поврежден или не является XLSX ({e})")
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d.%m.%Y')
+    return str(value).strip()
+
+
+def _normalize_time(value):
+    hours, minutes = value.split(':')
+    return f"{int(hours):02d}:{minutes}"
+
+
+def _parse_import_row(cells, columns):
+    """Проверить одну строку файла. Возвращает (запись, ошибка)."""
+    values = {}
+    for index, name in columns.items():
+        values[name] = cells[index] if index < len(cells) else None
+
+    raw_date = values['date']
+    if isinstance(raw_date, datetime):
+        parsed_date = raw_date.date()
+    else:
+        parsed_date = parse_date_input(_cell_text(raw_date)) if raw_date else None
+    if not parsed_date:
+        return None, f"неверная дата `{_cell_text(raw_date)}`"
+
+    start_time, end_time = parse_time_input(_cell_text(values['time']))
+    if not start_time:
+        return None, f"неверное время `{_cell_text(values['time'])}`"
+
+    task_type = _cell_text(values['type'])
+    categories = {category.lower(): category for category in get_catalog().categories}
+    if task_type.lower() not in categories:
+        return None, f"неизвестный тип `{task_type}`"
+    task_type = categories[task_type.lower()]
+
+    user = _cell_text(values['user']).lstrip('@')
+    if not user:
+        return None, "не указан исполнитель"
+
+    return {
+        'user': user,
+        'date': parsed_date,
+        'type': task_type,
+        'start_time': _normalize_time(start_time),
+        'end_time': _normalize_time(end_time),
+        'details': _cell_text(values.get('details')) or None
+    }, None
+
+
+def _time_minutes(value):
+    """'9:00' и '09:00' -> минуты от полуночи (в базе встречаются оба формата)"""
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _overlaps(a, b):
+    return (_time_minutes(a['start_time']) < _time_minutes(b['end_time'])
+            and _time_minutes(b['start_time']) < _time_minutes(a['end_time']))
+
+
+def handle_schedule_import_document(user_id, document, api: TelegramAPI):
+    """Импорт расписания из присланного CSV/XLSX файла (только для админов)"""
+    filename = document.get('file_name', '')
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in ('csv', 'xlsx'):
+        return api.send_message(user_id, "❌ Поддерживаются только файлы .csv и .xlsx")
+
+    success, buffer = api.download_file(document['file_id'])
+    if not success:
+        return api.send_message(user_id, f"❌ Не удалось скачать файл: {buffer}")
+
+    # 1. Построчная проверка формата
+    entries, errors = [], []
+    columns = None
+    try:
+        rows = _iter_xlsx_rows(buffer) if extension == 'xlsx' else _iter_csv_rows(buffer)
+        for row_number, cells in enumerate(rows, start=1):
+            if not any(_cell_text(c) for c in cells):
+                continue
+            if columns is None:
+                columns = {}
+                for index, title in enumerate(cells):
+                    name = IMPORT_COLUMNS.get(_cell_text(title).lower())
+                    if name:
+                        columns[index] = name
+                missing = [c for c in IMPORT_REQUIRED_COLUMNS if c not in columns.values()]
+                if missing:
+                    return api.send_message(
+                        user_id,
+                        "❌ В заголовке файла нет колонок: " + ", ".join(missing) +
+                        "\n\nОжидается: дата, время, тип, исполнитель, детали"
+                    )
+                continue
+            if len(entries) + len(errors) >= MAX_IMPORT_ROWS:
+                errors.append((row_number, f"превышен лимит {MAX_IMPORT_ROWS} строк"))
+                break
+            entry, error = _parse_import_row(cells, columns)
+            if error:
+                errors.append((row_number, error))
+            else:
+                entry['row'] = row_number
+                entries.append(entry)
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        return api.send_message(user_id, f"❌ Не удалось прочитать файл: {e}")
+
+    # 2. Один пакетный запрос на всех исполнителей
+    usernames = {e['user'] for e in entries if not e['user'].isdigit()}
+    ids = {e['user'] for e in entries if e['user'].isdigit()}
+    users = db.resolve_users(usernames, ids) if entries else {}
+
+    resolved = []
+    for entry in entries:
+        user = users.get(entry['user'].lower())
+        if not user:
+            errors.append((entry['row'], f"пользователь `{entry['user']}` не найден"))
+            continue
+        entry['user_id'] = user[0]
+        resolved.append(entry)
+
+    # 3. Конфликты: пересечения внутри файла и с уже существующими записями
+    accepted = []
+    if resolved:
+        existing = db.get_users_schedule_range(
+            {e['user_id'] for e in resolved},
+            min(e['date'] for e in resolved),
+            max(e['date'] for e in resolved)
+        )
+        busy = {}
+        for item in existing:
+            busy.setdefault((item['user_id'], item['date']), []).append(item)
+
+        for entry in resolved:
+            slots = busy.setdefault((entry['user_id'], entry['date']), [])
+            conflict = next((s for s in slots if _overlaps(entry, s)), None)
+            if conflict:
+                errors.append((
+                    entry['row'],
+                    f"пересечение с {conflict['type']} "
+                    f"{conflict['start_time']}-{conflict['end_time']}"
+                ))
+                continue
+            slots.append(entry)
+            accepted.append(entry)
+
+    # 4. Пакетная запись
+    written = db.bulk_create_schedule(accepted, created_by=user_id) if accepted else 0
+
+    message = f"📥 *Импорт расписания*\n\n✅ Добавлено записей: {written}"
+    if written < len(accepted):
+        message += f"\n⚠️ Не записано из-за ошибки БД: {len(accepted) - written}"
+    if errors:
+        message += f"\n❌ Пропущено строк: {len(errors)}\n\n"
+        for row_number, error in sorted(errors)[:MAX_REPORTED_ERRORS]:
+            message += f"Строка {row_number}: {error}\n"
+        if len(errors) > MAX_REPORTED_ERRORS:
+            message += f"... и еще {len(errors) - MAX_REPORTED_ERRORS} ошибок."
+    return api.send_message(user_id, message, parse_mode='Markdown')
+
+
+def handle_schedule_export(user_id, api: TelegramAPI):
+    """Экспорт всей таблицы расписания в CSV (формат совместим с импортом)"""
+    usernames = {u['telegram_id']: u['username'] for u in db.get_all_users()}
+
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(['дата', 'время', 'тип', 'исполнитель', 'статус'])
+    count = 0
+    try:
+        for item in db.iter_schedule_table():
+            writer.writerow([
+                item['date'].strftime('%d.%m.%Y') if item['date'] else '',
+                f"{item['start_time']}-{item['end_time']}",
+                item['type'],
+                f"@{usernames.get(item['user_id'], item['user_id'])}",
+                item['status']
+            ])
+            count += 1
+    except Exception as e:
+        logger.error(f"❌ Ошибка экспорта расписания: {e}")
+        return api.send_message(user_id, f"❌ Ошибка экспорта: {e}")
+
+    filename = f"schedule_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+    return api.send_document(
+        user_id,
+        filename,
+        output.getvalue().encode('utf-8-sig'),
+        caption=f"📤 Расписание: {count} записей"
+    )
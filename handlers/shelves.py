@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+handlers/shelves.py
+Разбор диапазонов стеллажей и разбиение их между работниками для пересчетов
+"""
+
+import re
+
+# Код стеллажа: буквенный префикс + номер (A01, Б12, AB7)
+SHELF_PATTERN = re.compile(r'^([A-Za-zА-Яа-яЁё]+)(\d+)$')
+
+# Ограничение на размер одного пересчета, чтобы опечатка вида A1-A99999
+# не превратилась в сотни тысяч строк
+MAX_SHELVES = 5000
+
+
+def _parse_shelf(code):
+    """Разбирает код стеллажа на (префикс, номер, ширина номера)"""
+    match = SHELF_PATTERN.match(code.strip())
+    if not match:
+        raise ValueError(f"Некорректный код стеллажа: {code.strip()}")
+    prefix, number = match.groups()
+    return prefix.upper(), int(number), len(number)
+
+
+def parse_shelf_range(text):
+    """
+    Разбирает перечень стеллажей в упорядоченный список кодов
+
+    Args:
+        text (str): Диапазоны и отдельные стеллажи через запятую,
+            например "A01-A40, B01-B10, C05"
+
+    Returns:
+        list: Коды стеллажей без повторов в порядке перечисления
+
+    Raises:
+        ValueError: Если диапазон или код стеллажа некорректен
+    """
+    shelves = []
+    seen = set()
+
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        if '-' in part:
+            start, _, end = part.partition('-')
+            prefix, first, width = _parse_shelf(start)
+            end_prefix, last, _ = _parse_shelf(end)
+            if prefix != end_prefix:
+                raise ValueError(f"Диапазон {part} охватывает разные ряды")
+            if last < first:
+                raise ValueError(f"Диапазон {part} задан в обратном порядке")
+            codes = (f"{prefix}{n:0{width}d}" for n in range(first, last + 1))
+        else:
+            prefix, number, width = _parse_shelf(part)
+            codes = (f"{prefix}{number:0{width}d}",)
+
+        for code in codes:
+            if code not in seen:
+                seen.add(code)
+                shelves.append(code)
+            if len(shelves) > MAX_SHELVES:
+                raise ValueError(f"Слишком много стеллажей (больше {MAX_SHELVES})")
+
+    if not shelves:
+        raise ValueError("Не указаны стеллажи")
+    return shelves
+
+
+def split_shelves(shelves, workers):
+    """
+    Делит стеллажи на непрерывные куски с разницей в размере не больше одного
+
+    Args:
+        shelves (list): Упорядоченные коды стеллажей
+        workers (int): Количество работников
+
+    Returns:
+        list: Куски (списки кодов); пустые куски не возвращаются
+    """
+    if workers <= 0:
+        return []
+
+    base, extra = divmod(len(shelves), workers)
+    chunks = []
+    start = 0
+    for i in range(min(workers, len(shelves))):
+        size = base + (1 if i < extra else 0)
+        chunks.append(shelves[start:start + size])
+        start += size
+    return chunks
+
+
+def format_shelves(shelves):
+    """
+    Сворачивает список стеллажей обратно в диапазоны: A01-A10, B01-B03, C05
+
+    Args:
+        shelves (list): Коды стеллажей
+
+    Returns:
+        str: Компактная запись для хранения и показа
+    """
+    runs = []
+    for code in shelves:
+        prefix, number, width = _parse_shelf(code)
+        if runs and runs[-1][0] == prefix and runs[-1][2] == number - 1:
+            runs[-1][2] = number
+        else:
+            runs.append([prefix, number, number, width])
+
+    parts = []
+    for prefix, first, last, width in runs:
+        if first == last:
+            parts.append(f"{prefix}{first:0{width}d}")
+        else:
+            parts.append(f"{prefix}{first:0{width}d}-{prefix}{last:0{width}d}")
+    return ", ".join(parts)
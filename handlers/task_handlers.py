@@ -7,12 +7,60 @@ handlers/task_handlers.py
 """
 
 import logging
+from datetime import datetime, timedelta
 from .utils import TelegramAPI, get_task_type_emoji, is_admin
+from .shelves import parse_shelf_range, split_shelves, format_shelves
+from config import TASK_STATUS
+from task_catalog import get_catalog
 import database as db
-from .keyboards import get_tasks_menu
+from .keyboards import get_tasks_menu, get_tasks_page_keyboard, get_task_card_keyboard
 
 logger = logging.getLogger(__name__)
 
+# Размер страницы в списках заданий
+TASKS_PAGE_SIZE = 10
+
+def _fetch_page(fetch, page, cursor=None, **kwargs):
+    """
+    Читает страницу от курсора с запасом в одну строку, чтобы понять, есть ли еще.
+
+    cursor — ('n', id) для страницы после задания id или ('b', id) для страницы
+    перед ним. Возвращает (задания, номер страницы, есть ли следующая).
+    """
+    direction, task_id = cursor or (None, None)
+    if direction == 'b' and page > 0:
+        tasks = fetch(limit=TASKS_PAGE_SIZE, before=task_id, **kwargs)
+        has_next = True
+    elif direction == 'n' and page > 0:
+        tasks = fetch(limit=TASKS_PAGE_SIZE + 1, after=task_id, **kwargs)
+        has_next = len(tasks) > TASKS_PAGE_SIZE
+    else:
+        tasks, has_next = [], False
+    if not tasks:
+        # Первая страница или курсор больше не указывает на существующее задание
+        page = 0
+        tasks = fetch(limit=TASKS_PAGE_SIZE + 1, **kwargs)
+        has_next = len(tasks) > TASKS_PAGE_SIZE
+    return tasks[:TASKS_PAGE_SIZE], page, has_next
+
+
+def _page_cursors(tasks):
+    """Курсоры соседних страниц: id первого и последнего задания"""
+    return (tasks[0]['id'], tasks[-1]['id']) if tasks else (None, None)
+
+
+def _page_suffix(page):
+    return f" — стр. {page + 1}" if page else ""
+
+
+def _task_buttons(tasks, page):
+    """Кнопки карточек для незавершенных заданий страницы"""
+    return [
+        (i, task['id'])
+        for i, task in enumerate(tasks, start=page * TASKS_PAGE_SIZE + 1)
+        if task.get('status', 'Ожидающее') in ('Ожидающее', 'В работе')
+    ]
+
 
 def handle_tasks_menu_text(user_id, api: TelegramAPI):
     """Обработка меню заданий через текст"""
@@ -37,17 +85,16 @@ def handle_tasks_menu_callback(user_id, message_id, api: TelegramAPI):
     )
 
 
-def handle_my_tasks(user_id, message_id, api: TelegramAPI):
+def handle_my_tasks(user_id, message_id, api: TelegramAPI, page=0, cursor=None):
     """Обработка просмотра моих задач"""
-    tasks = db.get_my_tasks(user_id)
+    tasks, page, has_next = _fetch_page(db.get_my_tasks, page, cursor, user_id=user_id)
     if tasks:
-        message = "📝 *Ваши задания* (последние 10)\n\n"
-        for i, task in enumerate(tasks[:10]):
-            type_emoji = get_task_type_emoji(task.get('type', ''))
+        message = f"📝 *Ваши задания*{_page_suffix(page)}\n\n"
+        for i, task in enumerate(tasks, start=page * TASKS_PAGE_SIZE + 1):
             status = task.get('status', 'Неизвестно')
             status_emoji = {"Выполнено": "✅", "Ожидающее": "⏳", "В работе": "🔄"}.get(status, "📋")
             
-            message += f"{i+1}. {status_emoji} *{task.get('type', 'Неизвестно')}* ({status.lower()})\n"
+            message += f"{i}. {status_emoji} *{task.get('type', 'Неизвестно')}* ({status.lower()})\n"
             message += f"   📅 {task.get('when_', 'Не указано')[:16]}\n"
             if task.get('rating') and task.get('rating') > 0:
                 message += f"   Оценка: {'⭐' * task['rating']} ({task['rating']}/5)\n"
@@ -55,50 +102,320 @@ def handle_my_tasks(user_id, message_id, api: TelegramAPI):
     else:
         message = "📝 *Ваши задания*\n\n❌ У вас пока нет заданий."
     
-    return api.edit_message(user_id, message_id, message, reply_markup={'inline_keyboard': [[{'text': '◀️ К заданиям', 'callback_data': 'tasks'}]]}, parse_mode='Markdown')
+    return api.edit_message(user_id, message_id, message, reply_markup=get_tasks_page_keyboard('my_tasks', page, has_next, _task_buttons(tasks, page), *_page_cursors(tasks)), parse_mode='Markdown')
 
 
-def handle_pending_tasks(user_id, message_id, api: TelegramAPI):
+def handle_pending_tasks(user_id, message_id, api: TelegramAPI, page=0, cursor=None):
     """Обработка просмотра ожидающих задач"""
     is_admin_user = is_admin(user_id)
-    tasks = db.get_pending_tasks(user_id=None if is_admin_user else user_id)
+    tasks, page, has_next = _fetch_page(db.get_pending_tasks, page, cursor, user_id=None if is_admin_user else user_id)
     title = "⏳ *Все ожидающие задания*" if is_admin_user else "⏳ *Ваши ожидающие задания*"
 
     if tasks:
-        message = f"{title} ({len(tasks)})\n\n"
-        for i, task in enumerate(tasks[:10]):
+        message = f"{title}{_page_suffix(page)}\n\n"
+        for i, task in enumerate(tasks, start=page * TASKS_PAGE_SIZE + 1):
             type_emoji = get_task_type_emoji(task.get('type', ''))
-            message += f"{i+1}. {type_emoji} *{task.get('type', 'Неизвестно')}*\n"
+            message += f"{i}. {type_emoji} *{task.get('type', 'Неизвестно')}*\n"
             if is_admin_user and task.get('username'):
                 message += f"   👤 @{task['username']}\n"
             message += f"   📅 {task.get('when_', 'Не указано')[:16]}\n"
-        if len(tasks) > 10: message += f"\n... и еще {len(tasks) - 10} заданий."
     else:
         message = f"{title}\n\n✅ Нет ожидающих заданий."
     
-    return api.edit_message(user_id, message_id, message, reply_markup={'inline_keyboard': [[{'text': '◀️ К заданиям', 'callback_data': 'tasks'}]]}, parse_mode='Markdown')
+    return api.edit_message(user_id, message_id, message, reply_markup=get_tasks_page_keyboard('pending_tasks', page, has_next, _task_buttons(tasks, page), *_page_cursors(tasks)), parse_mode='Markdown')
 
 
-def handle_completed_tasks(user_id, message_id, api: TelegramAPI):
+def handle_completed_tasks(user_id, message_id, api: TelegramAPI, page=0, cursor=None):
     """Обработка просмотра выполненных задач"""
     is_admin_user = is_admin(user_id)
-    tasks = db.get_completed_tasks(user_id=None if is_admin_user else user_id)
+    tasks, page, has_next = _fetch_page(db.get_completed_tasks, page, cursor, user_id=None if is_admin_user else user_id)
     title = "✅ *Все выполненные задания*" if is_admin_user else "✅ *Ваши выполненные задания*"
     
     if tasks:
-        message = f"{title} ({len(tasks)})\n\n"
-        for i, task in enumerate(tasks[:10]):
+        message = f"{title}{_page_suffix(page)}\n\n"
+        for i, task in enumerate(tasks, start=page * TASKS_PAGE_SIZE + 1):
             type_emoji = get_task_type_emoji(task.get('type', ''))
-            message += f"{i+1}. {type_emoji} *{task.get('type', 'Неизвестно')}*\n"
+            message += f"{i}. {type_emoji} *{task.get('type', 'Неизвестно')}*\n"
             if is_admin_user and task.get('username'):
                 message += f"   👤 @{task['username']}\n"
             if task.get('rating') and task.get('rating') > 0:
                 message += f"   Оценка: {'⭐' * task['rating']}\n"
-        if len(tasks) > 10: message += f"\n... и еще {len(tasks) - 10} заданий."
     else:
         message = f"{title}\n\n❌ Нет выполненных заданий."
     
-    return api.edit_message(user_id, message_id, message, reply_markup={'inline_keyboard': [[{'text': '◀️ К заданиям', 'callback_data': 'tasks'}]]}, parse_mode='Markdown')
+    return api.edit_message(user_id, message_id, message, reply_markup=get_tasks_page_keyboard('completed_tasks', page, has_next, *_page_cursors(tasks)), parse_mode='Markdown')
+
+
+def handle_task_view(user_id, message_id, api: TelegramAPI, task_id, notice=None):
+    """Карточка задания с кнопками доступных переходов"""
+    task = db.get_task_by_id(task_id)
+    if not task:
+        return api.edit_message(user_id, message_id, "❌ Задание не найдено", reply_markup={'inline_keyboard': [[{'text': '◀️ К заданиям', 'callback_data': 'tasks'}]]})
+    
+    status = task['status']
+    message = f"📋 *Задание*\n\n{get_task_type_emoji(task['type'])} *{task['type']}*\n"
+    message += f"{TASK_STATUS.get(status, '📋')} Статус: {status}\n"
+    if task.get('is_overdue'):
+        message += "⚠️ Просрочено\n"
+    message += f"📅 {task['when_'][:16]}\n"
+    if task.get('username'):
+        message += f"👤 @{task['username']}\n"
+    if task.get('shelves'):
+        message += f"🗄️ Стеллажи: {task['shelves']}\n"
+    if task.get('description'):
+        message += f"📝 {task['description']}\n"
+    if task.get('rating'):
+        message += f"Оценка: {'⭐' * task['rating']}\n"
+    if task.get('photo_file_id'):
+        message += "📸 Фото приложено\n"
+    if notice:
+        message += f"\n{notice}"
+    
+    keyboard = get_task_card_keyboard(
+        task['id'], status,
+        is_assignee=task['assigned_to'] == str(user_id),
+        is_admin=is_admin(user_id),
+        has_photo=bool(task.get('photo_file_id'))
+    )
+    return api.edit_message(user_id, message_id, message, reply_markup=keyboard, parse_mode='Markdown')
+
+
+# Действие кнопки карточки -> целевой статус
+TASK_ACTIONS = {
+    'start': "В работе",
+    'done': "Выполнено",
+    'cancel': "Отменено",
+}
+
+
+def handle_task_action(user_id, message_id, query_id, callback_data, api: TelegramAPI):
+    """Роутер карточки задания: task_view_<id>, task_start_<id>, task_done_<id>, task_cancel_<id>"""
+    _, action, task_id = callback_data.split('_', 2)
+    
+    if action == 'view':
+        api.answer_callback_query(query_id)
+        return handle_task_view(user_id, message_id, api, task_id)
+    
+    task = db.get_task_by_id(task_id)
+    is_admin_user = is_admin(user_id)
+    if not task or (action == 'cancel' and not is_admin_user) or (
+            task['assigned_to'] != str(user_id) and not is_admin_user):
+        api.answer_callback_query(query_id, "❌ Недостаточно прав")
+        return handle_task_view(user_id, message_id, api, task_id)
+    
+    if action == 'photo':
+        api.answer_callback_query(query_id)
+        if not task.get('photo_file_id'):
+            return handle_task_view(user_id, message_id, api, task_id)
+        return api.send_photo(user_id, task['photo_file_id'], caption=f"📸 {task['type']} — {task['when_'][:16]}")
+    
+    new_status = TASK_ACTIONS.get(action)
+    if not new_status:
+        api.answer_callback_query(query_id)
+        return handle_task_view(user_id, message_id, api, task_id)
+    
+    # Исполнитель завершает такие задания только присылая фото
+    if (action == 'done' and not is_admin_user and task['status'] == "В работе"
+            and get_catalog().requires_photo(task['type'])):
+        db.set_user_state(user_id, f"task_photo_{task_id}")
+        api.answer_callback_query(query_id)
+        return api.edit_message(
+            user_id, message_id,
+            f"📸 *Фото-подтверждение*\n\n{get_task_type_emoji(task['type'])} *{task['type']}*\n\n"
+            f"Пришлите фото выполненной работы одним сообщением.\n"
+            f"Для отмены: /cancel",
+            reply_markup={'inline_keyboard': [[{'text': '◀️ К заданию', 'callback_data': f'task_view_{task_id}'}]]},
+            parse_mode='Markdown'
+        )
+    
+    # Проверка перехода и счетчики - в одной транзакции внутри БД
+    success, notice = db.update_task_status(task_id, new_status)
+    api.answer_callback_query(query_id, notice)
+    return handle_task_view(user_id, message_id, api, task_id, notice=None if success else notice)
+
+
+def notify_assignees(tasks, template):
+    """
+    Уведомления исполнителям о новых заданиях: записи Notifications, которые
+    уйдут сводкой (jobs.notification_digest_handler) - несколько назначений
+    одному работнику придут одним сообщением. Возвращает число записанных
+    """
+    if not tasks:
+        return 0
+    
+    # id производные от id задания: повтор того же назначения не дублирует
+    notifications = [
+        {
+            'id': db.derived_id(task['id'], 'notification'),
+            'user_id': task['assigned_to'],
+            'title': f"{get_task_type_emoji(template['type'])} {template['type']}, {str(template['when_'])[:16]}",
+            'message': task['description'] + (f" ({task['shelves']})" if task.get('shelves') else ""),
+            'type': "task"
+        }
+        for task in tasks
+    ]
+    return len(notifications) if db.create_notifications_bulk(notifications) else 0
+
+
+def assign_tasks_bulk(template, assignments, created_by):
+    """
+    Назначить задание по шаблону многим исполнителям сразу
+    
+    Args:
+        template (dict): type, description, when_
+        assignments (list): dict с ключами assigned_to и shelves (необязательно)
+        created_by: telegram_id автора
+        
+    Returns:
+        tuple: (созданные задания, число записанных уведомлений)
+    """
+    if not template.get('due_at'):
+        duration = get_catalog().default_duration(template['type'])
+        template = dict(template, due_at=db.default_due_at(template['when_'], duration))
+    
+    tasks = db.create_tasks_bulk(template, assignments, created_by)
+    notified = notify_assignees(tasks, template)
+    logger.info(f"📋 Массовое назначение: создано {len(tasks)}, уведомлений {notified}")
+    return tasks, notified
+
+
+def handle_task_photo(user_id, photos, api: TelegramAPI):
+    """
+    Фото-подтверждение выполнения задания
+    
+    Сохраняется только file_id (фото не скачивается); завершение, запись фото
+    и проверка дубликата по file_unique_id выполняются одной транзакцией.
+    
+    Args:
+        photos (list): Массив PhotoSize из сообщения (последний - самый крупный)
+    """
+    state, _ = db.get_user_state(user_id)
+    if not state.startswith('task_photo_'):
+        return api.send_message(
+            user_id,
+            "📸 Фото принимается как подтверждение: откройте задание и нажмите «✅ Выполнено»."
+        )
+    
+    task_id = state[len('task_photo_'):]
+    photo = photos[-1]
+    success, notice = db.update_task_status(
+        task_id, "Выполнено",
+        photo_file_id=photo['file_id'],
+        photo_unique_id=photo.get('file_unique_id')
+    )
+    
+    if success:
+        db.set_user_state(user_id, 'main')
+        return api.send_message(
+            user_id, f"{notice}\n\nЗадание завершено, фото приложено.",
+            reply_markup={'inline_keyboard': [[{'text': '📄 Открыть', 'callback_data': f'task_view_{task_id}'}]]}
+        )
+    return api.send_message(user_id, f"{notice}\n\nПришлите другое фото или /cancel")
+
+
+RECOUNT_USAGE = ("🔢 *Пересчет*\n\n"
+                 "Формат: `/recount <стеллажи> @user1 @user2 ...`\n"
+                 "Пример: `/recount A01-A40, B01-B10 @ivan @petr`\n\n"
+                 "Стеллажи делятся между работниками поровну непрерывными кусками.")
+
+
+def handle_recount_command(user_id, text, api: TelegramAPI):
+    """Команда /recount: разбить стеллажи между работниками и создать задания"""
+    if not is_admin(user_id):
+        return api.send_message(user_id, "❌ У вас нет прав администратора.")
+    
+    # Работники - @username или числовой telegram_id, остальное - стеллажи
+    shelf_tokens, usernames, ids = [], [], []
+    for token in text.split()[1:]:
+        if token.startswith('@'):
+            usernames.append(token[1:])
+        elif token.isdigit():
+            ids.append(token)
+        else:
+            shelf_tokens.append(token)
+    
+    if not shelf_tokens or not (usernames or ids):
+        return api.send_message(user_id, RECOUNT_USAGE, parse_mode='Markdown')
+    
+    try:
+        shelves = parse_shelf_range(' '.join(shelf_tokens))
+    except ValueError as e:
+        return api.send_message(user_id, f"❌ {e}")
+    
+    found = db.resolve_users(usernames, ids)
+    workers, missing = [], []
+    for key in [u.lower() for u in usernames] + ids:
+        if key not in found:
+            missing.append(key)
+        elif found[key][0] not in workers:
+            workers.append(found[key][0])
+    
+    if missing:
+        return api.send_message(user_id, "❌ Не найдены пользователи: " + ", ".join(missing))
+    
+    chunks = split_shelves(shelves, len(workers))
+    assignments = [
+        {'assigned_to': worker, 'shelves': format_shelves(chunk)}
+        for worker, chunk in zip(workers, chunks)
+    ]
+    template = {
+        'type': "Пересчеты",
+        'description': f"Пересчет стеллажей ({len(shelves)} шт.)",
+        'when_': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    
+    tasks, notified = assign_tasks_bulk(template, assignments, user_id)
+    if not tasks:
+        return api.send_message(user_id, "⚠️ Задания пересчета не созданы (возможно, команда уже обработана)")
+    
+    names = {telegram_id: username for telegram_id, username in found.values()}
+    message = f"✅ *Пересчет назначен*\n\n🗄️ Стеллажей: {len(shelves)}\n👥 Работников: {len(tasks)}\n\n"
+    for task in tasks:
+        count = len(parse_shelf_range(task['shelves']))
+        name = names.get(task['assigned_to'], task['assigned_to']).replace('_', '\\_')
+        message += f"• @{name}: {task['shelves']} ({count})\n"
+    message += f"\n🔔 Уведомления (придут сводкой): {notified}/{len(tasks)}"
+    return api.send_message(user_id, message, parse_mode='Markdown')
+
+
+def handle_recount_progress_command(user_id, api: TelegramAPI, days=1):
+    """Команда /recount_progress: прогресс пересчетов за сутки по стеллажам"""
+    if not is_admin(user_id):
+        return api.send_message(user_id, "❌ У вас нет прав администратора.")
+    
+    now = datetime.now()
+    tasks = db.get_recount_tasks(
+        (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S'),
+        (now + timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+    )
+    if not tasks:
+        return api.send_message(user_id, "🔢 *Пересчеты*\n\nНет заданий пересчета за последние сутки.", parse_mode='Markdown')
+    
+    # Статус стеллажа - статус задания, в которое он попал (последнее назначение)
+    shelf_status = {}
+    for task in tasks:
+        if task['status'] == "Отменено":
+            continue
+        try:
+            for shelf in parse_shelf_range(task['shelves']):
+                shelf_status[shelf] = task['status']
+        except ValueError:
+            logger.warning(f"⚠️ Некорректные стеллажи у задания {task['id']}: {task['shelves']}")
+    
+    done = sum(1 for status in shelf_status.values() if status == "Выполнено")
+    total = len(shelf_status)
+    percent = done * 100 // total if total else 0
+    
+    message = f"🔢 *Прогресс пересчетов*\n\n🗄️ Пересчитано: {done}/{total} ({percent}%)\n\n"
+    for task in tasks:
+        emoji = TASK_STATUS.get(task['status'], '📋')
+        who = (task['username'] or task['assigned_to']).replace('_', '\\_')
+        message += f"{emoji} @{who}: {task['shelves']}\n"
+    
+    remaining = [shelf for shelf, status in shelf_status.items() if status != "Выполнено"]
+    if remaining:
+        message += f"\n⏳ Осталось: {format_shelves(remaining)}"
+    return api.send_message(user_id, message, parse_mode='Markdown')
 
 
 def handle_all_stats(user_id, message_id, api: TelegramAPI):
@@ -6,12 +6,138 @@ handlers/utils.py
 Утилиты для работы с Telegram API
 """
 
+import io
 import requests
 import json
 import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from config import (
+    TELEGRAM_SEND_RATE, TELEGRAM_PER_CHAT_RATE, TELEGRAM_PER_CHAT_BURST, BROADCAST_WORKERS
+)
 
 logger = logging.getLogger(__name__)
 
+# Ответ 429 с retry_after не больше этого ждем и повторяем прямо в вызове;
+# дольше - возвращаем ошибку (outbox переставит сообщение по retry_after)
+MAX_INLINE_RETRY_AFTER = 3
+MAX_INLINE_RETRIES = 2
+
+# Чатов в лимитере, после которого простаивающие записи вычищаются
+MAX_TRACKED_CHATS = 10000
+
+
+class TokenBucket:
+    """Token bucket: не больше rate событий в секунду, всплеск до capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Забрать токен; возвращает, сколько секунд подождать до его появления"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds):
+        """Не выдавать токены ближайшие seconds секунд (ответ 429)"""
+        with self._lock:
+            # Следующий reserve() получит ровно seconds ожидания
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    def idle(self):
+        """Бакет полон - запись можно выбросить без потери состояния"""
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return self._tokens + elapsed * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """Общий лимит Bot API плюс отдельный бакет на каждый чат"""
+
+    def __init__(self, rate, per_chat_rate, per_chat_burst):
+        self._global = TokenBucket(rate)
+        self._per_chat_rate = per_chat_rate
+        self._per_chat_burst = per_chat_burst
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                if len(self._chats) >= MAX_TRACKED_CHATS:
+                    self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+                bucket = TokenBucket(self._per_chat_rate, self._per_chat_burst)
+                self._chats[chat_id] = bucket
+            return bucket
+
+    def acquire(self, chat_id=None):
+        """Дождаться права на запрос; возвращает время ожидания в секундах"""
+        wait = self._global.reserve()
+        if chat_id is not None:
+            wait = max(wait, self._chat_bucket(str(chat_id)).reserve())
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds, chat_id=None, max_global=None):
+        """Пауза после 429: чат - на seconds, общий лимит - не дольше max_global"""
+        self._global.pause(seconds if max_global is None else min(seconds, max_global))
+        if chat_id is not None:
+            self._chat_bucket(str(chat_id)).pause(seconds)
+
+
+# Один лимитер и счетчики на контейнер: TelegramAPI создается на каждый вызов
+_limiter = RateLimiter(TELEGRAM_SEND_RATE, TELEGRAM_PER_CHAT_RATE, TELEGRAM_PER_CHAT_BURST)
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+# Общая HTTP-сессия: keep-alive соединения к api.telegram.org переиспользуются
+# между вызовами контейнера, пула хватает на все воркеры send_many
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=BROADCAST_WORKERS))
+
+
+def _count(**deltas):
+    with _metrics_lock:
+        _metrics.update(deltas)
+
+
+def get_send_metrics(reset=False):
+    """
+    Счетчики запросов к Bot API в этом контейнере
+    
+    Returns:
+        dict: sent, failed, throttled (ответов 429), retried, dropped
+        (сдались после 429), waited_seconds (ожидание в лимитере)
+    """
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+        if reset:
+            _metrics.clear()
+    snapshot['waited_seconds'] = round(snapshot.get('waited_seconds', 0), 2)
+    return snapshot
+
+
+def parse_retry_after(response_text):
+    """retry_after из ответа Bot API с ошибкой (None, если его нет)"""
+    try:
+        return (json.loads(response_text).get('parameters') or {}).get('retry_after')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
 class TelegramAPI:
     """Класс для работы с Telegram API"""
     
@@ -25,6 +151,43 @@ class TelegramAPI:
         self.token = token
         self.api_url = f"https://api.telegram.org/bot{token}"
     
+    def _post(self, method, chat_id=None, timeout=10, **request_kwargs):
+        """
+        POST к Bot API через общий лимитер
+        
+        Запросы в чат (chat_id) ограничены общим и поканальным лимитом.
+        На 429 лимитер приостанавливается на retry_after; короткие паузы
+        пережидаются здесь же, длинные возвращаются вызывающему как ошибка.
+        
+        Returns:
+            requests.Response: Последний ответ
+        """
+        for attempt in range(MAX_INLINE_RETRIES + 1):
+            waited = _limiter.acquire(chat_id) if chat_id is not None else 0
+            response = _session.post(
+                f"{self.api_url}/{method}", timeout=timeout, **request_kwargs
+            )
+            if response.status_code != 429:
+                _count(sent=int(response.status_code == 200),
+                       failed=int(response.status_code != 200),
+                       waited_seconds=waited)
+                return response
+            
+            retry_after = parse_retry_after(response.text) or 1
+            _count(throttled=1, waited_seconds=waited)
+            if retry_after > MAX_INLINE_RETRY_AFTER or attempt == MAX_INLINE_RETRIES:
+                # Запрос возвращаем вызывающему: долгая пауза нужна только
+                # этому чату, остальные запросы контейнера ждут не дольше
+                # MAX_INLINE_RETRY_AFTER
+                _limiter.pause(retry_after, chat_id, max_global=MAX_INLINE_RETRY_AFTER)
+                _count(dropped=1)
+                logger.warning(f"⏳ {method}: 429, retry_after={retry_after}с - запрос не повторяем")
+                return response
+            _limiter.pause(retry_after, chat_id)
+            _count(retried=1)
+            logger.info(f"⏳ {method}: 429, ждем {retry_after}с и повторяем")
+        return response
+    
     def send_message(self, chat_id, text, reply_markup=None, parse_mode='Markdown'):
         """
         Отправляет сообщение пользователю
@@ -48,11 +211,7 @@ class TelegramAPI:
             if reply_markup:
                 payload['reply_markup'] = json.dumps(reply_markup)
             
-            response = requests.post(
-                f"{self.api_url}/sendMessage", 
-                json=payload, 
-                timeout=10
-            )
+            response = self._post('sendMessage', chat_id=chat_id, json=payload)
             
             if response.status_code == 200:
                 return True, response.json()
@@ -64,6 +223,35 @@ class TelegramAPI:
             logger.error(f"❌ Исключение при отправке: {e}")
             return False, str(e)
     
+    def send_many(self, messages, deadline=None, workers=BROADCAST_WORKERS):
+        """
+        Отправляет сообщения параллельно пулом из workers потоков
+        
+        Темп держит общий лимитер (_post), соединения берутся из общей сессии.
+        
+        Args:
+            messages (list): dict с ключами chat_id, text, reply_markup и
+                parse_mode (последние два необязательны)
+            deadline (float, optional): time.monotonic(), после которого
+                оставшиеся сообщения не отправляются
+            workers (int): Размер пула
+            
+        Returns:
+            list: (success, result) для каждого сообщения по порядку; для
+            неотправленных до дедлайна - (False, None)
+        """
+        def send(message):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False, None
+            return self.send_message(
+                message['chat_id'], message['text'],
+                reply_markup=message.get('reply_markup'),
+                parse_mode=message.get('parse_mode') or 'Markdown'
+            )
+        
+        with ThreadPoolExecutor(max_workers=min(workers, len(messages)) or 1) as executor:
+            return list(executor.map(send, messages))
+    
     def edit_message(self, chat_id, message_id, text, reply_markup=None, parse_mode='Markdown'):
         """
         Редактирует существующее сообщение
@@ -89,11 +277,7 @@ class TelegramAPI:
             if reply_markup:
                 payload['reply_markup'] = json.dumps(reply_markup)
             
-            response = requests.post(
-                f"{self.api_url}/editMessageText", 
-                json=payload, 
-                timeout=10
-            )
+            response = self._post('editMessageText', chat_id=chat_id, json=payload)
             
             if response.status_code == 200:
                 return True, response.json()
@@ -103,6 +287,106 @@ class TelegramAPI:
             logger.error(f"❌ Ошибка редактирования: {e}")
             return False, str(e)
     
+    def send_document(self, chat_id, filename, content, caption=None):
+        """
+        Отправляет файл пользователю
+        
+        Args:
+            chat_id (int): ID чата
+            filename (str): Имя файла
+            content (bytes): Содержимое файла
+            caption (str, optional): Подпись к файлу
+            
+        Returns:
+            tuple: (success: bool, result: dict/str)
+        """
+        try:
+            data = {'chat_id': chat_id}
+            if caption:
+                data['caption'] = caption[:1024]
+            
+            response = self._post(
+                'sendDocument',
+                chat_id=chat_id,
+                timeout=30,
+                data=data,
+                files={'document': (filename, content)}
+            )
+            
+            if response.status_code == 200:
+                return True, response.json()
+            logger.error(f"❌ Ошибка отправки файла: {response.status_code}")
+            return False, response.text
+            
+        except Exception as e:
+            logger.error(f"❌ Исключение при отправке файла: {e}")
+            return False, str(e)
+    
+    def send_photo(self, chat_id, file_id, caption=None):
+        """
+        Отправляет фото по file_id, уже загруженному в Telegram (без скачивания)
+        
+        Args:
+            chat_id (int): ID чата
+            file_id (str): file_id фото
+            caption (str, optional): Подпись к фото
+            
+        Returns:
+            tuple: (success: bool, result: dict/str)
+        """
+        try:
+            payload = {'chat_id': chat_id, 'photo': file_id}
+            if caption:
+                payload['caption'] = caption[:1024]
+            
+            response = self._post('sendPhoto', chat_id=chat_id, json=payload)
+            
+            if response.status_code == 200:
+                return True, response.json()
+            logger.error(f"❌ Ошибка отправки фото: {response.status_code}")
+            return False, response.text
+            
+        except Exception as e:
+            logger.error(f"❌ Исключение при отправке фото: {e}")
+            return False, str(e)
+    
+    def download_file(self, file_id, max_size=20 * 1024 * 1024):
+        """
+        Скачивает файл, присланный пользователем, потоково в память
+        
+        Args:
+            file_id (str): file_id из сообщения
+            max_size (int): Максимальный размер файла в байтах
+            
+        Returns:
+            tuple: (success: bool, result: io.BytesIO/str)
+        """
+        try:
+            response = self._post('getFile', json={'file_id': file_id})
+            if response.status_code != 200:
+                return False, response.text
+            
+            file_path = response.json()['result']['file_path']
+            buffer = io.BytesIO()
+            with _session.get(
+                f"https://api.telegram.org/file/bot{self.token}/{file_path}",
+                stream=True,
+                timeout=30
+            ) as download:
+                if download.status_code != 200:
+                    return False, download.text
+                for chunk in download.iter_content(chunk_size=64 * 1024):
+                    buffer.write(chunk)
+                    if buffer.tell() > max_size:
+                        return False, "Файл слишком большой"
+            
+            buffer.seek(0)
+            return True, buffer
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка скачивания файла: {e}")
+            return False, str(e)
+    
     def answer_callback_query(self, callback_query_id, text=None):
         """
         Отвечает на callback query (убирает "часики")
@@ -119,11 +403,7 @@ class TelegramAPI:
             if text:
                 payload['text'] = text
             
-            response = requests.post(
-                f"{self.api_url}/answerCallbackQuery", 
-                json=payload, 
-                timeout=5
-            )
+            response = self._post('answerCallbackQuery', timeout=5, json=payload)
             return response.status_code == 200
             
         except Exception as e:
@@ -151,6 +431,38 @@ def is_admin(user_id):
     return user_id in admins
 
 
+def escape_markdown(text):
+    """
+    Экранирует пользовательский текст для parse_mode='Markdown'
+    
+    Args:
+        text (str): Исходный текст
+        
+    Returns:
+        str: Текст, безопасный для вставки в Markdown-сообщение
+    """
+    for char in ('\\', '_', '*', '`', '['):
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+def in_work_hours(moment, start, end):
+    """
+    Попадает ли время в рабочие часы (в т.ч. через полночь)
+    
+    Args:
+        moment (datetime): Проверяемый момент
+        start, end (str): Границы 'HH:MM'
+        
+    Returns:
+        bool: True, если момент внутри [start, end)
+    """
+    current = moment.strftime('%H:%M')
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
 def get_role_emoji(role):
     """
     Возвращает эмодзи для роли пользователя
@@ -178,8 +490,5 @@ def get_task_type_emoji(task_type):
     Returns:
         str: Эмодзи соответствующий типу задачи
     """
-    return {
-        "Обеды": "🍽️",
-        "Уборка": "🧹",
-        "Пересчеты": "🔢"
-    }.get(task_type, "📋")
\ No newline at end of file
+    from task_catalog import get_catalog
+    return get_catalog().emoji(task_type)
\ No newline at end of file
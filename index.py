@@ -9,8 +9,12 @@ import json
 import logging
 import os
 from handlers.utils import TelegramAPI
-from handlers.main_handlers import handle_text_message
+from handlers.main_handlers import (
+    handle_text_message, handle_document_message, handle_photo_message
+)
 from handlers.callback_router import handle_callback_query
+from database import set_request_key
+from outbox import flush_local
 
 # Настройка логирования для Cloud Functions
 logging.basicConfig(level=logging.INFO)
@@ -62,6 +66,15 @@ def handler(event, context):
         print(f"📥 Parsed update: {update_data}")
         logger.info(f"📥 Получен update: {update_data}")
         
+        # Ключ идемпотентности: повторная доставка того же update'а
+        # (ретрай webhook'а) не должна второй раз создавать задания
+        if 'callback_query' in update_data:
+            set_request_key(f"cb{update_data['callback_query']['id']}")
+        elif 'update_id' in update_data:
+            set_request_key(f"u{update_data['update_id']}")
+        else:
+            set_request_key(None)
+        
         # Обрабатываем message
         if 'message' in update_data:
             print("💬 Обрабатываем MESSAGE...")
@@ -73,10 +86,22 @@ def handler(event, context):
             print(f"💬 MESSAGE от @{username} (ID: {user_id}): {text}")
             logger.info(f"💬 MESSAGE от @{username}: {text[:30]}")
             
-            print("🔄 Вызываем handle_text_message...")
-            success, result = handle_text_message(
-                user_id, username, text, telegram_api
-            )
+            if 'document' in msg:
+                print("📎 Вызываем handle_document_message...")
+                success, result = handle_document_message(
+                    user_id, username, msg['document'], telegram_api
+                )
+            elif 'photo' in msg:
+                print("📸 Вызываем handle_photo_message...")
+                success, result = handle_photo_message(
+                    user_id, username, msg['photo'], telegram_api
+                )
+            else:
+                print("🔄 Вызываем handle_text_message...")
+                success, result = handle_text_message(
+                    user_id, username, text, telegram_api
+                )
+            flush_local(telegram_api)
             print(f"🔄 handle_text_message результат: success={success}, result={result}")
             
             if success:
@@ -111,6 +136,7 @@ def handler(event, context):
             success, result = handle_callback_query(
                 user_id, callback_data, message_id, query_id, telegram_api
             )
+            flush_local(telegram_api)
             print(
                 f"🔄 handle_callback_query результат: "
                 f"success={success}, result={result}"
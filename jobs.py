@@ -0,0 +1,384 @@
+"""
+jobs.py - Периодические задачи для Yandex Cloud Functions
+
+Точки входа для таймер-триггеров (отдельно от webhook-обработчика
+index.handler). Каждая задача ограничена по времени, чтобы уложиться
+в таймаут функции; необработанный остаток забирает следующий запуск.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+import database as db
+import outbox
+import broadcast
+from config import (
+    REMINDER_LOOKAHEAD_MINUTES, DEFAULT_REMINDER_MINUTES_BEFORE,
+    DEFAULT_WORK_HOURS, OVERDUE_LOOKBACK_HOURS,
+    ESCALATION_ROLES, TASK_STATUS, NOTIFICATION_DIGEST_WINDOW_MINUTES,
+    SCHEDULE_CHANGE_QUIET_MINUTES
+)
+from handlers.utils import (
+    TelegramAPI, get_task_type_emoji, get_send_metrics, escape_markdown, in_work_hours
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Запас времени до таймаута функции
+TIME_RESERVE_SECONDS = 5
+DEFAULT_TIME_BUDGET_SECONDS = 50
+
+# Заданий за одно чтение при выборке напоминаний и просрочек
+REMINDER_PAGE_SIZE = 500
+OVERDUE_PAGE_SIZE = 500
+
+# Строк с заданиями в сводке просрочек (остальное - одной строкой-итогом)
+OVERDUE_DIGEST_MAX_LINES = 40
+
+# Типы уведомлений, которые уходят сводками: заголовок раздела и флаг
+# NotificationSettings, которым тип отключается
+DIGEST_TYPES = {
+    'task': ("📋 *Задания*", 'task_reminders'),
+    'schedule': ("🗓️ *Расписание*", 'schedule_updates'),
+    'rating': ("⭐ *Оценки*", 'rating_notifications'),
+    'general': ("💬 *Общие*", 'general_notifications'),
+}
+DIGEST_MAX_LINES = 20
+
+
+def _deadline(context):
+    """Момент (time.monotonic), до которого задача должна завершиться."""
+    remaining_ms = None
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        remaining_ms = context.get_remaining_time_in_millis()
+    budget = remaining_ms / 1000 if remaining_ms else DEFAULT_TIME_BUDGET_SECONDS
+    return time.monotonic() + max(budget - TIME_RESERVE_SECONDS, 1)
+
+
+def _response(**body):
+    return {
+        'statusCode': 200,
+        'body': json.dumps(body)
+    }
+
+
+def _telegram_api():
+    return TelegramAPI(os.environ.get('TELEGRAM_BOT_TOKEN'))
+
+
+def _send_rate_limited(api, messages, deadline):
+    """Отправить сообщения параллельно; темп держит лимитер TelegramAPI.
+    
+    Args:
+        messages (list): dict с ключами chat_id, text, reply_markup (необязательно)
+    
+    Returns:
+        list: индексы доставленных сообщений (неотправленное до дедлайна
+        остается следующему запуску)
+    """
+    results = api.send_many(messages, deadline)
+    
+    logger.info(f"📊 Bot API: {get_send_metrics()}")
+    return [index for index, (success, _) in enumerate(results) if success]
+
+
+def archive_schedule_handler(event, context):
+    """Таймер: перенос прошедших и удаленных записей расписания в архив"""
+    logger.info("🗄️ Запуск архивации расписания")
+    moved = db.archive_schedule(deadline=_deadline(context))
+    return _response(status='ok', archived=moved)
+
+
+def purge_notifications_handler(event, context):
+    """Таймер: удаление старых прочитанных уведомлений"""
+    logger.info("🧹 Запуск очистки уведомлений")
+    purged = db.purge_read_notifications(deadline=_deadline(context))
+    return _response(status='ok', purged=purged)
+
+
+def broadcast_resume_handler(event, context):
+    """Таймер: продолжение рассылок, прерванных до конца списка получателей"""
+    resumed = broadcast.resume_broadcasts(_deadline(context))
+    return _response(status='ok', resumed=resumed)
+
+
+def outbox_drain_handler(event, context):
+    """Таймер: отправка сообщений из очереди Outbox (повторы по retry_after и с задержкой)"""
+    stats = outbox.drain(_telegram_api(), _deadline(context))
+    return _response(status='ok', **stats)
+
+
+def rebuild_schedule_counters_handler(event, context):
+    """Разовый запуск: пересчет счетчиков статистики расписания"""
+    logger.info("🔢 Пересчет счетчиков расписания")
+    success = db.rebuild_schedule_counters()
+    return _response(status='ok' if success else 'error')
+
+
+def rebuild_user_task_counters_handler(event, context):
+    """Разовый запуск: пересчет счетчиков заданий пользователей"""
+    logger.info("🔢 Пересчет счетчиков заданий")
+    success = db.rebuild_user_task_counters()
+    return _response(status='ok' if success else 'error')
+
+
+def _reminder_message(task, minutes_left):
+    """Текст и кнопка напоминания о задании"""
+    text = (f"⏰ *Напоминание*\n\n"
+            f"{get_task_type_emoji(task['type'])} *{task['type']}* через {minutes_left} мин\n"
+            f"📅 {task['when_'][:16]}")
+    return {
+        'chat_id': task['assigned_to'],
+        'text': text,
+        'reply_markup': {'inline_keyboard': [[
+            {'text': '📄 Открыть', 'callback_data': f"task_view_{task['id']}"}
+        ]]}
+    }
+
+
+def _due_reminder(task, now):
+    """Сообщение напоминания, если по настройкам пользователя его пора отправить"""
+    if task['already_sent'] or not task['task_reminders']:
+        return None
+    
+    work_start = task['work_hours_start'] or DEFAULT_WORK_HOURS[0]
+    work_end = task['work_hours_end'] or DEFAULT_WORK_HOURS[1]
+    if not in_work_hours(now, work_start, work_end):
+        return None
+    
+    try:
+        task_time = datetime.strptime(task['when_'][:16], '%Y-%m-%d %H:%M')
+    except ValueError:
+        return None
+    
+    minutes_before = task['minutes_before']
+    if minutes_before is None:
+        minutes_before = DEFAULT_REMINDER_MINUTES_BEFORE
+    if not (task_time - timedelta(minutes=minutes_before) <= now < task_time):
+        return None
+    
+    minutes_left = max(int((task_time - now).total_seconds() // 60), 1)
+    return _reminder_message(task, minutes_left)
+
+
+def task_reminders_handler(event, context):
+    """Таймер: напоминания о предстоящих заданиях по NotificationSettings"""
+    deadline = _deadline(context)
+    now = datetime.now()
+    when_from = now.strftime('%Y-%m-%d %H:%M:%S')
+    when_to = (now + timedelta(minutes=REMINDER_LOOKAHEAD_MINUTES)).strftime('%Y-%m-%d %H:%M:%S')
+    logger.info(f"⏰ Напоминания: задания с {when_from} по {when_to}")
+    
+    api = _telegram_api()
+    scanned = sent = 0
+    after = None
+    
+    while time.monotonic() < deadline:
+        page = db.get_reminder_candidates(when_from, when_to, after=after, page_size=REMINDER_PAGE_SIZE)
+        if not page:
+            break
+        scanned += len(page)
+        after = (page[-1]['when_'], page[-1]['id'])
+        
+        due = []
+        for task in page:
+            message = _due_reminder(task, now)
+            if message:
+                due.append((task, message))
+        
+        delivered = _send_rate_limited(api, [message for _, message in due], deadline)
+        # Отметка reminder:<task_id> исключает повтор на следующих запусках
+        db.create_notifications_bulk([
+            {
+                'id': f"reminder:{due[i][0]['id']}",
+                'user_id': due[i][0]['assigned_to'],
+                'title': "Напоминание о задании",
+                'message': due[i][1]['text'],
+                'type': 'reminder'
+            }
+            for i in delivered
+        ], sent=True)
+        sent += len(delivered)
+        
+        if len(page) < REMINDER_PAGE_SIZE:
+            break
+    
+    logger.info(f"⏰ Напоминания: просмотрено {scanned}, отправлено {sent}")
+    return _response(status='ok', scanned=scanned, sent=sent)
+
+
+def _overdue_digest(tasks, usernames):
+    """Одна сводка по всем просрочкам запуска, сгруппированная по исполнителям"""
+    by_user = {}
+    for task in tasks:
+        by_user.setdefault(task['assigned_to'], []).append(task)
+    
+    lines = [f"⚠️ *Просроченные задания: {len(tasks)}*", ""]
+    shown = 0
+    for user_id, user_tasks in sorted(by_user.items(), key=lambda item: -len(item[1])):
+        name = (usernames.get(user_id) or user_id).replace('_', '\\_')
+        lines.append(f"👤 @{name} — {len(user_tasks)}")
+        for task in sorted(user_tasks, key=lambda t: t['due_at']):
+            if shown >= OVERDUE_DIGEST_MAX_LINES:
+                break
+            lines.append(
+                f"   {TASK_STATUS.get(task['status'], '📋')} "
+                f"{get_task_type_emoji(task['type'])} {task['type']}, "
+                f"до {task['due_at'][11:16]} ({task['due_at'][:10]})"
+            )
+            shown += 1
+    if shown < len(tasks):
+        lines.append(f"\n… и еще {len(tasks) - shown}")
+    return "\n".join(lines)
+
+
+def overdue_tasks_handler(event, context):
+    """Таймер: отметка просроченных заданий и сводка руководителям (ДС/ЗДС)"""
+    deadline = _deadline(context)
+    now = datetime.now()
+    now_value = now.strftime('%Y-%m-%d %H:%M:%S')
+    since_value = (now - timedelta(hours=OVERDUE_LOOKBACK_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+    logger.info(f"⚠️ Просрочки: слоты, закончившиеся с {since_value} по {now_value}")
+    
+    overdue = []
+    after = None
+    while time.monotonic() < deadline:
+        page = db.get_overdue_candidates(
+            now_value, since_value, after=after, page_size=OVERDUE_PAGE_SIZE
+        )
+        if not page:
+            break
+        after = (page[-1]['status'], page[-1]['due_at'], page[-1]['id'])
+        
+        marked = set(db.mark_tasks_overdue([task['id'] for task in page]))
+        overdue.extend(task for task in page if task['id'] in marked)
+        
+        if len(page) < OVERDUE_PAGE_SIZE:
+            break
+    
+    if not overdue:
+        return _response(status='ok', overdue=0, notified=0)
+    
+    managers = db.get_users_by_roles(ESCALATION_ROLES)
+    usernames = db.resolve_users(telegram_ids=list({task['assigned_to'] for task in overdue}))
+    digest = _overdue_digest(overdue, {key: name for key, (_, name) in usernames.items()})
+    
+    api = _telegram_api()
+    delivered = _send_rate_limited(
+        api,
+        [{'chat_id': manager['telegram_id'], 'text': digest} for manager in managers],
+        deadline + TIME_RESERVE_SECONDS
+    )
+    
+    logger.info(f"⚠️ Просрочки: отмечено {len(overdue)}, сводка доставлена {len(delivered)}/{len(managers)}")
+    return _response(status='ok', overdue=len(overdue), notified=len(delivered))
+
+
+def _digest_message(user_id, notifications):
+    """Одна сводка по накопившимся уведомлениям пользователя"""
+    lines = [f"🔔 *Новые уведомления: {len(notifications)}*", ""]
+    by_type = {}
+    for notification in notifications:
+        by_type.setdefault(notification['type'], []).append(notification)
+    
+    shown = 0
+    for notification_type, items in by_type.items():
+        title, _ = DIGEST_TYPES[notification_type]
+        lines.append(f"{title} — {len(items)}")
+        for item in items:
+            if shown >= DIGEST_MAX_LINES:
+                break
+            text = item['message'] or ''
+            if len(text) > 80:
+                text = text[:80] + "..."
+            lines.append(f"• *{escape_markdown(item['title'])}*: {escape_markdown(text)}")
+            shown += 1
+    if shown < len(notifications):
+        lines.append(f"\n… и еще {len(notifications) - shown}")
+    
+    return outbox.message(
+        user_id, "\n".join(lines),
+        reply_markup={'inline_keyboard': [[
+            {'text': '📱 Мои уведомления', 'callback_data': 'notifications_my'}
+        ]]},
+        # Повторная постановка той же сводки (сбой после enqueue) не дублирует
+        message_id=db.derived_id('digest', *sorted(n['id'] for n in notifications))
+    )
+
+
+def notification_digest_handler(event, context):
+    """Таймер: сводки неотправленных уведомлений - одно сообщение на пользователя"""
+    # Окно (от самого старого неотправленного) и рабочие часы проверяет запрос
+    pending = db.get_pending_digest_notifications(
+        list(DIGEST_TYPES), NOTIFICATION_DIGEST_WINDOW_MINUTES, datetime.now().strftime('%H:%M')
+    )
+    
+    by_user = {}
+    for notification in pending:
+        by_user.setdefault(notification['user_id'], []).append(notification)
+    
+    messages, handled_ids = [], []
+    for user_id, notifications in by_user.items():
+        # Выключенные в настройках типы не отправляются, но и не копятся
+        enabled = [n for n in notifications if n[DIGEST_TYPES[n['type']][1]]]
+        if enabled:
+            messages.append(_digest_message(user_id, enabled))
+        handled_ids.extend(n['id'] for n in notifications)
+    
+    if messages and not outbox.enqueue_many(messages):
+        return _response(status='error', pending=len(pending))
+    db.mark_notifications_sent(handled_ids)
+    
+    logger.info(f"🔔 Сводки: уведомлений {len(handled_ids)} -> сообщений {len(messages)}")
+    return _response(status='ok', notifications=len(handled_ids), digests=len(messages))
+
+
+def _schedule_change_notification(user_id, day, changes):
+    """Уведомление об изменениях расписания пользователя за один день"""
+    lines = []
+    for change in changes:
+        sign = "➕" if change['delta'] > 0 else "➖"
+        slot = f"{change['start_time']}-{change['end_time']}"
+        lines.append(f"{sign} {get_task_type_emoji(change['type'])} {change['type']} {slot}")
+    return {
+        # Одинаковый набор изменений при повторе после сбоя дает тот же id
+        'id': db.derived_id('schedule_change', user_id, day, *sorted(
+            f"{c['type']}|{c['start_time']}|{c['end_time']}|{c['delta']}" for c in changes
+        )),
+        'user_id': user_id,
+        'title': f"🗓️ Расписание на {day.strftime('%d.%m')}",
+        'message': "; ".join(lines),
+        'type': 'schedule'
+    }
+
+
+def schedule_changes_handler(event, context):
+    """Таймер: изменения расписания -> одно уведомление на пользователя и день
+    
+    Правки копятся в ScheduleChanges, пока пользователь не перестанет меняться
+    SCHEDULE_CHANGE_QUIET_MINUTES минут. Слоты с нулевой суммой (добавили и
+    удалили) не попадают в уведомление. Доставляет notification_digest_handler,
+    с учетом schedule_updates и рабочих часов.
+    """
+    changes = db.get_settled_schedule_changes(SCHEDULE_CHANGE_QUIET_MINUTES)
+    
+    by_day = {}
+    for change in changes:
+        by_day.setdefault((change['user_id'], change['date']), []).append(change)
+    
+    notifications = []
+    for (user_id, day), day_changes in by_day.items():
+        visible = [c for c in day_changes if c['delta'] != 0]
+        if visible:
+            notifications.append(_schedule_change_notification(user_id, day, visible))
+    
+    if not db.consume_schedule_changes(changes, notifications):
+        return _response(status='error', changes=len(changes))
+    
+    logger.info(
+        f"🗓️ Изменения расписания: записей {len(changes)} -> уведомлений {len(notifications)}"
+    )
+    return _response(status='ok', changes=len(changes), notifications=len(notifications))
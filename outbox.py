@@ -0,0 +1,191 @@
+# outbox.py - Очередь исходящих сообщений Telegram
+
+"""
+Обработчики не отправляют массовые сообщения сами, а ставят их в очередь
+(enqueue / enqueue_many) и сразу отвечают webhook'у. Отправляет drain():
+пачками через TelegramAPI.send_many (пул потоков, лимиты Bot API соблюдает
+сам TelegramAPI), с повторами - по retry_after для 429 и с экспоненциальной задержкой для
+сетевых ошибок и 5xx.
+
+Хранилище выбирается OUTBOX_BACKEND: ydb - таблица Outbox, которую разбирает
+таймер jobs.outbox_drain_handler; memory - очередь в памяти процесса для
+локального запуска, разбирается в конце того же webhook-вызова (flush_local).
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+
+import database as db
+from config import OUTBOX_BACKEND, OUTBOX_MAX_ATTEMPTS
+from handlers.utils import parse_retry_after, get_send_metrics
+
+logger = logging.getLogger(__name__)
+
+# Сообщений за одну выборку и время аренды выбранной пачки
+DRAIN_BATCH_SIZE = 100
+DRAIN_LEASE_SECONDS = 60
+
+# Задержка повтора при сетевых ошибках и 5xx: 5, 10, 20 ... секунд
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 600
+
+
+class YdbOutbox:
+    """Очередь в таблице Outbox"""
+
+    def put(self, messages):
+        return db.enqueue_outbox(messages)
+
+    def claim(self, limit, lease_seconds):
+        return db.claim_outbox_batch(limit, lease_seconds)
+
+    def complete(self, sent, retries, failed):
+        return db.complete_outbox_batch(sent, retries, failed)
+
+
+class InMemoryOutbox:
+    """Очередь в памяти процесса с тем же интерфейсом (локальный запуск)"""
+
+    def __init__(self):
+        self._messages = {}
+        self._lock = threading.Lock()
+
+    def put(self, messages):
+        with self._lock:
+            for message in messages:
+                self._messages[message['id']] = dict(
+                    message, attempts=0, next_attempt_at=time.monotonic()
+                )
+        return True
+
+    def claim(self, limit, lease_seconds):
+        now = time.monotonic()
+        with self._lock:
+            ready = sorted(
+                (m for m in self._messages.values() if m['next_attempt_at'] <= now),
+                key=lambda m: m['next_attempt_at']
+            )[:limit]
+            for message in ready:
+                message['next_attempt_at'] = now + lease_seconds
+            return [dict(m) for m in ready]
+
+    def complete(self, sent, retries, failed):
+        with self._lock:
+            for message in sent + failed:
+                self._messages.pop(message['id'], None)
+            for retry in retries:
+                if retry['id'] in self._messages:
+                    self._messages[retry['id']].update(
+                        attempts=retry['attempts'],
+                        next_attempt_at=time.monotonic() + retry['delay']
+                    )
+        return db.mark_notifications_sent(
+            [m['notification_id'] for m in sent + failed if m.get('notification_id')]
+        )
+
+
+_backend = InMemoryOutbox() if OUTBOX_BACKEND == 'memory' else YdbOutbox()
+
+
+def message(chat_id, text, reply_markup=None, parse_mode='Markdown', notification_id=None,
+            message_id=None):
+    """Сообщение для enqueue_many (id можно задать, чтобы повтор не дублировал запись)"""
+    return {
+        'id': message_id or str(uuid.uuid4()),
+        'chat_id': str(chat_id),
+        'payload': json.dumps(
+            {'text': text, 'reply_markup': reply_markup, 'parse_mode': parse_mode},
+            ensure_ascii=False
+        ),
+        'notification_id': notification_id
+    }
+
+
+def enqueue_many(messages):
+    """Поставить сообщения в очередь. Returns: bool - успешность записи"""
+    return _backend.put(messages)
+
+
+def enqueue(chat_id, text, reply_markup=None, parse_mode='Markdown', notification_id=None):
+    """Поставить одно сообщение в очередь"""
+    return enqueue_many([message(chat_id, text, reply_markup, parse_mode, notification_id)])
+
+
+def _error_code(result):
+    """error_code из ответа Bot API; None для сетевых ошибок"""
+    try:
+        error = json.loads(result)
+    except (TypeError, ValueError):
+        return None
+    return error.get('error_code') if isinstance(error, dict) else None
+
+
+def _outgoing(queued):
+    """Сообщение из очереди в формате TelegramAPI.send_many"""
+    return dict(json.loads(queued['payload']), chat_id=queued['chat_id'])
+
+
+def drain(api, deadline, backend=None):
+    """
+    Разобрать очередь до дедлайна
+
+    Args:
+        api (TelegramAPI): Клиент Bot API
+        deadline (float): time.monotonic(), после которого новые пачки не берутся
+
+    Returns:
+        dict: sent, retried, failed
+    """
+    backend = backend or _backend
+    stats = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    while time.monotonic() < deadline:
+        batch = backend.claim(DRAIN_BATCH_SIZE, DRAIN_LEASE_SECONDS)
+        if not batch:
+            break
+
+        sent, retries, failed = [], [], []
+        results = api.send_many([_outgoing(queued) for queued in batch])
+        for queued, (success, result) in zip(batch, results):
+            if success:
+                sent.append(queued)
+                continue
+
+            attempts = queued['attempts'] + 1
+            error_code = _error_code(result)
+            if error_code == 429:
+                # Лимит Bot API: ждем сколько сказано, попытка не засчитывается
+                delay = parse_retry_after(result) or RETRY_BASE_SECONDS
+                retries.append({'id': queued['id'], 'attempts': queued['attempts'],
+                                'delay': delay, 'error': str(result)})
+            elif (error_code is None or error_code >= 500) and attempts < OUTBOX_MAX_ATTEMPTS:
+                delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+                retries.append({'id': queued['id'], 'attempts': attempts,
+                                'delay': delay, 'error': str(result)})
+            else:
+                # 400/403 (бот заблокирован, чат не найден) повтором не исправить
+                failed.append({'id': queued['id'], 'attempts': attempts, 'error': str(result),
+                               'notification_id': queued.get('notification_id')})
+
+        backend.complete(sent, retries, failed)
+        stats['sent'] += len(sent)
+        stats['retried'] += len(retries)
+        stats['failed'] += len(failed)
+
+    if any(stats.values()):
+        logger.info(
+            f"📤 Очередь сообщений: отправлено {stats['sent']}, "
+            f"отложено {stats['retried']}, ошибок {stats['failed']}; "
+            f"Bot API: {get_send_metrics()}"
+        )
+    return stats
+
+
+def flush_local(api, seconds=20):
+    """Разобрать очередь в памяти в конце webhook-вызова (только OUTBOX_BACKEND=memory)"""
+    if isinstance(_backend, InMemoryOutbox):
+        return drain(api, time.monotonic() + seconds)
+    return None
@@ -0,0 +1,134 @@
+# task_catalog.py - Справочник типов заданий из таблицы TaskTypes
+
+"""
+Справочник загружается из TaskTypes один раз на контейнер функции и
+обновляется не чаще раза в CATALOG_TTL_SECONDS. Снимок неизменяем: обработчики
+берут get_catalog() и читают из памяти, без запросов к БД на каждый update.
+
+Tasks.type хранит категорию (Обеды, Уборка, Пересчеты) или название типа,
+поэтому lookup() ищет сначала по названию, затем по категории.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from config import TASK_TYPES, DEFAULT_TASK_DURATION_MINUTES
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL_SECONDS = 300
+DEFAULT_EMOJI = "📋"
+
+# Описание типа (или категории, если тип не найден по названию)
+TaskTypeInfo = namedtuple(
+    'TaskTypeInfo', ['name', 'category', 'emoji', 'default_duration', 'requires_photo']
+)
+
+
+class TaskCatalog:
+    """Неизменяемый снимок справочника с версией (хэш содержимого)"""
+
+    __slots__ = ('version', 'types', 'categories', '_by_name', '_by_category')
+
+    def __init__(self, rows):
+        types = tuple(sorted(
+            (
+                TaskTypeInfo(
+                    name=row['name'],
+                    category=row['category'],
+                    emoji=row.get('emoji') or TASK_TYPES.get(row['category'], DEFAULT_EMOJI),
+                    default_duration=row.get('default_duration') or DEFAULT_TASK_DURATION_MINUTES,
+                    requires_photo=bool(row.get('requires_photo'))
+                )
+                for row in rows
+            ),
+            key=lambda info: (info.category, info.name)
+        ))
+
+        # Категории из config всегда доступны, даже если в TaskTypes их нет
+        categories = list(TASK_TYPES)
+        categories += sorted({info.category for info in types} - set(categories))
+
+        by_category = {}
+        for category in categories:
+            members = [info for info in types if info.category == category]
+            by_category[category] = TaskTypeInfo(
+                name=category,
+                category=category,
+                emoji=next((i.emoji for i in members), TASK_TYPES.get(category, DEFAULT_EMOJI)),
+                default_duration=max((i.default_duration for i in members),
+                                     default=DEFAULT_TASK_DURATION_MINUTES),
+                requires_photo=any(i.requires_photo for i in members)
+            )
+
+        self.types = types
+        self.categories = tuple(categories)
+        self._by_name = MappingProxyType({info.name: info for info in types})
+        self._by_category = MappingProxyType(by_category)
+        self.version = hashlib.sha1(repr(types).encode('utf-8')).hexdigest()[:12]
+
+    def lookup(self, task_type):
+        """Описание по названию типа или категории (None, если неизвестен)"""
+        return self._by_name.get(task_type) or self._by_category.get(task_type)
+
+    def emoji(self, task_type):
+        info = self.lookup(task_type)
+        return info.emoji if info else DEFAULT_EMOJI
+
+    def default_duration(self, task_type):
+        info = self.lookup(task_type)
+        return info.default_duration if info else DEFAULT_TASK_DURATION_MINUTES
+
+    def requires_photo(self, task_type):
+        info = self.lookup(task_type)
+        return bool(info and info.requires_photo)
+
+    def category_by_code(self, code):
+        """Категория по коду из category_code (None, если такой нет)"""
+        return next((c for c in self.categories if category_code(c) == code), None)
+
+
+def category_code(category):
+    """Короткий код категории для callback_data: без '_' и в пределах 64 байт"""
+    return hashlib.sha1(category.encode('utf-8')).hexdigest()[:8]
+
+
+_catalog = None
+_expires_at = 0.0
+_lock = threading.Lock()
+
+
+def get_catalog():
+    """Текущий снимок справочника (перечитывается из БД по истечении TTL)"""
+    global _catalog, _expires_at
+
+    if _catalog is not None and time.monotonic() < _expires_at:
+        return _catalog
+
+    with _lock:
+        if _catalog is not None and time.monotonic() < _expires_at:
+            return _catalog
+
+        import database as db
+        rows = db.get_task_types()
+        if rows is None and _catalog is not None:
+            # БД недоступна - продолжаем со старым снимком, повторим позже
+            _expires_at = time.monotonic() + CATALOG_TTL_SECONDS / 10
+            return _catalog
+
+        catalog = TaskCatalog(rows or [])
+        if _catalog is None or catalog.version != _catalog.version:
+            logger.info(f"📚 Справочник типов заданий: версия {catalog.version}, типов {len(catalog.types)}")
+            _catalog = catalog
+        _expires_at = time.monotonic() + CATALOG_TTL_SECONDS
+        return _catalog
+
+
+def invalidate_catalog():
+    """Сбросить снимок (после изменения TaskTypes в этом контейнере)"""
+    global _expires_at
+    _expires_at = 0.0
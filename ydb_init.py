@@ -111,6 +111,50 @@ def create_tables(pool):
                 );
                 """,
                 """
+                CREATE TABLE ScheduleArchive (
+                    id String NOT NULL,
+                    user_id String,
+                    date Date,
+                    type String,
+                    start_time String,
+                    end_time String,
+                    status String,
+                    created_by String,
+                    created_at Timestamp,
+                    archived_at Timestamp,
+                    PRIMARY KEY (id)
+                );
+                """,
+                """
+                CREATE TABLE ScheduleDailyStats (
+                    type String NOT NULL,
+                    date Date NOT NULL,
+                    count Int64,
+                    PRIMARY KEY (type, date)
+                );
+                """,
+                """
+                CREATE TABLE ScheduleUserMonthStats (
+                    user_id String NOT NULL,
+                    type String NOT NULL,
+                    month String NOT NULL,
+                    count Int64,
+                    PRIMARY KEY (user_id, type, month)
+                );
+                """,
+                """
+                CREATE TABLE ScheduleChanges (
+                    user_id String NOT NULL,
+                    date Date NOT NULL,
+                    type String NOT NULL,
+                    start_time String NOT NULL,
+                    end_time String NOT NULL,
+                    delta Int32,
+                    updated_at Timestamp,
+                    PRIMARY KEY (user_id, date, type, start_time, end_time)
+                );
+                """,
+                """
                 CREATE TABLE Notifications (
                     id String NOT NULL,
                     user_id String,
@@ -177,6 +221,46 @@ def create_tables(pool):
                     generated_at Timestamp DEFAULT CurrentUtcTimestamp(),
                     PRIMARY KEY (id)
                 );
+                """,
+                """
+                CREATE TABLE Outbox (
+                    id String NOT NULL,
+                    chat_id String,
+                    payload String,
+                    notification_id String,
+                    status String,
+                    attempts Int32,
+                    next_attempt_at Timestamp,
+                    last_error String,
+                    created_at Timestamp,
+                    sent_at Timestamp,
+                    PRIMARY KEY (id)
+                )
+                WITH (TTL = Interval("P7D") ON created_at);
+                """,
+                """
+                CREATE TABLE BroadcastProgress (
+                    key String NOT NULL,
+                    title String,
+                    text String,
+                    role String,
+                    after_id String,
+                    stats String,
+                    done Bool,
+                    created_at Timestamp,
+                    updated_at Timestamp,
+                    PRIMARY KEY (key)
+                )
+                WITH (TTL = Interval("P7D") ON created_at);
+                """,
+                """
+                CREATE TABLE IdempotencyKeys (
+                    key String NOT NULL,
+                    result String,
+                    created_at Timestamp,
+                    PRIMARY KEY (key)
+                )
+                WITH (TTL = Interval("P7D") ON created_at);
                 """
             ]
             
@@ -224,13 +308,49 @@ def create_indexes(pool):
     def execute(session):
         try:
             indexes = [
-                "CREATE INDEX idx_tasks_assigned_to ON Tasks (assigned_to);",
-                "CREATE INDEX idx_tasks_status ON Tasks (status);",
-                "CREATE INDEX idx_tasks_type ON Tasks (type);",
+                # Списки заданий работника: одно диапазонное чтение
+                "ALTER TABLE Tasks ADD INDEX idx_tasks_assigned_status_when GLOBAL "
+                "ON (assigned_to, status, when_) "
+                "COVER (type, description, rating, time_spent, completed_at);",
+                # Выполненные задания работника, новые сверху
+                "ALTER TABLE Tasks ADD INDEX idx_tasks_assigned_status_completed GLOBAL "
+                "ON (assigned_to, status, completed_at) "
+                "COVER (type, when_, description, rating, time_spent);",
+                # Общие списки по статусу (ожидающие, сводки по статусам)
+                "ALTER TABLE Tasks ADD INDEX idx_tasks_status_when GLOBAL "
+                "ON (status, when_) COVER (type, assigned_to, description);",
+                # Общий список выполненных и отчет по времени
+                "ALTER TABLE Tasks ADD INDEX idx_tasks_status_completed GLOBAL "
+                "ON (status, completed_at) "
+                "COVER (type, when_, assigned_to, description, rating, time_spent);",
+                # Прогресс пересчетов: задания типа за интервал времени
+                "ALTER TABLE Tasks ADD INDEX idx_tasks_type_when GLOBAL "
+                "ON (type, when_) COVER (status, assigned_to, shelves);",
+                # Поиск задания по уже загруженному фото
+                "ALTER TABLE Tasks ADD INDEX idx_tasks_photo_unique GLOBAL "
+                "ON (photo_unique_id);",
+                # Поиск просроченных: незавершенные по концу слота
+                "ALTER TABLE Tasks ADD INDEX idx_tasks_status_due GLOBAL "
+                "ON (status, due_at) COVER (type, when_, assigned_to, is_overdue);",
                 "CREATE INDEX idx_schedule_user_date ON Schedule (user_id, date);",
-                "CREATE INDEX idx_notifications_user_id ON Notifications (user_id);",
                 "CREATE INDEX idx_notifications_scheduled ON Notifications (scheduled_for);",
                 "CREATE INDEX idx_work_schedule_user ON WorkSchedule (user_id);",
+                # Получатели рассылки по роли: постранично по (role, telegram_id)
+                "ALTER TABLE Users ADD INDEX idx_users_role GLOBAL ON (role);",
+                # Сводки уведомлений: неотправленные (sent_at IS NULL) по времени
+                "ALTER TABLE Notifications ADD INDEX idx_notifications_pending GLOBAL "
+                "ON (sent_at, created_at) COVER (user_id, type, title, message);",
+                # Экран "Мои уведомления": последние уведомления пользователя
+                "ALTER TABLE Notifications ADD INDEX idx_notifications_user_created GLOBAL "
+                "ON (user_id, created_at) COVER (title, message, type, is_read);",
+                # Очередь исходящих сообщений: готовые к отправке по времени
+                "ALTER TABLE Outbox ADD INDEX idx_outbox_status_next GLOBAL "
+                "ON (status, next_attempt_at) COVER (chat_id, payload, notification_id, attempts);",
+                # Календарь расписания: диапазон дат внутри одного типа
+                "ALTER TABLE Schedule ADD INDEX idx_schedule_type_date GLOBAL "
+                "ON (type, date) COVER (user_id, start_time, end_time, status);",
+                "ALTER TABLE ScheduleArchive ADD INDEX idx_schedule_archive_type_date GLOBAL "
+                "ON (type, date) COVER (user_id, start_time, end_time, status);",
             ]
             
             for i, index_query in enumerate(indexes):
@@ -259,6 +379,74 @@ def create_indexes(pool):
         return False
 
 
+def apply_migrations(pool):
+    """
+    Добавить колонки, появившиеся после первоначальной схемы
+    
+    Args:
+        pool: Пул соединений YDB
+        
+    Returns:
+        bool: True если успешно
+    """
+    
+    def execute(session):
+        try:
+            migrations = [
+                # Счетчики заданий, которые ведет update_task_status
+                "ALTER TABLE Users ADD COLUMN active_tasks_count Int32;",
+                "ALTER TABLE Users ADD COLUMN rated_count Int32;",
+                # Стеллажи пересчета отдельной колонкой
+                "ALTER TABLE Tasks ADD COLUMN shelves String;",
+                # Дедупликация фото-подтверждений по file_unique_id
+                "ALTER TABLE Tasks ADD COLUMN photo_unique_id String;",
+                # Просрочки: конец слота, признак и счетчик у исполнителя
+                "ALTER TABLE Tasks ADD COLUMN due_at String;",
+                "ALTER TABLE Tasks ADD COLUMN is_overdue Bool;",
+                "ALTER TABLE Users ADD COLUMN delays_count Int32;",
+                # Эмодзи типа задания для справочника (необязательно)
+                "ALTER TABLE TaskTypes ADD COLUMN emoji String;",
+                # Счетчик непрочитанных уведомлений для меню
+                "ALTER TABLE Users ADD COLUMN unread_notifications Int32;",
+                # Одноколоночные индексы заменены составными с тем же
+                # префиксом (idx_tasks_assigned_status_*, idx_tasks_status_*,
+                # idx_tasks_type_*) - не платим за их обновление при записи
+                "ALTER TABLE Tasks DROP INDEX idx_tasks_assigned_to;",
+                "ALTER TABLE Tasks DROP INDEX idx_tasks_status;",
+                "ALTER TABLE Tasks DROP INDEX idx_tasks_type;",
+                # Уведомления пользователя читаются через idx_notifications_user_created
+                "ALTER TABLE Notifications DROP INDEX idx_notifications_user_id;",
+                # Отчеты по статусам читают префикс idx_tasks_status_completed,
+                # а по всем типам сразу индекс (type, status) не сужает чтение
+                "ALTER TABLE Tasks DROP INDEX idx_tasks_type_status;",
+            ]
+            
+            for i, migration_query in enumerate(migrations):
+                try:
+                    session.execute_scheme(migration_query)
+                    print(f"✅ Миграция {i+1}/{len(migrations)} применена")
+                except Exception as e:
+                    error = str(e).lower()
+                    # Повторный запуск: колонка уже есть / индекс уже удален
+                    if any(marker in error for marker in (
+                        "already exists", "duplicate", "not found", "does not exist"
+                    )):
+                        print(f"⚠️  Миграция {i+1}/{len(migrations)} уже применена")
+                    else:
+                        print(f"❌ Ошибка миграции {i+1}: {e}")
+            
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка применения миграций: {e}")
+            return False
+    
+    try:
+        return pool.retry_operation_sync(execute)
+    except Exception as e:
+        print(f"❌ Ошибка применения миграций: {e}")
+        return False
+
+
 def insert_test_data(pool):
     """
     Вставить тестовые данные в базу
@@ -402,6 +590,13 @@ def main():
             print("❌ Ошибка при создании таблиц")
             return
         
+        # Применяем миграции схемы
+        print("\n🧩 Применение миграций...")
+        if apply_migrations(pool):
+            print("✅ Миграции применены")
+        else:
+            print("⚠️  Ошибка при применении миграций, продолжаем...")
+        
         # Создаем индексы
         print("\n🔍 Создание индексов...")
         if create_indexes(pool):
@@ -420,10 +615,7 @@ def main():
         print("\n📝 Тестовые пользователи:")
         test_users_info = [
             "- director (telegram_id: 123456789) - ДС",
-        print("- assistant_director (telegram_id: 987654321) - ЗДС")
-        print("- warehouse_worker1 (telegram_id: 111111111) - Кладовщик")
-        print("- warehouse_worker2 (telegram_id: 222222222) - Кладовщик")
-        print("- warehouse_worker3 (telegram_id: 333333333) - Кладовщик")
+            "- assistant_director (telegram_id: 987654321) - ЗДС",
             "- warehouse_worker1 (telegram_id: 111111111) - Кладовщик",
             "- warehouse_worker2 (telegram_id: 222222222) - Кладовщик",
             "- warehouse_worker3 (telegram_id: 333333333) - Кладовщик"